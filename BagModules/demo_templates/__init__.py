@@ -1 +1,6 @@
+# -*- coding: utf-8 -*-
 
+from BagModules.lazy_library import make_lazy_library
+
+# cell modules are only imported when their design class is requested.
+__getattr__, __dir__ = make_lazy_library(__name__)
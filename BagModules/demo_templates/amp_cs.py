@@ -1,12 +1,11 @@
 # -*- coding: utf-8 -*-
 
-import os
-import pkg_resources
+import importlib.resources
 
 from bag.design import Module
 
 
-yaml_file = pkg_resources.resource_filename(__name__, os.path.join('netlist_info', 'amp_cs.yaml'))
+yaml_file = str(importlib.resources.files(__package__) / 'netlist_info' / 'amp_cs.yaml')
 
 
 # noinspection PyPep8Naming
@@ -27,13 +27,12 @@ from __future__ import (absolute_import, division,
 # noinspection PyUnresolvedReferences,PyCompatibility
 from builtins import *
 
-import os
-import pkg_resources
+import importlib.resources
 
 from bag.design import Module
 
 
-yaml_file = pkg_resources.resource_filename(__name__, os.path.join('netlist_info', 'gm_tb_tran.yaml'))
+yaml_file = str(importlib.resources.files(__package__) / 'netlist_info' / 'gm_tb_tran.yaml')
 
 
 # noinspection PyPep8Naming
@@ -28,12 +28,12 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 import os
-import pkg_resources
+import importlib.resources
 
 from bag.design import Module
 
 
-yaml_file = pkg_resources.resource_filename(__name__, os.path.join('netlist_info', 'stimuli_pwl.yaml'))
+yaml_file = str(importlib.resources.files(__package__) / 'netlist_info' / 'stimuli_pwl.yaml')
 
 
 # noinspection PyPep8Naming
@@ -28,12 +28,57 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 import os
-import pkg_resources
+import re
+import importlib.resources
 
 from bag.design import Module
 
 
-yaml_file = pkg_resources.resource_filename(__name__, os.path.join('netlist_info', 'stimuli_pwl_pinmod.yaml'))
+yaml_file = str(importlib.resources.files(__package__) / 'netlist_info' / 'stimuli_pwl_pinmod.yaml')
+
+_bus_re = re.compile(r'^(?P<name>[^<>]+)<(?P<start>\d+)(:(?P<stop>\d+))?>$')
+
+
+def _expand_bus(sig):
+    """Expand a signal name in bus notation, e.g. data<3:0>, to a list of bit names."""
+    match = _bus_re.match(sig)
+    if match is None:
+        return [sig]
+    name = match.group('name')
+    start = int(match.group('start'))
+    stop = match.group('stop')
+    stop = start if stop is None else int(stop)
+    step = 1 if stop >= start else -1
+    return ['%s<%d>' % (name, idx) for idx in range(start, stop + step, step)]
+
+
+def _to_net_expr(bit_list):
+    """Returns a net expression for the given bits, merging consecutive indices into ranges."""
+    # list of [name, start, stop] ranges; start is None for scalar nets.
+    range_list = []
+    for bit in bit_list:
+        match = _bus_re.match(bit)
+        if match is None:
+            range_list.append([bit, None, None])
+            continue
+        name, idx = match.group('name'), int(match.group('start'))
+        if range_list:
+            cur = range_list[-1]
+            if cur[0] == name and cur[1] is not None:
+                step = cur[2] - cur[1]
+                if (step == 0 and abs(idx - cur[2]) == 1) or (step != 0 and idx - cur[2] == step // abs(step)):
+                    cur[2] = idx
+                    continue
+        range_list.append([name, idx, idx])
+    return ','.join(_range_expr(name, start, stop) for name, start, stop in range_list)
+
+
+def _range_expr(name, start, stop):
+    if start is None:
+        return name
+    if start == stop:
+        return '%s<%d>' % (name, start)
+    return '%s<%d:%d>' % (name, start, stop)
 
 
 # noinspection PyPep8Naming
@@ -46,7 +91,7 @@ class demo_testbenches__stimuli_pwl_pinmod(Module):
     def __init__(self, bag_config, parent=None, prj=None, **kwargs):
         Module.__init__(self, bag_config, yaml_file, parent=parent, prj=prj, **kwargs)
 
-    def design(self, fname_list=(), sig_list=()):
+    def design(self, fname_list=(), sig_list=(), bus_mode=False):
         """To be overridden by subclasses to design this module.
 
         This method should fill in values for all parameters in
@@ -61,15 +106,40 @@ class demo_testbenches__stimuli_pwl_pinmod(Module):
         reconnect_instance_terminal()
         restore_instance()
         array_instance()
+
+        Parameters
+        ----------
+        fname_list : list[str]
+            PWL file name of each signal bit.
+        sig_list : list[str]
+            signal names.  In bus mode, entries may use bus notation, e.g. data<0:1023>,
+            and fname_list has one entry per bit in the order the buses are written.
+        bus_mode : bool
+            True to create one bus pin per sig_list entry and one iterated source
+            instance per distinct PWL file, instead of one pin and instance per bit.
         """
         if not fname_list or not sig_list:
             raise ValueError('empty sig_list or fname_list')
-        if len(fname_list) != len(sig_list):
+
+        if bus_mode:
+            bit_list = [bit for sig in sig_list for bit in _expand_bus(sig)]
+        else:
+            bit_list = sig_list
+        if len(fname_list) != len(bit_list):
             raise ValueError('sig_list and fname_list length mismatch')
 
+        # check each distinct file only once, without listing its directory
+        for fname in dict.fromkeys(os.path.abspath(fname) for fname in fname_list):
+            if not os.path.isfile(fname):
+                raise ValueError('PWL source file name %s is not a file.' % fname)
+
         # remove a pin
         self.remove_pin('in')
 
+        if bus_mode:
+            self._design_bus(fname_list, sig_list, bit_list)
+            return
+
         name_list = []
         term_list = []
         for sig in sig_list:
@@ -80,9 +150,30 @@ class demo_testbenches__stimuli_pwl_pinmod(Module):
 
         self.array_instance('VPWL', name_list, term_list=term_list)
         for inst, fname in zip(self.instances['VPWL'], fname_list):
-            fname = os.path.abspath(fname)
-            if not os.path.isfile(fname):
-                raise ValueError('PWL source file name %s is not a file.' % fname)
+            inst.parameters['fileName'] = os.path.abspath(fname)
+
+    def _design_bus(self, fname_list, sig_list, bit_list):
+        """Create bus pins, and one iterated PWL source per distinct file."""
+        for sig in sig_list:
+            self.add_pin(sig, 'output')
+
+        # group bits driven by the same file.  Stimulus files named by content
+        # hash make identical waveforms share a single source instance.
+        file_bits = {}
+        for bit, fname in zip(bit_list, fname_list):
+            file_bits.setdefault(os.path.abspath(fname), []).append(bit)
+
+        name_list = []
+        term_list = []
+        for idx, bits in enumerate(file_bits.values()):
+            if len(bits) == 1:
+                name_list.append('VPWL%d' % idx)
+            else:
+                name_list.append('VPWL%d<%d:0>' % (idx, len(bits) - 1))
+            term_list.append(dict(PLUS=_to_net_expr(bits)))
+
+        self.array_instance('VPWL', name_list, term_list=term_list)
+        for inst, fname in zip(self.instances['VPWL'], file_bits.keys()):
             inst.parameters['fileName'] = fname
 
     def get_layout_params(self, **kwargs):
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Lazy registry of BagModules design libraries.
+
+Design library packages use :func:`make_lazy_library` so that importing a
+library does not import any of its cell modules.  A cell module is imported,
+and its netlist_info file resolved, only when its design class is requested.
+
+This module lives next to the design libraries and only uses the standard
+library, so the libraries do not depend on any generator package.
+"""
+
+import importlib
+import importlib.resources
+
+# (lib_name, cell_name) -> design module class
+_class_table = {}
+
+
+def get_netlist_info_path(lib_name, cell_name):
+    """Returns the netlist_info YAML file of the given cell, without importing the cell module."""
+    lib_files = importlib.resources.files('BagModules.%s' % lib_name)
+    return str(lib_files / 'netlist_info' / ('%s.yaml' % cell_name))
+
+
+def list_cells(lib_name):
+    """Returns the names of all cells in the given design library, without importing them."""
+    info_dir = importlib.resources.files('BagModules.%s' % lib_name) / 'netlist_info'
+    return sorted(entry.name[:-5] for entry in info_dir.iterdir() if entry.name.endswith('.yaml'))
+
+
+def get_design_class(lib_name, cell_name):
+    """Import the given cell module if needed, and return its design module class."""
+    key = (lib_name, cell_name)
+    dsn_cls = _class_table.get(key, None)
+    if dsn_cls is None:
+        module = importlib.import_module('BagModules.%s.%s' % key)
+        dsn_cls = _class_table[key] = getattr(module, '%s__%s' % key)
+    return dsn_cls
+
+
+def make_lazy_library(package):
+    """Returns module-level __getattr__ and __dir__ functions for a design library package.
+
+    Accessing the attribute <lib_name>__<cell_name> of the package imports the cell
+    module and returns its design module class.
+
+    Parameters
+    ----------
+    package : str
+        the design library package name, e.g. BagModules.demo_templates.
+
+    Returns
+    -------
+    getattr_fun : callable
+        the module __getattr__ function.
+    dir_fun : callable
+        the module __dir__ function.
+    """
+    lib_name = package.rsplit('.', 1)[-1]
+    prefix = '%s__' % lib_name
+
+    def getattr_fun(name):
+        if name.startswith(prefix):
+            module_name = '%s.%s' % (package, name[len(prefix):])
+            try:
+                return get_design_class(lib_name, name[len(prefix):])
+            except ModuleNotFoundError as ex:
+                # only a missing cell module means there is no such attribute; errors
+                # raised while importing an existing cell module are propagated.
+                if ex.name != module_name:
+                    raise
+        raise AttributeError('module %r has no attribute %r' % (package, name))
+
+    def dir_fun():
+        return [prefix + cell_name for cell_name in list_cells(lib_name)]
+
+    return getattr_fun, dir_fun
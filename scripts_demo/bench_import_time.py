@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Import-time benchmark for xbase_demo.core.
+
+Imports the module in fresh interpreters and fails if the median import time
+exceeds the budget, or if any plotting/fitting package is loaded at import.
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+
+# packages that must only be imported by the functions that use them.
+deferred_modules = ('matplotlib', 'matplotlib.pyplot', 'scipy.interpolate', 'scipy.optimize')
+
+_child_code = '''
+import sys, json, time
+t0 = time.perf_counter()
+import %s
+dt = time.perf_counter() - t0
+print(json.dumps(dict(time=dt, loaded=[name for name in %r if name in sys.modules])))
+'''
+
+
+def measure_import(module_name, num_runs):
+    code = _child_code % (module_name, deferred_modules)
+    time_list = []
+    loaded = set()
+    for _ in range(num_runs):
+        out = subprocess.check_output([sys.executable, '-c', code])
+        info = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+        time_list.append(info['time'])
+        loaded.update(info['loaded'])
+
+    time_list.sort()
+    return time_list[len(time_list) // 2], sorted(loaded)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='xbase_demo.core import-time benchmark.')
+    parser.add_argument('--module', default='xbase_demo.core', help='module to import.')
+    parser.add_argument('--budget', type=float, default=1.0, help='import time budget, in seconds.')
+    parser.add_argument('--runs', type=int, default=5, help='number of fresh interpreters to time.')
+    args = parser.parse_args()
+
+    med_time, loaded_list = measure_import(args.module, args.runs)
+    print('import %s: median %.1f ms over %d runs (budget %.1f ms)' %
+          (args.module, med_time * 1e3, args.runs, args.budget * 1e3))
+
+    failed = False
+    if loaded_list:
+        print('FAIL: deferred modules loaded at import: %s' % ', '.join(loaded_list))
+        failed = True
+    if med_time > args.budget:
+        print('FAIL: import time exceeds budget')
+        failed = True
+
+    sys.exit(1 if failed else 0)
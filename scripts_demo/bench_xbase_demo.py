@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""End-to-end benchmarks of xbase_demo with offline stand-ins.
+
+Runs the design script, the simulation post-processing functions, and the
+flow orchestration against synthetic transistor databases and the fake
+BagProject/testbench of xbase_demo.offline, so neither BAG, a PDK, nor a
+simulator is needed.
+
+Every benchmark runs at each corner count and sample size, and reports
+latency percentiles, throughput in work units per second, and peak traced
+memory.  Results can be saved as a baseline, and later runs fail if the
+median latency or the peak memory grows beyond the tolerance.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import functools
+import platform
+import tempfile
+import threading
+import contextlib
+import tracemalloc
+
+import numpy as np
+
+from xbase_demo.sim_data import split_data_by_sweep, process_tb_dc, process_tb_ac, process_tb_tran
+from xbase_demo.demo_dsn.core import design_amp_cs, change_x_to_ibias, change_x_to_ibias_mirror, get_xmat_vgs
+from xbase_demo.jobqueue import JobQueue, run_worker, simulate_queued
+from xbase_demo.flow import make_flow_graph
+from xbase_demo.offline import (SyntheticMOSDB, FakeBagProject, make_fake_results, fake_testbench_handler,
+                                load_sim_hdf5, save_sim_hdf5)
+from xbase_demo.specs import compile_specs
+
+# values of the outer sweep of the synthetic testbench results
+num_outer_sweep = 4
+
+
+def get_env_list(num_corners):
+    return ['corner%d' % idx for idx in range(num_corners)]
+
+
+def get_mos_dbs(num_corners):
+    env_list = get_env_list(num_corners)
+    return SyntheticMOSDB('nch', env_list), SyntheticMOSDB('pch', env_list)
+
+
+def get_sim_results(cell_name, num_corners, num_samples):
+    return make_fake_results(cell_name, get_env_list(num_corners),
+                             sweeps=dict(vbias=np.linspace(0.1, 0.4, num_outer_sweep)), num_points=num_samples)
+
+
+def bench_design_amp_cs(num_corners, num_samples, tmp_dir):
+    nch_db, pch_db = get_mos_dbs(num_corners)
+
+    def run():
+        design_amp_cs(nch_db, pch_db, 1.0, 0.5, 20e-15, 1e9, 3.0, num_ib_samp=num_samples)
+
+    # nmos/pmos bias current grid points per intent pair and corner
+    return run, num_corners * num_samples ** 2, 'points'
+
+
+def bench_change_x_to_ibias(num_corners, num_samples, tmp_dir):
+    nch_db, _ = get_mos_dbs(num_corners)
+    xmat = get_xmat_vgs(nch_db, 2e-3, 0, 0.5)
+
+    def run():
+        change_x_to_ibias(nch_db, xmat, num_samp=num_samples)
+
+    return run, num_corners * num_samples, 'points'
+
+
+def bench_change_x_to_ibias_mirror(num_corners, num_samples, tmp_dir):
+    _, pch_db = get_mos_dbs(num_corners)
+
+    def run():
+        change_x_to_ibias_mirror(pch_db, 2e-3, 0, -0.5, num_ib_samp=num_samples)
+
+    return run, num_corners * num_samples, 'points'
+
+
+def bench_split_data_by_sweep(num_corners, num_samples, tmp_dir):
+    results = get_sim_results('amp_tb_dc', num_corners, num_samples)
+
+    def run():
+        split_data_by_sweep(results, ['vin', 'vout'])
+
+    return run, num_corners * num_outer_sweep, 'curves'
+
+
+def bench_process_tb_dc(num_corners, num_samples, tmp_dir):
+    results = get_sim_results('amp_tb_dc', num_corners, num_samples)
+
+    def run():
+        process_tb_dc(results, plot=False)
+
+    return run, num_corners * num_outer_sweep, 'curves'
+
+
+def bench_process_tb_ac(num_corners, num_samples, tmp_dir):
+    results = get_sim_results('amp_tb_ac_tran', num_corners, num_samples)
+
+    def run():
+        process_tb_ac(results, plot=False)
+
+    return run, num_corners * num_outer_sweep, 'curves'
+
+
+def bench_process_tb_tran(num_corners, num_samples, tmp_dir):
+    results = get_sim_results('amp_tb_ac_tran', num_corners, num_samples)
+
+    def run():
+        process_tb_tran(results, plot=False)
+
+    return run, num_corners * num_outer_sweep, 'curves'
+
+
+def get_flow_specs(num_corners, tmp_dir):
+    return compile_specs(dict(
+        sim_envs=get_env_list(num_corners),
+        view_name='schematic',
+        routing_grid=dict(layers=[4, 5, 6, 7], spaces=[0.1, 0.1, 0.2, 0.2], widths=[0.1, 0.1, 0.2, 0.2],
+                          bot_dir='x'),
+        amp_cs=dict(data_dir='data', impl_lib='DEMO_AMP_CS', sch_lib='demo_templates', sch_cell='amp_cs',
+                    gen_cell='AMP_CS', layout_package='xbase_demo.demo_layout.core', layout_class='AmpCS',
+                    layout_params={},
+                    testbenches=dict(
+                        tb_dc=dict(tb_lib='bag_testbenches_ec', tb_cell='amp_tb_dc', sch_params={},
+                                   tb_params=dict(vdd=1.0)),
+                        tb_ac_tran=dict(tb_lib='bag_testbenches_ec', tb_cell='amp_tb_ac_tran', sch_params={},
+                                        tb_params=dict(vdd=1.0)),
+                    )),
+    ), root_dir=tmp_dir)
+
+
+@contextlib.contextmanager
+def fake_workers(queue, handler, num_workers):
+    """Run job queue workers in threads until the with block exits."""
+    stop = threading.Event()
+
+    def worker():
+        while not stop.is_set():
+            if not run_worker(queue, handler, exit_when_idle=True):
+                time.sleep(0.002)
+
+    thread_list = [threading.Thread(target=worker) for _ in range(num_workers)]
+    for thread in thread_list:
+        thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        for thread in thread_list:
+            thread.join()
+
+
+def bench_flow_queue(num_corners, num_samples, tmp_dir, num_workers=4):
+    """simulate_queued() of two testbenches, sharded by corner, on fake simulator threads."""
+    specs = get_flow_specs(num_corners, tmp_dir)
+    queue = JobQueue(os.path.join(tmp_dir, 'queue.db'))
+    handler = fake_testbench_handler(FakeBagProject(os.path.join(tmp_dir, 'fake'), num_points=num_samples))
+    corners_per_shard = max(1, num_corners // num_workers)
+
+    def run():
+        with fake_workers(queue, handler, num_workers):
+            simulate_queued(queue, specs, 'amp_cs', poll_interval=0.002, corners_per_shard=corners_per_shard,
+                            load_fun=load_sim_hdf5, save_fun=save_sim_hdf5)
+
+    return run, 2 * num_corners, 'corner sims'
+
+
+def bench_flow_graph(num_corners, num_samples, tmp_dir, num_workers=4):
+    """make_flow_graph() of the AmpCS flow with a fake BagProject, run from the DUT schematic stage.
+
+    There is no PDK to draw the layout with, so the layout stage output is saved up front.
+    Simulations run on fake simulator threads through the job queue.
+    """
+    specs = get_flow_specs(num_corners, tmp_dir)
+    prj = FakeBagProject(os.path.join(tmp_dir, 'fake'), num_points=num_samples)
+    queue = JobQueue(os.path.join(tmp_dir, 'queue.db'))
+    handler = fake_testbench_handler(prj)
+
+    def simulate_fun(prj, specs, dsn_name):
+        with fake_workers(queue, handler, num_workers):
+            simulate_queued(queue, specs, dsn_name, poll_interval=0.002, load_fun=load_sim_hdf5,
+                            save_fun=save_sim_hdf5)
+
+    # LVS runs in its own process, with its own fake project.  The layout stage output is
+    # saved below, so no layout generator class is needed.
+    graph = make_flow_graph(prj, specs, 'amp_cs', None, state_dir=os.path.join(tmp_dir, 'flow'),
+                            max_workers=num_workers, plot=False, simulate_fun=simulate_fun,
+                            prj_factory=functools.partial(FakeBagProject, prj.root_dir), load_fun=load_sim_hdf5)
+    graph.save_output('layout', dict(lch=20e-9, w_dict=dict(load=4, amp=4),
+                                     intent_dict=dict(load='lvt', amp='lvt'), fg_dict=dict(load=4, amp=4),
+                                     dum_info=[]))
+    num_stages = len(graph.get_stale_stages(force=['dut_sch']))
+
+    def run():
+        graph.run(force=['dut_sch'])
+
+    return run, num_stages, 'stages'
+
+
+# name -> (benchmark function, True if the result depends on the sample size)
+benchmarks = dict(
+    design_amp_cs=(bench_design_amp_cs, True),
+    change_x_to_ibias=(bench_change_x_to_ibias, True),
+    change_x_to_ibias_mirror=(bench_change_x_to_ibias_mirror, True),
+    split_data_by_sweep=(bench_split_data_by_sweep, True),
+    process_tb_dc=(bench_process_tb_dc, True),
+    process_tb_ac=(bench_process_tb_ac, True),
+    process_tb_tran=(bench_process_tb_tran, True),
+    flow_queue=(bench_flow_queue, True),
+    flow_graph=(bench_flow_graph, True),
+)
+
+
+def measure(fun, repeat, warmup=1):
+    """Returns the run times of fun, and its peak traced memory in bytes in a separate run."""
+    for _ in range(warmup):
+        fun()
+    time_list = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fun()
+        time_list.append(time.perf_counter() - t0)
+
+    # tracemalloc slows down allocations, so measure memory in its own run
+    tracemalloc.start()
+    try:
+        fun()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return time_list, peak
+
+
+def run_benchmarks(name_list, corner_list, sample_list, repeat):
+    results = {}
+    with open(os.devnull, 'w') as devnull:
+        for name in name_list:
+            bench_fun, use_samples = benchmarks[name]
+            for num_corners in corner_list:
+                for num_samples in (sample_list if use_samples else sample_list[:1]):
+                    key = '%s/c%d' % (name, num_corners)
+                    if use_samples:
+                        key += '/s%d' % num_samples
+                    tmp_dir = tempfile.mkdtemp(prefix='bench_xbase_demo_')
+                    try:
+                        # the flow functions print progress, which is not part of the benchmark
+                        with contextlib.redirect_stdout(devnull):
+                            fun, work, unit = bench_fun(num_corners, num_samples, tmp_dir)
+                            time_list, peak = measure(fun, repeat)
+                    finally:
+                        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+                    p50, p95 = np.percentile(time_list, [50, 95])
+                    results[key] = dict(p50=p50, p95=p95, throughput=work / p50, unit=unit, peak=peak)
+                    print('%-40s p50=%9.3fms p95=%9.3fms %12.4g %s/s peak=%8.2fMiB' %
+                          (key, p50 * 1e3, p95 * 1e3, work / p50, unit, peak / 2 ** 20))
+    return results
+
+
+def compare(results, baseline, time_tol, mem_tol):
+    """Print the change against the baseline.  Returns the list of regressed benchmarks."""
+    regressed = []
+    print('%-40s %10s %10s' % ('benchmark', 'p50', 'peak'))
+    for key, val in results.items():
+        base = baseline.get(key, None)
+        if base is None:
+            print('%-40s %10s %10s' % (key, 'new', 'new'))
+            continue
+        time_ratio = val['p50'] / base['p50']
+        mem_ratio = val['peak'] / base['peak'] if base['peak'] else 1.0
+        flags = []
+        if time_ratio > 1 + time_tol:
+            flags.append('SLOWER')
+        if mem_ratio > 1 + mem_tol:
+            flags.append('MORE MEMORY')
+        if flags:
+            regressed.append(key)
+        print('%-40s %9.2fx %9.2fx %s' % (key, time_ratio, mem_ratio, ' '.join(flags)))
+    return regressed
+
+
+def get_machine_info():
+    return dict(python=platform.python_version(), numpy=np.__version__, machine=platform.machine(),
+                processor=platform.processor(), cpu_count=os.cpu_count())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='xbase_demo end-to-end benchmarks with offline stand-ins.')
+    parser.add_argument('-k', '--bench', action='append', choices=sorted(benchmarks.keys()),
+                        help='benchmark to run.  May be given multiple times.  Defaults to all benchmarks.')
+    parser.add_argument('--corners', default='1,5,30', help='comma separated corner counts.')
+    parser.add_argument('--samples', default='50,200', help='comma separated sample sizes.')
+    parser.add_argument('--repeat', type=int, default=10, help='number of timed runs of each benchmark.')
+    parser.add_argument('--baseline', default='bench_xbase_demo_baseline.json', help='the baseline file.')
+    parser.add_argument('--save-baseline', action='store_true', help='save results as the new baseline.')
+    parser.add_argument('--time-tol', type=float, default=0.25,
+                        help='allowed relative increase of the median latency.')
+    parser.add_argument('--mem-tol', type=float, default=0.10,
+                        help='allowed relative increase of the peak memory.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    name_list = args.bench or list(benchmarks.keys())
+    corner_list = [int(val) for val in args.corners.split(',')]
+    sample_list = [int(val) for val in args.samples.split(',')]
+
+    bench_results = run_benchmarks(name_list, corner_list, sample_list, args.repeat)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(dict(machine=get_machine_info(), results=bench_results), f, indent=2, sort_keys=True)
+        print('baseline saved to %s' % args.baseline)
+        sys.exit(0)
+
+    if not os.path.isfile(args.baseline):
+        print('no baseline at %s, run with --save-baseline to create one' % args.baseline)
+        sys.exit(0)
+
+    with open(args.baseline, 'r') as f:
+        baseline_info = json.load(f)
+    if baseline_info['machine'] != get_machine_info():
+        print('warning: baseline was recorded on a different machine or environment')
+    regressed_list = compare(bench_results, baseline_info['results'], args.time_tol, args.mem_tol)
+    if regressed_list:
+        print('FAIL: %d benchmarks regressed' % len(regressed_list))
+        sys.exit(1)
+    print('no regressions')
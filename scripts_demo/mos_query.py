@@ -9,7 +9,7 @@ from mpl_toolkits.mplot3d import Axes3D
 from matplotlib import cm
 from matplotlib import ticker
 
-from ckt_dsn_ec.mos.core import MOSDBDiscrete
+from xbase_demo.demo_dsn.mos_db import get_mos_db, eval_grid
 
 
 def query(vds, vgs, env_list=None, intent='lvt', vbs=0.0):
@@ -23,10 +23,10 @@ def query(vds, vgs, env_list=None, intent='lvt', vbs=0.0):
     if env_list is None:
         env_list = ['tt']
 
-    # initialize transistor database from simulation data
-    nch_db = MOSDBDiscrete(w_list, spec_list, w_res,
-                           method=interp_method,
-                           cfit_method=cfit_method)
+    # get transistor database, only created from simulation data on first use
+    nch_db = get_mos_db(w_list, spec_list, w_res,
+                        method=interp_method,
+                        cfit_method=cfit_method)
     # set process corners
     nch_db.env_list = env_list
     # set layout parameters
@@ -36,7 +36,7 @@ def query(vds, vgs, env_list=None, intent='lvt', vbs=0.0):
 
 
 def plot_data(name='ibias', vbs=0.0, intent='lvt', env_list=None,
-              bounds=None, unit_val=None, unit_label=None):
+              bounds=None, unit_val=None, unit_label=None, nvds=41, nvgs=81):
     """Get interpolation function and plot/query."""
     w_list = [4]
     w_res = 1
@@ -47,13 +47,10 @@ def plot_data(name='ibias', vbs=0.0, intent='lvt', env_list=None,
     if env_list is None:
         env_list = ['tt', 'ff_hot', 'ss_cold']
 
-    nvds = 41
-    nvgs = 81
-
-    print('create transistor database')
-    nch_db = MOSDBDiscrete(w_list, spec_list, w_res,
-                           method=interp_method,
-                           cfit_method=cfit_method)
+    print('get transistor database')
+    nch_db = get_mos_db(w_list, spec_list, w_res,
+                        method=interp_method,
+                        cfit_method=cfit_method)
     nch_db.env_list = env_list
     nch_db.set_dsn_params(w=w_list[0], intent=intent)
 
@@ -74,16 +71,12 @@ def plot_data(name='ibias', vbs=0.0, intent='lvt', env_list=None,
             if v1 is not None:
                 vds_max = min(vds_max, v1)
 
-    vbs_vec = [vbs]
     vds_vec = np.linspace(vds_min, vds_max, nvds, endpoint=True)
     vgs_vec = np.linspace(vgs_min, vgs_max, nvgs, endpoint=True)
-    vbs_mat, vds_mat, vgs_mat = np.meshgrid(vbs_vec, vds_vec, vgs_vec, indexing='ij', copy=False)
-    arg = np.stack((vbs_mat, vds_mat, vgs_mat), axis=-1)
-    ans = f(arg)
-
-    vds_mat = vds_mat.reshape((nvds, nvgs))
-    vgs_mat = vgs_mat.reshape((nvds, nvgs))
-    ans = ans.reshape((nvds, nvgs, len(env_list)))
+    # evaluate in tiles, and use broadcast views instead of mesh arrays for plotting
+    ans = eval_grid(nch_db, name, vbs, vds_vec, vgs_vec)
+    vds_mat = np.broadcast_to(vds_vec.reshape(nvds, 1), (nvds, nvgs))
+    vgs_mat = np.broadcast_to(vgs_vec.reshape(1, nvgs), (nvds, nvgs))
 
     formatter = ticker.ScalarFormatter(useMathText=True)
     formatter.set_scientific(True)
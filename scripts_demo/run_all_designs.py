@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+
+from xbase_demo.specs import load_specs, compile_specs
+from xbase_demo.sweep import expand_all_sweeps
+from xbase_demo.runner import run_designs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the flow of all designs in a specification file.')
+    parser.add_argument('specs', nargs='?', default='specs_demo/demo.yaml',
+                        help='the specification file.')
+    parser.add_argument('-d', '--design', action='append', dest='dsn_names',
+                        help='design to run.  May be given multiple times.  Defaults to all designs.')
+    parser.add_argument('-j', '--workers', type=int, default=4,
+                        help='number of worker processes, each with its own BagProject.')
+    parser.add_argument('--max-layouts', type=int, default=None, help='maximum number of layouts generated at once.')
+    parser.add_argument('--max-sims', type=int, default=None,
+                        help='maximum number of designs simulating at once, e.g. the number of simulator licenses.')
+    parser.add_argument('--no-lvs', action='store_true', help='skip LVS.')
+    parser.add_argument('-o', '--report', default=None, help='write the report to this JSON file.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    # expand parameter sweeps and validate all designs before starting the workers
+    top_specs, _ = expand_all_sweeps(load_specs(args.specs))
+    top_specs = compile_specs(top_specs)
+
+    report = run_designs(top_specs, dsn_names=args.dsn_names, max_workers=args.workers,
+                         max_layouts=args.max_layouts, max_sims=args.max_sims, run_lvs=not args.no_lvs,
+                         report_fname=args.report)
+    if report['num_failed']:
+        raise SystemExit(1)
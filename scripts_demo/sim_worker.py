@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+
+from xbase_demo.jobqueue import JobQueue, run_worker
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run simulation jobs from a job queue.')
+    parser.add_argument('queue', help='the job queue database file.')
+    parser.add_argument('--fake', metavar='ROOT_DIR', default=None,
+                        help='use the fake simulator, with a local database in ROOT_DIR.')
+    parser.add_argument('--sim-time', type=float, default=0.0, help='fake simulation time, in seconds.')
+    parser.add_argument('--max-jobs', type=int, default=None, help='stop after running this many jobs.')
+    parser.add_argument('--exit-when-idle', action='store_true', help='stop when no job is pending.')
+    parser.add_argument('--poll', type=float, default=1.0, help='seconds between checks for new jobs.')
+    parser.add_argument('--no-wal', action='store_true',
+                        help='do not use write-ahead logging.  Required if the queue is on a network file system.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    queue = JobQueue(args.queue, wal=not args.no_wal)
+
+    if args.fake is not None:
+        from xbase_demo.offline import FakeBagProject, fake_testbench_handler
+
+        handler = fake_testbench_handler(FakeBagProject(args.fake, sim_time=args.sim_time))
+    else:
+        from bag import BagProject
+        from xbase_demo.jobqueue import bag_testbench_handler
+
+        handler = bag_testbench_handler(BagProject())
+
+    num_jobs = run_worker(queue, handler, kinds=['testbench'], poll_interval=args.poll, max_jobs=args.max_jobs,
+                          exit_when_idle=args.exit_when_idle)
+    print('worker done, %d jobs run' % num_jobs)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import os
+import functools
+
+from xbase_demo.flow import make_flow_graph
+from xbase_demo.jobqueue import make_testbench_jobs
+from xbase_demo.offline import FakeBagProject, fake_testbench_handler, load_sim_hdf5
+from xbase_demo.specs import compile_specs
+
+sim_envs = ['tt', 'ff']
+
+
+def _make_specs(root_dir, tb_sweeps=None):
+    return compile_specs(dict(
+        sim_envs=sim_envs,
+        view_name='schematic',
+        routing_grid=dict(layers=[4, 5], spaces=[0.1, 0.1], widths=[0.1, 0.1], bot_dir='x'),
+        amp_cs=dict(data_dir='data', impl_lib='DEMO_AMP_CS', sch_lib='demo_templates', sch_cell='amp_cs',
+                    gen_cell='AMP_CS', layout_package='xbase_demo.demo_layout.core', layout_class='AmpCS',
+                    layout_params={},
+                    testbenches=dict(
+                        tb_dc=dict(tb_lib='bag_testbenches_ec', tb_cell='amp_tb_dc', sch_params={},
+                                   tb_params=dict(vdd=1.0), tb_sweeps=tb_sweeps),
+                        tb_ac_tran=dict(tb_lib='bag_testbenches_ec', tb_cell='amp_tb_ac_tran', sch_params={},
+                                        tb_params=dict(vdd=1.0)),
+                    )),
+    ), root_dir=root_dir)
+
+
+def _make_graph(prj, specs, state_dir):
+    handler = fake_testbench_handler(prj)
+
+    def simulate_fun(prj, specs, dsn_name):
+        for config in make_testbench_jobs(specs, dsn_name):
+            os.makedirs(os.path.dirname(config['data_fname']), exist_ok=True)
+            handler(config)
+
+    # there is no PDK, so the layout stage output is saved instead of computed
+    graph = make_flow_graph(prj, specs, 'amp_cs', None, state_dir=state_dir, plot=False,
+                            simulate_fun=simulate_fun, prj_factory=functools.partial(FakeBagProject, prj.root_dir),
+                            load_fun=load_sim_hdf5)
+    graph.save_output('layout', dict(lch=20e-9, w_dict=dict(load=4, amp=4), intent_dict=dict(load='lvt', amp='lvt'),
+                                     fg_dict=dict(load=4, amp=4), dum_info=[]))
+    return graph
+
+
+def test_offline_flow(tmp_path):
+    root_dir = str(tmp_path)
+    state_dir = os.path.join(root_dir, 'flow')
+    prj = FakeBagProject(os.path.join(root_dir, 'fake'), num_points=11)
+    graph = _make_graph(prj, _make_specs(root_dir), state_dir)
+    assert graph.get_stale_stages() == ['dut_sch', 'lvs', 'tb_sch', 'simulate', 'load', 'plot']
+
+    outputs = graph.run()
+    assert prj.get_cell('DEMO_AMP_CS', 'AMP_CS') is not None
+    # LVS ran in its own process, with its own project on the same database
+    assert os.path.isfile(os.path.join(prj.root_dir, 'DEMO_AMP_CS', 'AMP_CS.lvs.log'))
+    assert sorted(outputs['load'].keys()) == ['tb_ac_tran', 'tb_dc']
+    assert list(outputs['load']['tb_dc']['corner']) == sim_envs
+
+    # only uncached stages run again, until the testbench sweeps change
+    graph = _make_graph(prj, _make_specs(root_dir), state_dir)
+    assert graph.get_stale_stages() == ['load', 'plot']
+    graph = _make_graph(prj, _make_specs(root_dir, tb_sweeps=dict(vbias=[0.1, 0.2])), state_dir)
+    assert graph.get_stale_stages() == ['simulate', 'load', 'plot']
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from xbase_demo.jobqueue import JobQueue, run_worker, PENDING, RUNNING, DONE, FAILED
+from xbase_demo.offline import FakeBagProject, fake_testbench_handler, make_fake_results, load_sim_hdf5
+
+
+def _make_config(data_dir, idx=0):
+    return dict(impl_lib='DEMO_AMP_CS', gen_cell='AMP_CS', tb_name='tb_dc', tb_gen_cell='AMP_CS_tb_dc',
+                tb_params=dict(vdd=1.0), tb_sweeps=None, view_name='schematic', sim_envs=['tt', 'ff'],
+                data_fname=os.path.join(data_dir, 'AMP_CS_tb_dc_%d.hdf5' % idx))
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'queue.db'), max_retries=1)
+
+
+def test_run_job(tmp_path, queue):
+    handler = fake_testbench_handler(FakeBagProject(str(tmp_path / 'fake'), num_points=11))
+    config = _make_config(str(tmp_path))
+    job_id = queue.submit(config)
+    assert run_worker(queue, handler, exit_when_idle=True) == 1
+
+    job = queue.get_job(job_id)
+    assert job.status == DONE
+    assert job.attempts == 1
+    assert job.result == dict(data_fname=config['data_fname'])
+    results = load_sim_hdf5(config['data_fname'])
+    expected = make_fake_results('AMP_CS_tb_dc', ['tt', 'ff'], num_points=11)
+    np.testing.assert_allclose(results['vout'], expected['vout'])
+
+
+def test_retry_until_limit(tmp_path, queue):
+    # every simulation fails, so the job runs once plus max_retries times
+    prj = FakeBagProject(str(tmp_path / 'fake'), num_points=11, num_failures=10)
+    job_id = queue.submit(_make_config(str(tmp_path)))
+    assert run_worker(queue, fake_testbench_handler(prj), exit_when_idle=True) == 2
+
+    job = queue.get_job(job_id)
+    assert job.status == FAILED
+    assert job.attempts == 2
+    assert 'simulation of AMP_CS_tb_dc failed' in job.error
+    assert prj.num_sims == 2
+
+
+def test_retry_succeeds(tmp_path, queue):
+    prj = FakeBagProject(str(tmp_path / 'fake'), num_points=11, num_failures=1)
+    job_id = queue.submit(_make_config(str(tmp_path)))
+    run_worker(queue, fake_testbench_handler(prj), exit_when_idle=True)
+
+    job = queue.get_job(job_id)
+    assert job.status == DONE
+    assert job.attempts == 2
+
+
+def test_expired_lease_reclaimed(tmp_path):
+    queue = JobQueue(str(tmp_path / 'queue.db'), lease_time=0.05)
+    job_id = queue.submit(_make_config(str(tmp_path)))
+
+    # the first worker claims the job, then dies without renewing the lease
+    job = queue.claim('worker0')
+    assert job.id == job_id
+    assert queue.claim('worker1') is None
+    time.sleep(0.1)
+
+    job = queue.claim('worker1')
+    assert job.id == job_id
+    assert job.attempts == 2
+    assert job.worker == 'worker1'
+    # the lost worker can no longer report a result
+    assert not queue.complete(job_id, 'worker0', dict(data_fname='foo'))
+    assert queue.complete(job_id, 'worker1', dict(data_fname='bar'))
+    assert queue.get_job(job_id).result == dict(data_fname='bar')
+
+
+def test_timeout_fails_job(tmp_path, queue):
+    prj = FakeBagProject(str(tmp_path / 'fake'), num_points=11, sim_time=0.2)
+    job_id = queue.submit(_make_config(str(tmp_path)), max_retries=0, timeout=0.05)
+    run_worker(queue, fake_testbench_handler(prj), exit_when_idle=True)
+
+    job = queue.get_job(job_id)
+    assert job.status == FAILED
+    assert job.result is None
+    assert job.error.startswith('timed out')
+
+
+def test_progress(tmp_path, queue):
+    job_ids = queue.submit_many([_make_config(str(tmp_path), idx) for idx in range(4)])
+    assert queue.get_progress() == {PENDING: 4, RUNNING: 0, DONE: 0, FAILED: 0, 'total': 4}
+
+    job0 = queue.claim('worker0')
+    job1 = queue.claim('worker0')
+    queue.claim('worker0')
+    queue.complete(job0.id, 'worker0')
+    # job 1 is requeued, since it has a retry left
+    assert queue.fail(job1.id, 'worker0', 'error')
+    assert queue.get_progress() == {PENDING: 2, RUNNING: 1, DONE: 1, FAILED: 0, 'total': 4}
+    assert queue.get_progress(job_ids[:2]) == {PENDING: 1, RUNNING: 0, DONE: 1, FAILED: 0, 'total': 2}
+
+    # job 1 fails again after its retry
+    assert queue.claim('worker1').id == job1.id
+    queue.fail(job1.id, 'worker1', 'error')
+    assert queue.get_progress(job_ids[:2]) == {PENDING: 0, RUNNING: 0, DONE: 1, FAILED: 1, 'total': 2}
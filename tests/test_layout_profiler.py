@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from xbase_demo.demo_layout.profiler import LayoutProfiler
+
+
+class _FakeLayout(object):
+    def __init__(self):
+        self._inst_list = []
+        self._rect_list = []
+        self._via_list = []
+        self._pin_list = []
+
+
+class _FakeTemplate(object):
+    # draws two rectangles and one pin, like a BAG 2.0 TemplateBase
+    def __init__(self):
+        self._layout = _FakeLayout()
+
+    def draw_layout(self):
+        self._layout._rect_list.extend(['rect0', 'rect1'])
+        self._layout._pin_list.append('pin0')
+
+
+class _OtherTemplate(object):
+    # a template without the BagLayout object lists
+    def draw_layout(self):
+        pass
+
+
+def test_counts_and_restore():
+    orig = _FakeTemplate.draw_layout
+    profiler = LayoutProfiler(classes=[_FakeTemplate])
+    with profiler:
+        assert _FakeTemplate.draw_layout is not orig
+        _FakeTemplate().draw_layout()
+        _FakeTemplate().draw_layout()
+    assert _FakeTemplate.draw_layout is orig
+
+    summary = profiler.get_summary()
+    assert summary['templates'] == {'_FakeTemplate': dict(count=2, instances=0, rects=4, vias=0, pins=2)}
+    assert summary['calls']['_FakeTemplate.draw_layout']['count'] == 2
+
+
+def test_missing_attributes():
+    with LayoutProfiler(classes=[_OtherTemplate]):
+        with pytest.raises(ValueError, match='_inst_list'):
+            _OtherTemplate().draw_layout()
+
+    profiler = LayoutProfiler(classes=[_OtherTemplate], count_objects=False)
+    with profiler:
+        _OtherTemplate().draw_layout()
+    assert profiler.get_summary()['templates'] == {'_OtherTemplate': dict(count=1)}
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+pytest.importorskip('bag.layout.template')
+
+from xbase_demo import core
+from xbase_demo.offline import FakeBagProject
+
+
+class _FakeTemplateDB(object):
+    # memoizes masters by class and parameters, like bag.layout.template.TemplateDB
+    def __init__(self, lib_defs, routing_grid, lib_name, use_cybagoa=False):
+        self.master_list = []
+        self.layout_list = []
+        self._masters = {}
+
+    def new_template(self, params=None, temp_cls=None):
+        key = (temp_cls, tuple(sorted(params.items())))
+        master = self._masters.get(key, None)
+        if master is None:
+            master = self._masters[key] = temp_cls(self, params)
+            self.master_list.append(master)
+        return master
+
+    def batch_layout(self, prj, template_list, name_list):
+        self.layout_list.extend(name_list)
+
+
+class _Unit(object):
+    def __init__(self, temp_db, params):
+        self.params = params
+
+
+class _Top(object):
+    def __init__(self, temp_db, params):
+        self.unit = temp_db.new_template(params=dict(nf=params['nf']), temp_cls=_Unit)
+        self.sch_params = dict(nf=params['nf'], ndum=params['ndum'])
+
+
+def _make_specs(ndum):
+    return dict(
+        routing_grid=dict(layers=[4, 5], spaces=[0.1, 0.1], widths=[0.1, 0.1], bot_dir='x'),
+        amp=dict(impl_lib='DEMO_AMP', gen_cell='AMP', layout_params=dict(nf=4, ndum=ndum)),
+    )
+
+
+@pytest.fixture
+def fake_tdb(monkeypatch):
+    monkeypatch.setattr('bag.layout.template.TemplateDB', _FakeTemplateDB)
+    monkeypatch.setattr(core, '_make_routing_grid', lambda prj, specs: None)
+    core.clear_tdb_cache()
+    yield
+    core.clear_tdb_cache()
+
+
+def test_reuse_unchanged_masters(tmp_path, fake_tdb):
+    prj = FakeBagProject(str(tmp_path))
+    core.gen_layout(prj, _make_specs(2), 'amp', _Top, reuse_masters=True)
+    tdb = core.make_tdb(prj, _make_specs(2), 'DEMO_AMP', reuse=True)
+    unit = tdb.master_list[0]
+
+    # only the top cell changed, so the unit master is not drawn again
+    sch_params = core.gen_layout(prj, _make_specs(4), 'amp', _Top, reuse_masters=True)
+    assert sch_params == dict(nf=4, ndum=4)
+    assert [type(master) for master in tdb.master_list] == [_Unit, _Top, _Top]
+    assert tdb.master_list[2].unit is unit
+    assert tdb.layout_list == ['AMP', 'AMP']
+
+
+def test_cache_keyed_on_project(tmp_path, fake_tdb):
+    prj0 = FakeBagProject(str(tmp_path / 'prj0'))
+    prj1 = FakeBagProject(str(tmp_path / 'prj1'))
+    specs = _make_specs(2)
+    tdb0 = core.make_tdb(prj0, specs, 'DEMO_AMP', reuse=True)
+    assert core.make_tdb(prj0, specs, 'DEMO_AMP', reuse=True) is tdb0
+    assert core.make_tdb(prj1, specs, 'DEMO_AMP', reuse=True) is not tdb0
+    assert core.make_tdb(prj0, specs, 'DEMO_AMP') is not tdb0
+
+
+def test_cache_is_bounded(tmp_path, fake_tdb):
+    prj = FakeBagProject(str(tmp_path))
+    specs = _make_specs(2)
+    tdb0 = core.make_tdb(prj, specs, 'LIB0', reuse=True)
+    for idx in range(1, core._tdb_cache_size + 1):
+        core.make_tdb(prj, specs, 'LIB%d' % idx, reuse=True)
+    assert len(core._tdb_cache) == core._tdb_cache_size
+    # the least recently used database was dropped
+    assert core.make_tdb(prj, specs, 'LIB0', reuse=True) is not tdb0
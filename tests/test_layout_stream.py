@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+from xbase_demo.demo_layout.stream import LayoutStreamWriter, iter_layout_stream, diff_layout_streams
+
+res = 0.001
+
+
+def _make_content(cell_name, xr=1.0, inst_params=None):
+    # same format as TemplateBase.get_content()
+    inst_list = [dict(lib='DEMO_LIB', cell='UNIT', name='XUNIT', loc=(0.5, 0.25), orient='MX',
+                      num_cols=2, num_rows=1, sp_cols=1.2, sp_rows=0, params=inst_params)]
+    rect_list = [dict(layer=('M1', 'drawing'), bbox=((0.0, 0.0), (xr, 0.1))),
+                 dict(layer=('M2', 'drawing'), bbox=((0.0, 0.2), (0.1, 2.0)), arr_nx=3, arr_spx=0.2)]
+    via_list = [dict(id='M1_M2', loc=(0.05, 0.05), num_cols=2, num_rows=1, sp_cols=0.05, sp_rows=0)]
+    pin_list = [dict(net_name='vout', layer=('M2', 'pin'), bbox=((0.0, 0.2), (0.1, 2.0)))]
+    path_list = [dict(layer=['M3', 'drawing'], width=0.05, points=[(0.0, 0.0), (0.0, 1.5), (0.3, 1.5)])]
+    return cell_name, inst_list, rect_list, via_list, pin_list, path_list
+
+
+def _write(fname, content_list):
+    with LayoutStreamWriter(fname, res) as writer:
+        for content in content_list:
+            writer.write_cell(*content)
+
+
+def test_round_trip(tmp_path):
+    fname = os.path.join(str(tmp_path), 'layout.xbl')
+    _write(fname, [_make_content('TOP', inst_params=dict(nf=4)), _make_content('UNIT')])
+
+    cell_list = list(iter_layout_stream(fname))
+    assert [cell['name'] for cell in cell_list] == ['TOP', 'UNIT']
+    cell = cell_list[0]
+    strings = cell['strings']
+
+    rects = cell['rects']
+    assert rects.shape == (2, 10)
+    assert [strings[idx] for idx in rects[:, 0]] == ['M1', 'M2']
+    np.testing.assert_array_equal(rects[0, 2:], [0, 0, 1000, 100, 1, 1, 0, 0])
+    np.testing.assert_array_equal(rects[1, 6:], [3, 1, 200, 0])
+
+    inst = cell['instances'][0].tolist()
+    assert [strings[idx] for idx in inst[:3]] == ['DEMO_LIB', 'UNIT', 'XUNIT']
+    assert inst[3:] == [500, 250, strings.index('MX'), 2, 1, 1200, 0]
+    assert cell['inst_params'] == [dict(nf=4)]
+
+    via = cell['vias'][0].tolist()
+    assert strings[via[0]] == 'M1_M2'
+    assert via[1:3] == [50, 50]
+    assert cell['via_params'] == [dict(num_cols=2, num_rows=1, sp_cols=0.05, sp_rows=0)]
+
+    pin = cell['pins'][0].tolist()
+    assert [strings[idx] for idx in pin[:5]] == ['vout', 'vout', 'vout', 'M2', 'pin']
+    assert pin[5:] == [0, 200, 100, 2000]
+
+    assert cell['paths'] == [dict(layer=['M3', 'drawing'], width=50, points=[[0, 0], [0, 1500], [300, 1500]])]
+    assert cell['blockages'] == []
+
+
+def test_not_a_stream(tmp_path):
+    fname = os.path.join(str(tmp_path), 'layout.xbl')
+    with open(fname, 'wb') as f:
+        f.write(b'not a layout')
+    with pytest.raises(ValueError):
+        list(iter_layout_stream(fname))
+
+
+def test_diff(tmp_path):
+    fname1 = os.path.join(str(tmp_path), 'layout1.xbl')
+    fname2 = os.path.join(str(tmp_path), 'layout2.xbl')
+    _write(fname1, [_make_content('TOP'), _make_content('UNIT'), _make_content('BIAS')])
+    # cell order does not matter
+    _write(fname2, [_make_content('BIAS'), _make_content('UNIT'), _make_content('TOP')])
+    assert diff_layout_streams(fname1, fname2) == []
+
+    _write(fname2, [_make_content('UNIT', xr=1.5), _make_content('TOP'), _make_content('SF')])
+    assert diff_layout_streams(fname1, fname2) == ['UNIT', 'BIAS', 'SF']
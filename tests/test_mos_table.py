@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from xbase_demo.demo_dsn.mos_db import batch_query
+from xbase_demo.demo_dsn.mos_table import build_mos_table, MOSTable
+from xbase_demo.offline import SyntheticMOSDB
+
+env_list = ['tt', 'ff']
+intent_list = ['standard', 'lvt']
+fun_list = ['ibias', 'gm', 'gds']
+
+
+@pytest.fixture(scope='module')
+def table_info(tmp_path_factory):
+    mos_db = SyntheticMOSDB('nch', env_list=env_list, intent_list=intent_list)
+    root_dir = str(tmp_path_factory.mktemp('mos_table'))
+    build_mos_table(mos_db, root_dir, 4, intent_list, env_list, vbs=(-0.1, 0.0, 3), vds=(0.0, 1.0, 11),
+                    vgs=(0.0, 1.0, 21), fun_list=fun_list)
+    return mos_db, MOSTable(root_dir)
+
+
+def test_grid_points(table_info):
+    mos_db, table = table_info
+    vbs = table.get_axis('vbs').reshape(-1, 1, 1)
+    vds = table.get_axis('vds').reshape(1, -1, 1)
+    vgs = table.get_axis('vgs').reshape(1, 1, -1)
+    for intent in intent_list:
+        for env in env_list:
+            expected = batch_query(mos_db, vbs, vds, vgs, intent, env, fun_list=fun_list)
+            actual = table.query(vbs, vds, vgs, intent, env)
+            assert actual.shape == (3, 11, 21)
+            for name in fun_list:
+                np.testing.assert_allclose(actual[name], expected[name], rtol=1e-12, atol=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                gm_id = expected['gm'] / expected['ibias']
+            np.testing.assert_allclose(actual['gm_id'], gm_id, rtol=1e-12)
+            np.testing.assert_allclose(actual['id_w'], expected['ibias'] / 4, rtol=1e-12)
+
+
+def test_interpolation(table_info):
+    mos_db, table = table_info
+    # mixed intents and corners in one query
+    vgs = np.linspace(0.42, 0.97, 12)
+    intent = np.array(intent_list * 6)
+    env = np.repeat(env_list, 6)
+    actual = table.query(-0.05, 0.55, vgs, intent, env, fun_list=['ibias'])
+    assert actual['intent'].tolist() == intent.tolist()
+    assert actual['env'].tolist() == env.tolist()
+    expected = batch_query(mos_db, -0.05, 0.55, vgs, intent, env, fun_list=['ibias'])
+    # subthreshold current is exponential in vgs, so compare small values with an absolute tolerance
+    np.testing.assert_allclose(actual['ibias'], expected['ibias'], rtol=0.05, atol=1e-6)
+
+    # halfway between grid points, the result is the mean of the neighboring table values
+    ibias = table.get_table('ibias')
+    mid = table.query(0.0, 0.5, 0.525, 'lvt', 'ff', fun_list=['ibias'])
+    assert mid['ibias'] == pytest.approx((ibias[1, 1, 2, 5, 10] + ibias[1, 1, 2, 5, 11]) / 2, rel=1e-12)
+
+
+def test_clip_and_errors(table_info):
+    _, table = table_info
+    inside = table.query(0.0, 1.0, 1.0, 'standard', 'tt')
+    outside = table.query(0.5, 1.5, 2.0, 'standard', 'tt')
+    for name in table.fun_list:
+        assert outside[name] == inside[name]
+    assert table.query([], 0.5, 0.5, 'standard', 'tt').shape == (0,)
+    with pytest.raises(ValueError, match='intent'):
+        table.query(0.0, 0.5, 0.5, 'hvt', 'tt')
+    with pytest.raises(ValueError, match='env'):
+        table.query(0.0, 0.5, 0.5, 'standard', 'ss')
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+
+import pytest
+import yaml
+
+from xbase_demo import netlist_info
+from xbase_demo.netlist_info import load_netlist_info, clear_netlist_cache
+
+_root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sample_fname = os.path.join(_root_dir, 'BagModules', 'demo_templates', 'netlist_info', 'amp_cs.yaml')
+
+
+@pytest.fixture
+def cache_info(tmp_path):
+    # a copy of the sample netlist, and a private snapshot directory
+    fname = os.path.join(str(tmp_path), 'netlist_info', 'amp_cs.yaml')
+    os.makedirs(os.path.dirname(fname))
+    shutil.copy(sample_fname, fname)
+    cache_dir = os.path.join(str(tmp_path), 'cache')
+    clear_netlist_cache()
+    yield fname, cache_dir
+    clear_netlist_cache()
+
+
+def _fail_yaml(monkeypatch):
+    def load(*args, **kwargs):
+        raise AssertionError('YAML file parsed again')
+
+    monkeypatch.setattr(netlist_info.yaml, 'load', load)
+
+
+def test_parse_sample(cache_info):
+    fname, cache_dir = cache_info
+    info = load_netlist_info(fname, cache_dir=cache_dir)
+    with open(sample_fname, 'r') as f:
+        assert info == yaml.safe_load(f)
+
+    assert info['cell_name'] == 'amp_cs'
+    assert info['pins'] == ['VDD', 'VSS', 'vin', 'vout', 'vbias']
+    xn = info['instances']['XN']
+    assert xn['cell_name'] == 'nmos4_standard'
+    assert xn['instpins']['D']['net_name'] == 'vout'
+
+    # callers get their own copy
+    info['pins'].append('foo')
+    assert load_netlist_info(fname, cache_dir=cache_dir)['pins'] == ['VDD', 'VSS', 'vin', 'vout', 'vbias']
+
+
+def test_snapshot(cache_info, monkeypatch):
+    fname, cache_dir = cache_info
+    expected = load_netlist_info(fname, cache_dir=cache_dir)
+    snap_list = os.listdir(cache_dir)
+    assert len(snap_list) == 1
+
+    # a new process loads the snapshot instead of parsing YAML
+    clear_netlist_cache()
+    with monkeypatch.context() as m:
+        _fail_yaml(m)
+        assert load_netlist_info(fname, cache_dir=cache_dir) == expected
+
+    # snapshots whose hash does not match the file are ignored
+    snap_fname = os.path.join(cache_dir, snap_list[0])
+    with open(snap_fname, 'w') as f:
+        json.dump(dict(digest='0' * 40, info=dict(pins=['wrong'])), f)
+    clear_netlist_cache()
+    assert load_netlist_info(fname, cache_dir=cache_dir) == expected
+
+
+def test_file_change(cache_info, monkeypatch):
+    fname, cache_dir = cache_info
+    load_netlist_info(fname, cache_dir=cache_dir)
+    with monkeypatch.context() as m:
+        # unchanged files are not read again
+        _fail_yaml(m)
+        load_netlist_info(fname, cache_dir=cache_dir)
+
+    with open(fname, 'a') as f:
+        f.write('extra_key: 1\n')
+    assert load_netlist_info(fname, cache_dir=cache_dir)['extra_key'] == 1
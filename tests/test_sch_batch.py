@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from xbase_demo.offline import LocalSchematicDB
+from xbase_demo.sch_batch import SchematicBatch
+
+
+def _add_cells(sch_batch, master_db_list):
+    name_list = []
+    for idx, master_db in enumerate(master_db_list):
+        name = 'CELL%d' % idx
+        with sch_batch.timer(name, 'design'):
+            dsn = master_db.create_design_module('demo_templates', 'amp_cs')
+            dsn.design(idx=idx)
+        sch_batch.add(dsn, name)
+        name_list.append(name)
+    return name_list
+
+
+def test_batched_commit(tmp_path):
+    master_db = LocalSchematicDB(str(tmp_path))
+    sch_batch = SchematicBatch('DEMO_LIB')
+    name_list = _add_cells(sch_batch, [master_db] * 3)
+    sch_batch.commit()
+
+    # all cells are created in one database operation
+    assert master_db.num_commits == 1
+    assert len(sch_batch.commit_times) == 1
+    for idx, name in enumerate(name_list):
+        assert master_db.get_cell('DEMO_LIB', name)['params'] == dict(idx=idx)
+        assert set(sch_batch.timing[name].keys()) == {'design'}
+
+    # committing again does nothing
+    sch_batch.commit()
+    assert master_db.num_commits == 1
+
+
+def test_per_cell_commit(tmp_path):
+    # modules of different databases are implemented one at a time
+    master_db_list = [LocalSchematicDB(str(tmp_path)) for _ in range(2)]
+    sch_batch = SchematicBatch('DEMO_LIB')
+    name_list = _add_cells(sch_batch, master_db_list)
+    sch_batch.commit()
+
+    assert [master_db.num_commits for master_db in master_db_list] == [1, 1]
+    assert sch_batch.commit_times == []
+    for name in name_list:
+        assert os.path.isfile(os.path.join(str(tmp_path), 'DEMO_LIB', '%s.json' % name))
+        assert set(sch_batch.timing[name].keys()) == {'design', 'implement'}
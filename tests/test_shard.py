@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+
+from xbase_demo.jobqueue import make_testbench_jobs
+from xbase_demo.offline import FakeBagProject, make_fake_results, save_sim_hdf5, load_sim_hdf5
+from xbase_demo.shard import get_shard_cells, make_shard_jobs, merge_shard_files
+from xbase_demo.specs import compile_specs
+
+sim_envs = ['tt', 'ff', 'ss', 'fs', 'sf']
+vbias_list = [0.1, 0.2, 0.3]
+
+
+def _make_specs(data_dir):
+    return compile_specs(dict(
+        sim_envs=sim_envs,
+        view_name='schematic',
+        routing_grid={},
+        amp_cs=dict(data_dir=data_dir, impl_lib='DEMO_AMP_CS', sch_lib='demo_templates', sch_cell='amp_cs',
+                    gen_cell='AMP_CS', layout_package='xbase_demo.demo_layout.core', layout_class='AmpCS',
+                    layout_params={},
+                    testbenches=dict(
+                        tb_dc=dict(tb_lib='demo_testbenches', tb_cell='amp_tb_dc', sch_params={},
+                                   tb_params=dict(vdd=1.0), tb_sweeps=dict(vbias=vbias_list)),
+                    )),
+    ))
+
+
+def _setup_testbench(prj, config):
+    # the steps of xbase_demo.core.setup_testbench()
+    tb = prj.configure_testbench(config['impl_lib'], config['tb_gen_cell'])
+    for key, val in config['tb_params'].items():
+        tb.set_parameter(key, val)
+    for key, val_list in (config['tb_sweeps'] or {}).items():
+        tb.set_sweep_parameter(key, values=list(val_list))
+    tb.set_simulation_view(config['impl_lib'], config['gen_cell'], config['view_name'])
+    tb.set_simulation_environments(list(config['sim_envs']))
+    tb.update_testbench()
+    return tb
+
+
+def test_fake_testbench_state_is_per_cell(tmp_path):
+    prj = FakeBagProject(str(tmp_path), num_points=11)
+    tb0 = prj.configure_testbench('DEMO_AMP_CS', 'AMP_CS_tb_dc')
+    tb0.set_simulation_environments(['tt'])
+    tb0.update_testbench()
+    tb1 = prj.configure_testbench('DEMO_AMP_CS', 'AMP_CS_tb_dc')
+    tb1.set_simulation_environments(['ff'])
+    tb1.update_testbench()
+
+    # a simulation runs the settings stored last, not those of its testbench object
+    tb0.run_simulation()
+    assert list(tb0.results['corner']) == ['ff']
+
+
+def test_shards_simulate_own_cells(tmp_path):
+    specs = _make_specs(str(tmp_path / 'data'))
+    config = make_testbench_jobs(specs, 'amp_cs')[0]
+    shard_configs = make_shard_jobs(config, corners_per_shard=2, sweep_shards=['vbias'])
+    cell_list = get_shard_cells(config['tb_gen_cell'], sim_envs, tb_sweeps=config['tb_sweeps'],
+                                corners_per_shard=2, sweep_shards=['vbias'])
+    assert len(shard_configs) == 3 * len(vbias_list)
+    assert [shard_config['tb_gen_cell'] for shard_config in shard_configs] == cell_list
+    assert len(set(cell_list)) == len(cell_list)
+
+    # set up every shard before running any of them, as xbase_demo.core.simulate_sharded() does
+    prj = FakeBagProject(str(tmp_path / 'fake'), num_points=11)
+    tb_list = [_setup_testbench(prj, shard_config) for shard_config in shard_configs]
+    for tb, shard_config in zip(tb_list, shard_configs):
+        tb.run_simulation()
+        save_sim_hdf5(tb.results, shard_config['data_fname'])
+
+    results = merge_shard_files(shard_configs, config['data_fname'], load_fun=load_sim_hdf5,
+                                save_fun=save_sim_hdf5)
+    expected = make_fake_results('AMP_CS_tb_dc', sim_envs, sweeps=dict(vbias=vbias_list), num_points=11)
+    assert os.path.isfile(config['data_fname'])
+    assert results['sweep_params'] == expected['sweep_params']
+    assert list(results['corner']) == sim_envs
+    for name in ('vbias', 'vin', 'vout'):
+        np.testing.assert_allclose(results[name], expected[name])
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from xbase_demo.offline import make_fake_results
+from xbase_demo.sim_data import get_step_response, process_tb_tran
+
+tau = 1e-10
+tvec = np.linspace(0.0, 20 * tau, 20001)
+
+
+def test_step_response():
+    vout = 0.8 * (1 - np.exp(-tvec / tau))
+    t_rise, t_settle, overshoot = get_step_response(tvec, vout)
+    assert t_rise == pytest.approx(tau * np.log(9), rel=1e-4)
+    assert t_settle == pytest.approx(tau * np.log(50), rel=1e-3)
+    assert overshoot == 0
+
+    # falling steps are measured the same way
+    assert get_step_response(tvec, 1.0 - vout)[:2] == pytest.approx((t_rise, t_settle))
+    assert get_step_response(tvec, np.full(tvec.shape, 0.5)) == (-1, -1, 0.0)
+
+
+def test_overshoot():
+    # second order step response with damping 0.5
+    zeta, wn = 0.5, 1 / tau
+    wd = wn * np.sqrt(1 - zeta ** 2)
+    vout = 1 - np.exp(-zeta * wn * tvec) * (np.cos(wd * tvec) + zeta / np.sqrt(1 - zeta ** 2) * np.sin(wd * tvec))
+    _, t_settle, overshoot = get_step_response(tvec, vout)
+    assert overshoot == pytest.approx(np.exp(-np.pi * zeta / np.sqrt(1 - zeta ** 2)), rel=1e-3)
+    # settles within 2% after about 4 time constants of the envelope
+    assert 3 * tau / zeta < t_settle < 5 * tau / zeta
+
+
+def test_process_tb_tran(capsys):
+    results = make_fake_results('amp_tb_ac_tran', ['tt', 'ff'], sweeps=dict(vbias=[0.1, 0.2]), num_points=1001)
+    process_tb_tran(results, plot=False)
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 4
+    assert lines[0].startswith('corner=tt, vbias=0.1, t_rise=')
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import pickle
+
+import pytest
+
+from xbase_demo.specs import FrozenDict, DesignSpecs, TopSpecs, compile_specs, thaw
+from xbase_demo.sweep import expand_all_sweeps
+
+
+def _make_specs():
+    return dict(
+        sim_envs=['tt', 'ff'],
+        view_name='netlist',
+        routing_grid=dict(layers=[4, 5], spaces=[0.1, 0.1], widths=[0.1, 0.1], bot_dir='x'),
+        amp_cs=dict(
+            data_dir='data/amp_cs',
+            impl_lib='AAAFOO_AMP_CS',
+            sch_lib='demo_templates',
+            sch_cell='amp_cs',
+            gen_cell='AMP_CS',
+            layout_package='xbase_demo.demo_layout.core',
+            layout_class='AmpCS',
+            layout_params=dict(lch=16e-9, w_dict=dict(load=4, amp=4)),
+            testbenches=dict(
+                tb_dc=dict(tb_lib='demo_testbenches', tb_cell='amp_tb_dc',
+                           sch_params=dict(dut_conns=dict(vin='vin')),
+                           tb_params=dict(vdd=1.0)),
+            ),
+        ),
+    )
+
+
+@pytest.fixture
+def top_specs():
+    return compile_specs(_make_specs(), root_dir='/tmp')
+
+
+def test_frozen_dict_pickle():
+    fdict = FrozenDict(dict(a=1, b=(2, 3)))
+    ans = pickle.loads(pickle.dumps(fdict))
+    assert isinstance(ans, FrozenDict)
+    assert ans == fdict
+    assert hash(ans) == hash(fdict)
+
+
+def test_frozen_dict_copy():
+    fdict = FrozenDict(dict(a=1, b=FrozenDict(dict(c=2))))
+    assert copy.copy(fdict) is fdict
+    ans = copy.deepcopy(fdict)
+    assert isinstance(ans, FrozenDict)
+    assert ans == fdict
+    with pytest.raises(AttributeError):
+        ans.foo = 1
+
+
+def test_specs_pickle(top_specs):
+    ans = pickle.loads(pickle.dumps(top_specs))
+    assert isinstance(ans, TopSpecs)
+    assert isinstance(ans['amp_cs'], DesignSpecs)
+    assert ans['amp_cs'].name == 'amp_cs'
+    assert thaw(ans) == thaw(top_specs)
+
+
+def test_specs_copy(top_specs):
+    assert copy.copy(top_specs) is top_specs
+    ans = copy.deepcopy(top_specs)
+    assert isinstance(ans, TopSpecs)
+    assert ans['amp_cs'].testbenches['tb_dc'].name == 'tb_dc'
+    assert thaw(ans) == thaw(top_specs)
+    with pytest.raises(AttributeError):
+        ans.view_name = 'schematic'
+
+
+def test_sweep_entry_not_a_design():
+    specs = _make_specs()
+    specs['amp_cs_sweep'] = dict(base='amp_cs', sweep=dict(params={'layout_params.lch': [16e-9, 20e-9]}))
+    top = compile_specs(specs, root_dir='/tmp')
+    assert list(top.designs.keys()) == ['amp_cs']
+    assert top['amp_cs_sweep']['base'] == 'amp_cs'
+
+    new_specs, _ = expand_all_sweeps(top)
+    new_top = compile_specs(new_specs)
+    names = ('amp_cs', 'amp_cs_sweep_0', 'amp_cs_sweep_1')
+    assert [new_top[name].gen_cell for name in names] == ['AMP_CS', 'AMP_CS_0', 'AMP_CS_1']
+    # sub-cells of different design points must not share a library
+    assert [new_top[name].impl_lib for name in names] == ['AAAFOO_AMP_CS', 'AAAFOO_AMP_CS_0', 'AAAFOO_AMP_CS_1']
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+from xbase_demo.stimuli import pulse, prbs_bits, bits_to_pwl, format_pwl, write_pwl, StimulusStore
+
+
+def _prbs_reference(order, tap, num_bits):
+    # bit by bit Fibonacci LFSR, b[k] = b[k - order] ^ b[k - tap], starting from all ones
+    bits = [1] * order
+    for idx in range(order, num_bits + order):
+        bits.append(bits[idx - order] ^ bits[idx - tap])
+    return bits[order:]
+
+
+@pytest.mark.parametrize('order,tap', [(7, 6), (9, 5), (11, 9)])
+def test_prbs_period(order, tap):
+    period = (1 << order) - 1
+    bits = prbs_bits(order, 2 * period + 10)
+    assert bits.tolist() == _prbs_reference(order, tap, 2 * period + 10)
+    # maximal length sequence: repeats after 2^order - 1 bits and no earlier
+    np.testing.assert_array_equal(bits[period:2 * period], bits[:period])
+    for shift in range(1, period):
+        assert not np.array_equal(bits[shift:shift + period], bits[:period])
+    assert int(bits[:period].sum()) == 1 << (order - 1)
+
+
+def test_prbs_errors():
+    with pytest.raises(ValueError):
+        prbs_bits(8, 10)
+    with pytest.raises(ValueError):
+        prbs_bits(7, 10, seed=1 << 7)
+
+
+def test_pulse():
+    tvec, yvec = pulse(0.0, 1.0, td=1.0, tr=0.1, tpulse=0.5, period=2.0, num=2)
+    np.testing.assert_allclose(tvec, [0, 1, 1.1, 1.6, 1.7, 3, 3.1, 3.6, 3.7])
+    np.testing.assert_allclose(yvec, [0, 0, 1, 1, 0, 0, 1, 1, 0])
+    with pytest.raises(ValueError):
+        pulse(0.0, 1.0, td=0.0, tr=0.1, tpulse=0.5, period=0.6, num=2)
+
+
+def test_bits_to_pwl():
+    tvec, yvec = bits_to_pwl([0, 0, 1, 1, 1, 0], tbit=1.0, tr=0.1, v0=0.0, v1=1.0)
+    np.testing.assert_allclose(tvec, [0, 2, 2.1, 5, 5.1, 6])
+    np.testing.assert_allclose(yvec, [0, 0, 1, 1, 0, 0])
+    # a transition at time 0 does not produce a duplicate point
+    tvec, yvec = bits_to_pwl([1, 0], tbit=1.0, tr=0.1, v0=0.0, v1=1.0, td=-1.0)
+    np.testing.assert_allclose(tvec, [0, 0.1, 1])
+
+
+def test_format_pwl():
+    tvec = [0.0, 1e-9, 1.5e-9, 2e-9]
+    yvec = [0.0, 0.9, 0.9, 1.0 / 3]
+    text = ''.join(format_pwl(tvec, yvec, precision=4))
+    assert text == '0 0\n1e-09 0.9\n1.5e-09 0.9\n2e-09 0.3333\n'
+    # chunking does not change the output
+    assert ''.join(format_pwl(tvec, yvec, precision=4, chunk_size=3)) == text
+    with pytest.raises(ValueError):
+        list(format_pwl([0.0, 2.0, 1.0], [0.0, 0.0, 0.0]))
+    with pytest.raises(ValueError):
+        list(format_pwl([0.0, 1.0], [0.0]))
+
+
+def test_write_pwl_round_trip(tmp_path):
+    tvec, yvec = bits_to_pwl(prbs_bits(7, 127), tbit=100e-12, tr=10e-12, v0=0.0, v1=0.8)
+    fname = os.path.join(str(tmp_path), 'stim', 'prbs7.pwl')
+    write_pwl(fname, tvec, yvec, chunk_size=16)
+    data = np.loadtxt(fname)
+    np.testing.assert_allclose(data[:, 0], tvec, rtol=1e-9)
+    np.testing.assert_allclose(data[:, 1], yvec, rtol=1e-9)
+
+
+def test_stimulus_store(tmp_path):
+    store = StimulusStore(str(tmp_path))
+    tvec, yvec = pulse(0.0, 1.0, td=0.0, tr=0.1, tpulse=0.5)
+    fname = store.put(tvec, yvec)
+    assert os.path.isfile(fname)
+    assert store.put(tvec.copy(), yvec.copy()) == fname
+    assert store.put(tvec, yvec, precision=4) != fname
+    assert store.put(tvec, yvec * 2) != fname
+    assert sorted(os.listdir(str(tmp_path))) == sorted(os.path.basename(name) for name in
+                                                       (fname, store.get_fname(tvec, yvec, precision=4),
+                                                        store.get_fname(tvec, yvec * 2)))
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+from xbase_demo.demo_layout.tracks import get_track_index
+
+
+class _FakeGrid(object):
+    # tracks of pitch 100 resolution units, with track 0 at 50
+    def __init__(self):
+        self.num_calls = 0
+
+    def coord_to_nearest_track(self, layer_id, coord, half_track=False, mode=0, unit_mode=False):
+        self.num_calls += 1
+        if not unit_mode:
+            coord = int(round(coord / 0.001))
+        return (coord - 50) // 100
+
+    def track_to_coord(self, layer_id, track_idx, unit_mode=False):
+        self.num_calls += 1
+        coord = int(50 + track_idx * 100)
+        return coord if unit_mode else coord * 0.001
+
+    def get_middle_track(self, tr1, tr2, round_up=False):
+        self.num_calls += 1
+        return (tr1 + tr2) / 2
+
+
+def test_memoized_conversions():
+    grid = _FakeGrid()
+    tr_index = get_track_index(grid)
+    assert get_track_index(grid) is tr_index
+
+    for _ in range(3):
+        assert tr_index.coord_to_nearest_track(5, 0.35) == grid.coord_to_nearest_track(5, 0.35)
+        assert tr_index.coord_to_nearest_track(5, 350, unit_mode=True) == 3
+        assert tr_index.track_to_coord(5, 3, unit_mode=True) == 350
+        assert tr_index.get_middle_track(1, 4) == 2.5
+    # 4 conversions plus the 3 direct calls above
+    assert grid.num_calls == 7
+
+    tr_index.clear_cache()
+    tr_index.track_to_coord(5, 3, unit_mode=True)
+    assert grid.num_calls == 8
+    # each grid has its own index
+    assert get_track_index(_FakeGrid()) is not tr_index
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Location of the on-disk snapshot caches.
+
+Modules that persist expensive intermediate results between processes, such
+as parsed netlist_info files and fitted transistor databases, keep them in
+sub-directories of one cache root.  The root defaults to
+~/.cache/xbase_demo; set the XBASE_DEMO_CACHE_DIR environment variable to
+change it.
+"""
+
+import os
+
+
+def get_cache_dir(sub_dir):
+    """Returns the given snapshot directory under the cache root."""
+    root_dir = os.environ.get('XBASE_DEMO_CACHE_DIR',
+                              os.path.join(os.path.expanduser('~'), '.cache', 'xbase_demo'))
+    return os.path.join(root_dir, sub_dir)
+
+
+def is_private_dir(dir_name):
+    """Create the given directory if needed, and return True if only the current user can write to it."""
+    try:
+        os.makedirs(dir_name, mode=0o700, exist_ok=True)
+        st = os.stat(dir_name)
+    except OSError:
+        return False
+    if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+        return False
+    return not (st.st_mode & 0o022)
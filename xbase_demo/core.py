@@ -1,47 +1,110 @@
 # -*- coding: utf-8 -*-
 
 import os
-from itertools import product
+import time
+import threading
+import multiprocessing
+from collections import OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+# BAG is imported by the functions that use it, so the schematic, LVS and result
+# loading steps also run with the offline stand-ins of xbase_demo.offline.
+from .sch_manifest import SchematicManifest, compute_cell_key
+from .sch_batch import SchematicBatch
+from .netlist_info import install_netlist_cache
+from .stimuli import pulse, write_pwl
+from .sim_data import split_data_by_sweep, process_tb_dc, process_tb_ac, process_tb_tran, plot_data
+from .specs import thaw
+from .shard import get_shard_cells, make_shard_jobs, merge_shard_files
+from .jobqueue import make_testbench_jobs
+
+# TemplateDB objects kept alive between gen_layout() calls, keyed by project,
+# implementation library and routing grid specification.  Each entry also holds
+# its project, so a new project that reuses the id() of a deleted one does not
+# get its masters.  Only the most recently used entries are kept.
+_tdb_cache = OrderedDict()
+_tdb_cache_lock = threading.Lock()
+_tdb_cache_size = 8
+
+
+def _get_tdb_key(prj, specs, impl_lib):
+    grid_specs = specs['routing_grid']
+    return (id(prj), impl_lib, tuple(grid_specs['layers']), tuple(grid_specs['spaces']),
+            tuple(grid_specs['widths']), grid_specs['bot_dir'])
+
+
+def clear_tdb_cache():
+    """Forget all layout masters computed by previous gen_layout() calls."""
+    with _tdb_cache_lock:
+        _tdb_cache.clear()
+
+
+def make_tdb(prj, specs, impl_lib, reuse=False, stream_fname=None):
+    """Create a layout template database.
+
+    If reuse is True, the TemplateDB created by a previous call with the same
+    project, implementation library and routing grid is returned instead.
+    TemplateDB memoizes layout masters by class and parameters, so any
+    sub-master whose parameters did not change is taken from memory instead of
+    being redrawn.
+
+    If stream_fname is given, batch_layout() of the returned database writes
+    layouts to that file instead of the OA database.
+    """
+    if stream_fname is not None:
+        from .demo_layout.export import StreamTemplateDB
+
+        routing_grid = _make_routing_grid(prj, specs)
+        return StreamTemplateDB(stream_fname, 'template_libs.def', routing_grid, impl_lib)
+
+    if reuse:
+        key = _get_tdb_key(prj, specs, impl_lib)
+        with _tdb_cache_lock:
+            entry = _tdb_cache.get(key, None)
+            if entry is None or entry[0] is not prj:
+                entry = _tdb_cache[key] = (prj, make_tdb(prj, specs, impl_lib))
+                if len(_tdb_cache) > _tdb_cache_size:
+                    _tdb_cache.popitem(last=False)
+            else:
+                _tdb_cache.move_to_end(key)
+        return entry[1]
 
-import numpy as np
-import scipy.interpolate as interp
-import scipy.optimize as sciopt
-import matplotlib.pyplot as plt
+    from bag.layout.template import TemplateDB
+
+    # create RoutingGrid object
+    routing_grid = _make_routing_grid(prj, specs)
+    # create layout template database
+    tdb = TemplateDB('template_libs.def', routing_grid, impl_lib, use_cybagoa=True)
+    return tdb
 
-from bag.layout.routing import RoutingGrid
-from bag.layout.template import TemplateDB
-from bag.data import load_sim_results, save_sim_results, load_sim_file
 
+def _make_routing_grid(prj, specs):
+    from bag.layout.routing import RoutingGrid
 
-def make_tdb(prj, specs, impl_lib):
     grid_specs = specs['routing_grid']
     layers = grid_specs['layers']
     spaces = grid_specs['spaces']
     widths = grid_specs['widths']
     bot_dir = grid_specs['bot_dir']
 
-    # create RoutingGrid object
-    routing_grid = RoutingGrid(prj.tech_info, layers, spaces, widths, bot_dir)
-    # create layout template database
-    tdb = TemplateDB('template_libs.def', routing_grid, impl_lib, use_cybagoa=True)
-    return tdb
+    return RoutingGrid(prj.tech_info, layers, spaces, widths, bot_dir)
 
 
-def gen_pwl_data(fname):
+def gen_pwl_data(fname, precision=None, stim_store=None):
     td = 100e-12
     tpulse = 800e-12
     tr = 20e-12
     amp = 10e-3
 
-    tvec = [0, td, td + tr, td + tr + tpulse, td + tr + tpulse + tr]
-    yvec = [-amp, -amp, amp, amp, -amp]
-
-    dir_name = os.path.dirname(fname)
-    os.makedirs(dir_name, exist_ok=True)
+    tvec, yvec = pulse(-amp, amp, td, tr, tpulse)
+    if stim_store is not None:
+        # the store only writes the file if an identical waveform is not stored yet.
+        # precision defaults to the store precision.
+        return stim_store.put(tvec, yvec, precision=precision)
 
-    with open(fname, 'w') as f:
-        for t, y in zip(tvec, yvec):
-            f.write('%.4g %.4g\n' % (t, y))
+    write_pwl(fname, tvec, yvec, precision=10 if precision is None else precision)
+    return fname
 
 
 def routing_demo(prj, specs, routing_class):
@@ -60,322 +123,385 @@ def routing_demo(prj, specs, routing_class):
     print('layout done')
 
 
-def gen_layout(prj, specs, dsn_name, demo_class):
+def _prof_section(profiler, label):
+    if profiler is None:
+        return nullcontext()
+    return profiler.section(label)
+
+
+def gen_layout(prj, specs, dsn_name, demo_class, reuse_masters=False, profiler=None, prj_lock=None):
     # get information from specs
     dsn_specs = specs[dsn_name]
     impl_lib = dsn_specs['impl_lib']
-    layout_params = dsn_specs['layout_params']
+    layout_params = thaw(dsn_specs['layout_params'])
     gen_cell = dsn_specs['gen_cell']
 
-    # create layout template database
-    tdb = make_tdb(prj, specs, impl_lib)
+    if profiler is None:
+        prof_ctx = nullcontext()
+    else:
+        # instrument layout generator methods while this function runs.  If the
+        # profiler is already active, add_class() patches demo_class right away.
+        profiler.add_class(demo_class)
+        prof_ctx = profiler
+
+    with prof_ctx:
+        # create layout template database.  When reusing masters, only templates
+        # whose parameters changed since the last call are redrawn.
+        tdb = make_tdb(prj, specs, impl_lib, reuse=reuse_masters)
+        # compute layout
+        print('computing layout')
+        with _prof_section(profiler, 'compute_layout'):
+            # template = tdb.new_template(params=layout_params, temp_cls=temp_cls)
+            template = tdb.new_template(params=layout_params, temp_cls=demo_class)
+
+        # create layout in OA database.  Layout computation above does not use the
+        # database connection, so only this step holds prj_lock.
+        print('creating layout')
+        with _prof_section(profiler, 'batch_layout'), prj_lock or nullcontext():
+            tdb.batch_layout(prj, [template], [gen_cell])
+    # return corresponding schematic parameters
+    print('layout done')
+    return template.sch_params
+
+
+def export_layout(prj, specs, dsn_name, demo_class, fname):
+    # get information from specs
+    dsn_specs = specs[dsn_name]
+    impl_lib = dsn_specs['impl_lib']
+    layout_params = thaw(dsn_specs['layout_params'])
+    gen_cell = dsn_specs['gen_cell']
+
+    # create layout template database that writes to a stream file
+    tdb = make_tdb(prj, specs, impl_lib, stream_fname=fname)
     # compute layout
     print('computing layout')
-    # template = tdb.new_template(params=layout_params, temp_cls=temp_cls)
     template = tdb.new_template(params=layout_params, temp_cls=demo_class)
-
-    # create layout in OA database
-    print('creating layout')
+    # stream layout to file
+    print('exporting layout to %s' % fname)
     tdb.batch_layout(prj, [template], [gen_cell])
-    # return corresponding schematic parameters
     print('layout done')
     return template.sch_params
 
 
-def gen_schematics(prj, specs, dsn_name, sch_params, sch_cls=None, check_lvs=False, lvs_only=False):
+def gen_schematics(prj, specs, dsn_name, sch_params, sch_cls=None, check_lvs=False, lvs_only=False,
+                   skip_unchanged=False, manifest_fname=None, batch=False, stim_store=None,
+                   corners_per_shard=None, sweep_shards=()):
+    dsn_specs = specs[dsn_name]
+
+    impl_lib = dsn_specs['impl_lib']
+    gen_cell = dsn_specs['gen_cell']
+
+    # the manifest records the hash of every generated schematic.  It is updated on
+    # every run, and when skipping unchanged cells, cells whose hash matches the
+    # manifest are not re-implemented.
+    if manifest_fname is None:
+        manifest_fname = os.path.join(dsn_specs['data_dir'], '%s_sch_manifest.json' % gen_cell)
+    manifest = SchematicManifest(manifest_fname)
+    # in batch mode, the DUT and all testbenches are implemented in one database
+    # operation, and LVS runs afterwards.  Otherwise each cell is implemented right away.
+    sch_batch = SchematicBatch(impl_lib)
+
+    gen_dut_schematic(prj, specs, dsn_name, sch_params, sch_cls=sch_cls, manifest=manifest,
+                      sch_batch=sch_batch, batch=batch, skip_unchanged=skip_unchanged)
+
+    if check_lvs and not batch:
+        _run_lvs(prj, impl_lib, gen_cell)
+
+    if not lvs_only:
+        gen_tb_schematics(prj, specs, dsn_name, manifest=manifest, sch_batch=sch_batch, batch=batch,
+                          skip_unchanged=skip_unchanged, stim_store=stim_store,
+                          corners_per_shard=corners_per_shard, sweep_shards=sweep_shards)
+
+    if batch:
+        sch_batch.commit()
+        if check_lvs:
+            _run_lvs(prj, impl_lib, gen_cell)
+        sch_batch.print_timing()
+
+    manifest.save()
+    if skip_unchanged:
+        print('regenerated schematics: %s' % ', '.join(manifest.regenerated))
+
+    print('schematic done')
+    return manifest.regenerated
+
+
+def gen_dut_schematic(prj, specs, dsn_name, sch_params, sch_cls=None, manifest=None, sch_batch=None,
+                      batch=False, skip_unchanged=False):
     dsn_specs = specs[dsn_name]
 
     impl_lib = dsn_specs['impl_lib']
     sch_lib = dsn_specs['sch_lib']
     sch_cell = dsn_specs['sch_cell']
     gen_cell = dsn_specs['gen_cell']
-    testbenches = dsn_specs['testbenches']
+
+    if manifest is None:
+        manifest = SchematicManifest('')
+    if sch_batch is None:
+        sch_batch = SchematicBatch(impl_lib)
+
+    # load netlist_info files of design modules through the snapshot cache
+    install_netlist_cache()
 
     # clear existing designs
     prj.clear_schematic_database()
 
+    sch_cls_name = None if sch_cls is None else '%s.%s' % (sch_cls.__module__, sch_cls.__name__)
+    dsn_key = compute_cell_key(sch_lib, sch_cell, [sch_params, sch_cls_name])
+    if skip_unchanged and manifest.is_current(impl_lib, gen_cell, dsn_key):
+        print('%s schematics unchanged, skipping' % gen_cell)
+        return
+
     # create schematic generator object
-    if sch_cls is None:
-        dsn = prj.create_design_module(sch_lib, sch_cell)
-        print('computing %s schematics' % gen_cell)
-        dsn.design(**sch_params)
-    else:
-        dsn = prj.new_schematic_instance(lib_name=sch_lib, cell_name=sch_cell,
-                                         params=sch_params, sch_cls=sch_cls)
+    print('computing %s schematics' % gen_cell)
+    with sch_batch.timer(gen_cell, 'design'):
+        if sch_cls is None:
+            dsn = prj.create_design_module(sch_lib, sch_cell)
+            dsn.design(**sch_params)
+        else:
+            dsn = prj.new_schematic_instance(lib_name=sch_lib, cell_name=sch_cell,
+                                             params=sch_params, sch_cls=sch_cls)
 
     # create schematic in OA database
-    print('creating %s schematics' % gen_cell)
-    dsn.implement_design(impl_lib, top_cell_name=gen_cell)
-
-    if check_lvs:
-        print('running lvs')
-        lvs_passed, lvs_log = prj.run_lvs(impl_lib, gen_cell)
-        if not lvs_passed:
-            raise ValueError('LVS failed.  check log file: %s' % lvs_log)
-        else:
-            print('lvs passed')
-            print('lvs log is ' + lvs_log)
+    sch_batch.add(dsn, gen_cell)
+    if not batch:
+        sch_batch.commit()
+    manifest.update(impl_lib, gen_cell, dsn_key)
 
-    if lvs_only:
-        return
+
+def gen_tb_schematics(prj, specs, dsn_name, manifest=None, sch_batch=None, batch=False,
+                      skip_unchanged=False, stim_store=None, corners_per_shard=None, sweep_shards=()):
+    dsn_specs = specs[dsn_name]
+
+    impl_lib = dsn_specs['impl_lib']
+    gen_cell = dsn_specs['gen_cell']
+    testbenches = dsn_specs['testbenches']
+
+    if manifest is None:
+        manifest = SchematicManifest('')
+    if sch_batch is None:
+        sch_batch = SchematicBatch(impl_lib)
+
+    install_netlist_cache()
 
     for name, info in testbenches.items():
         tb_lib = info['tb_lib']
         tb_cell = info['tb_cell']
-        tb_sch_params = info['sch_params']
+        # work on a copy, so the specifications are never modified
+        tb_sch_params = thaw(info['sch_params'])
 
         tb_gen_cell = '%s_%s' % (gen_cell, name)
+        # simulate() with sharding runs each shard in its own copy of the testbench
+        cell_list = [tb_gen_cell]
+        if corners_per_shard is not None or sweep_shards:
+            cell_list.extend(get_shard_cells(tb_gen_cell, specs['sim_envs'], tb_sweeps=info.get('tb_sweeps', None),
+                                             corners_per_shard=corners_per_shard, sweep_shards=sweep_shards))
 
+        extra_files = []
         if 'tran_fname' in tb_sch_params:
             tran_fname = os.path.abspath(tb_sch_params['tran_fname'])
-            gen_pwl_data(tran_fname)
+            tran_fname = gen_pwl_data(tran_fname, stim_store=stim_store)
             tb_sch_params['tran_fname'] = tran_fname
+            extra_files.append(tran_fname)
+
+        tb_key = compute_cell_key(tb_lib, tb_cell, [impl_lib, gen_cell, tb_sch_params],
+                                  extra_files=extra_files)
+        for cell_name in cell_list:
+            if skip_unchanged and manifest.is_current(impl_lib, cell_name, tb_key):
+                print('%s schematics unchanged, skipping' % cell_name)
+                continue
+
+            print('computing %s schematics' % cell_name)
+            with sch_batch.timer(cell_name, 'design'):
+                tb_dsn = prj.create_design_module(tb_lib, tb_cell)
+                tb_dsn.design(dut_lib=impl_lib, dut_cell=gen_cell, **tb_sch_params)
+            sch_batch.add(tb_dsn, cell_name)
+            if not batch:
+                sch_batch.commit()
+            manifest.update(impl_lib, cell_name, tb_key)
+
+
+def _run_lvs(prj, impl_lib, gen_cell):
+    print('running lvs')
+    lvs_passed, lvs_log = prj.run_lvs(impl_lib, gen_cell)
+    if not lvs_passed:
+        raise ValueError('LVS failed.  check log file: %s' % lvs_log)
+    else:
+        print('lvs passed')
+        print('lvs log is ' + lvs_log)
+
+
+def simulate(prj, specs, dsn_name, corners_per_shard=None, sweep_shards=()):
+    if corners_per_shard is not None or sweep_shards:
+        return simulate_sharded(prj, specs, dsn_name, corners_per_shard=corners_per_shard,
+                                sweep_shards=sweep_shards)
+
+    tb_dict = setup_testbenches(prj, specs, dsn_name)
+    return run_testbenches(specs, dsn_name, tb_dict)
+
+
+def simulate_sharded(prj, specs, dsn_name, corners_per_shard=1, sweep_shards=()):
+    from bag.data import load_sim_file, save_sim_results
+    from bag.concurrent.core import batch_async_task
+
+    # split each testbench into shards of corners and outer sweep values.  Each shard has
+    # its own testbench cell, generated by gen_tb_schematics() with the same sharding options.
+    shard_dict = {config['tb_name']: (config, make_shard_jobs(config, corners_per_shard=corners_per_shard,
+                                                              sweep_shards=sweep_shards))
+                  for config in make_testbench_jobs(specs, dsn_name)}
+
+    # setup edits the testbench state of the shard cell in the database
+    job_list = []
+    for config, shard_configs in shard_dict.values():
+        for shard_config in shard_configs:
+            os.makedirs(os.path.dirname(shard_config['data_fname']), exist_ok=True)
+            tb = setup_testbench(prj, shard_config['impl_lib'], shard_config['gen_cell'],
+                                 shard_config['tb_gen_cell'], shard_config['tb_params'],
+                                 shard_config['view_name'], shard_config['sim_envs'],
+                                 tb_sweeps=shard_config['tb_sweeps'])
+            job_list.append((tb, shard_config['data_fname']))
+
+    # BagProject is not thread-safe, so run the shards as concurrent tasks of one event loop
+    print('running %d simulation shards' % len(job_list))
+    for result in batch_async_task([tb.async_run_simulation() for tb, _ in job_list]):
+        if isinstance(result, Exception):
+            raise result
+    for tb, data_fname in job_list:
+        save_testbench_results(tb, data_fname)
+
+    # merge shards into one file per testbench, the same as an unsharded simulation
+    results_dict = {}
+    for name, (config, shard_configs) in shard_dict.items():
+        print('merging %d shards into %s' % (len(shard_configs), config['data_fname']))
+        results_dict[name] = merge_shard_files(shard_configs, config['data_fname'], load_fun=load_sim_file,
+                                               save_fun=save_sim_results)
 
-        tb_dsn = prj.create_design_module(tb_lib, tb_cell)
-        print('computing %s schematics' % tb_gen_cell)
-        tb_dsn.design(dut_lib=impl_lib, dut_cell=gen_cell, **tb_sch_params)
-        print('creating %s schematics' % tb_gen_cell)
-        tb_dsn.implement_design(impl_lib, top_cell_name=tb_gen_cell)
+    print('all simulation done')
 
-    print('schematic done')
+    return results_dict
 
 
-def simulate(prj, specs, dsn_name):
+def setup_testbenches(prj, specs, dsn_name):
     view_name = specs['view_name']
     sim_envs = specs['sim_envs']
     dsn_specs = specs[dsn_name]
 
-    data_dir = dsn_specs['data_dir']
     impl_lib = dsn_specs['impl_lib']
     gen_cell = dsn_specs['gen_cell']
     testbenches = dsn_specs['testbenches']
 
-    results_dict = {}
+    tb_dict = {}
     for name, info in testbenches.items():
-        tb_params = info['tb_params']
         tb_gen_cell = '%s_%s' % (gen_cell, name)
-
-        # setup testbench ADEXL state
-        print('setting up %s' % tb_gen_cell)
-        tb = prj.configure_testbench(impl_lib, tb_gen_cell)
-        # set testbench parameters values
-        for key, val in tb_params.items():
-            tb.set_parameter(key, val)
-        # set config view, i.e. schematic vs extracted
-        tb.set_simulation_view(impl_lib, gen_cell, view_name)
-        # set process corners
-        tb.set_simulation_environments(sim_envs)
-        # commit changes to ADEXL state back to database
-        tb.update_testbench()
-        # start simulation
-        print('running simulation')
-        tb.run_simulation()
-        # import simulation results to Python
-        print('simulation done, load results')
-        results = load_sim_results(tb.save_dir)
-        # save simulation data as HDF5 format
-        save_sim_results(results, os.path.join(data_dir, '%s.hdf5' % tb_gen_cell))
-
-        results_dict[name] = results
-
-    print('all simulation done')
-
-    return results_dict
-
-
-def load_sim_data(specs, dsn_name):
+        tb_dict[name] = setup_testbench(prj, impl_lib, gen_cell, tb_gen_cell, info['tb_params'], view_name,
+                                        sim_envs, tb_sweeps=info.get('tb_sweeps', None))
+
+    return tb_dict
+
+
+def setup_testbench(prj, impl_lib, gen_cell, tb_gen_cell, tb_params, view_name, sim_envs, tb_sweeps=None):
+    # setup testbench ADEXL state
+    print('setting up %s' % tb_gen_cell)
+    tb = prj.configure_testbench(impl_lib, tb_gen_cell)
+    # set testbench parameters values
+    for key, val in tb_params.items():
+        tb.set_parameter(key, val)
+    # parameters swept by the simulator
+    if tb_sweeps:
+        for key, val_list in tb_sweeps.items():
+            tb.set_sweep_parameter(key, values=list(val_list))
+    # set config view, i.e. schematic vs extracted
+    tb.set_simulation_view(impl_lib, gen_cell, view_name)
+    # set process corners
+    tb.set_simulation_environments(list(sim_envs))
+    # commit changes to ADEXL state back to database
+    tb.update_testbench()
+    return tb
+
+
+def run_testbenches(specs, dsn_name, tb_dict):
     dsn_specs = specs[dsn_name]
+
     data_dir = dsn_specs['data_dir']
     gen_cell = dsn_specs['gen_cell']
-    testbenches = dsn_specs['testbenches']
 
     results_dict = {}
-    for name, info in testbenches.items():
+    for name, tb in tb_dict.items():
         tb_gen_cell = '%s_%s' % (gen_cell, name)
-        fname = os.path.join(data_dir, '%s.hdf5' % tb_gen_cell)
-        print('loading simulation data for %s' % tb_gen_cell)
-        results_dict[name] = load_sim_file(fname)
+        results_dict[name] = run_testbench(tb, os.path.join(data_dir, '%s.hdf5' % tb_gen_cell))
 
-    print('finish loading data')
+    print('all simulation done')
 
     return results_dict
 
 
-def split_data_by_sweep(results, var_list):
-    sweep_names = results['sweep_params'][var_list[0]][:-1]
-    combo_list = []
-    for name in sweep_names:
-        combo_list.append(range(results[name].size))
+def run_testbench(tb, data_fname):
+    # start simulation
+    print('running simulation, results will be saved to %s' % data_fname)
+    tb.run_simulation()
+    print('simulation done, load results')
+    return save_testbench_results(tb, data_fname)
 
-    if combo_list:
-        idx_list_iter = product(*combo_list)
-    else:
-        idx_list_iter = [[]]
-
-    ans_list = []
-    for idx_list in idx_list_iter:
-        cur_label_list = []
-        for name, idx in zip(sweep_names, idx_list):
-            swp_val = results[name][idx]
-            if isinstance(swp_val, str):
-                cur_label_list.append('%s=%s' % (name, swp_val))
-            else:
-                cur_label_list.append('%s=%.4g' % (name, swp_val))
-
-        if cur_label_list:
-            label = ', '.join(cur_label_list)
-        else:
-            label = ''
-
-        cur_idx_list = list(idx_list)
-        cur_idx_list.append(slice(None))
-
-        cur_results = {var: results[var][cur_idx_list] for var in var_list}
-        ans_list.append((label, cur_results))
-
-    return ans_list
-
-
-def process_tb_dc(tb_results, plot=True):
-    result_list = split_data_by_sweep(tb_results, ['vin', 'vout'])
-
-    plot_data_list = []
-    for label, res_dict in result_list:
-        cur_vin = res_dict['vin']
-        cur_vout = res_dict['vout']
-
-        cur_vin, vin_arg = np.unique(cur_vin, return_index=True)
-        cur_vout = cur_vout[vin_arg]
-        vout_fun = interp.InterpolatedUnivariateSpline(cur_vin, cur_vout)
-        vout_diff_fun = vout_fun.derivative(1)
-
-        print('%s, gain=%.4g' % (label, vout_diff_fun([0])))
-        plot_data_list.append((label, cur_vin, cur_vout, vout_diff_fun(cur_vin)))
-
-    if plot:
-        f, (ax1, ax2) = plt.subplots(2, sharex='all')
-        ax1.set_title('Vout vs Vin')
-        ax1.set_ylabel('Vout (V)')
-        ax2.set_title('Gain vs Vin')
-        ax2.set_ylabel('Gain (V/V)')
-        ax2.set_xlabel('Vin (V)')
-
-        for label, vin, vout, vdiff in plot_data_list:
-            if label:
-                ax1.plot(cur_vin, cur_vout, label=label)
-                ax2.plot(cur_vin, vout_diff_fun(cur_vin), label=label)
-            else:
-                ax1.plot(cur_vin, cur_vout)
-                ax2.plot(cur_vin, vout_diff_fun(cur_vin))
-
-        if len(result_list) > 1:
-            ax1.legend()
-            ax2.legend()
-
-
-def process_tb_ac(tb_results, plot=True):
-    result_list = split_data_by_sweep(tb_results, ['vout_ac'])
-
-    freq = tb_results['freq']
-    log_freq = np.log10(freq)
-    plot_data_list = []
-    for label, res_dict in result_list:
-        cur_vout = res_dict['vout_ac']
-        cur_mag = 20 * np.log10(np.abs(cur_vout))  # type: np.ndarray
-        cur_ang = np.angle(cur_vout, deg=True)
-
-        # interpolate log-log plot
-        mag_fun = interp.InterpolatedUnivariateSpline(log_freq, cur_mag)
-        ang_fun = interp.InterpolatedUnivariateSpline(log_freq, cur_ang)
-        # find 3db and unity gain frequency
-        dc_gain = cur_mag[0]
-        lf0 = log_freq[0]
-        lf1 = log_freq[-1]
-        try:
-            lf_3db = sciopt.brentq(lambda x: mag_fun(x) - (dc_gain - 3), lf0, lf1)  # type: float
-            freq_3db = 10.0 ** lf_3db
-        except ValueError:
-            freq_3db = -1
-        try:
-            # noinspection PyTypeChecker
-            lf_unity = sciopt.brentq(mag_fun, lf0, lf1)  # type: float
-            freq_unity = 10.0 ** lf_unity
-        except ValueError:
-            lf_unity = 0
-            freq_unity = -1
-
-        # find phase margin
-        if freq_unity > 0:
-            # noinspection PyTypeChecker
-            pm = 180 + ang_fun(lf_unity) - ang_fun(lf0)
-        else:
-            pm = 360
-
-        print('%s, f_3db=%.4g, f_unity=%.4g, phase_margin=%.4g' % (label, freq_3db, freq_unity, pm))
-        plot_data_list.append((label, cur_mag, cur_ang))
-
-    if plot:
-        f, (ax1, ax2) = plt.subplots(2, sharex='all')
-        ax1.set_title('Magnitude vs Frequency')
-        ax1.set_ylabel('Magnitude (dB)')
-        ax2.set_title('Phase vs Frequency')
-        ax2.set_ylabel('Phase (Degrees)')
-        ax2.set_xlabel('Frequency (Hz)')
-
-        for label, cur_mag, cur_ang in plot_data_list:
-            if label:
-                ax1.semilogx(freq, cur_mag, label=label)
-                ax2.semilogx(freq, cur_ang, label=label)
-            else:
-                ax1.semilogx(freq, cur_mag)
-                ax2.semilogx(freq, cur_ang)
 
-        if len(result_list) > 1:
-            ax1.legend()
-            ax2.legend()
+def save_testbench_results(tb, data_fname):
+    from bag.data import load_sim_results, save_sim_results
 
+    # import simulation results to Python
+    results = load_sim_results(tb.save_dir)
+    # save simulation data as HDF5 format.  Write to a temporary file first, so a job re-run
+    # by another worker never leaves a partial file.
+    tmp_fname = '%s.%d.tmp' % (data_fname, os.getpid())
+    save_sim_results(results, tmp_fname)
+    os.replace(tmp_fname, data_fname)
+    return results
 
-def process_tb_tran(tb_results, plot=True):
-    result_list = split_data_by_sweep(tb_results, ['vout_tran'])
 
-    tvec = tb_results['time']
-    plot_data_list = []
-    for label, res_dict in result_list:
-        cur_vout = res_dict['vout_tran']
+def run_testbench_job(prj, config):
+    # config is a job created by xbase_demo.jobqueue.make_testbench_jobs()
+    tb = setup_testbench(prj, config['impl_lib'], config['gen_cell'], config['tb_gen_cell'],
+                         config['tb_params'], config['view_name'], config['sim_envs'],
+                         tb_sweeps=config.get('tb_sweeps', None))
+    run_testbench(tb, config['data_fname'])
+    return dict(data_fname=config['data_fname'])
 
-        plot_data_list.append((label, cur_vout))
 
-    if plot:
-        plt.figure()
-        plt.title('Vout vs Time')
-        plt.ylabel('Vout (V)')
-        plt.xlabel('Time (s)')
+def load_sim_data(specs, dsn_name, load_fun=None):
+    # load_fun reads one result file.  Defaults to bag.data.load_sim_file.
+    if load_fun is None:
+        from bag.data import load_sim_file
+        load_fun = load_sim_file
 
-        for label, cur_vout in plot_data_list:
-            if label:
-                plt.plot(tvec, cur_vout, label=label)
-            else:
-                plt.plot(tvec, cur_vout)
+    dsn_specs = specs[dsn_name]
+    data_dir = dsn_specs['data_dir']
+    gen_cell = dsn_specs['gen_cell']
+    testbenches = dsn_specs['testbenches']
 
-        if len(result_list) > 1:
-            plt.legend()
+    results_dict = {}
+    for name, info in testbenches.items():
+        tb_gen_cell = '%s_%s' % (gen_cell, name)
+        fname = os.path.join(data_dir, '%s.hdf5' % tb_gen_cell)
+        print('loading simulation data for %s' % tb_gen_cell)
+        results_dict[name] = load_fun(fname)
 
+    print('finish loading data')
 
-def plot_data(results_dict, plot=True):
-    process_tb_dc(results_dict['tb_dc'], plot=plot)
-    process_tb_ac(results_dict['tb_ac_tran'], plot=plot)
-    process_tb_tran(results_dict['tb_ac_tran'], plot=plot)
+    return results_dict
 
-    if plot:
-        plt.show()
 
+def run_flow(prj, specs, dsn_name, lay_cls, sch_cls=None, run_lvs=True, lvs_only=False,
+             reuse_masters=False, skip_unchanged=False, batch_schematics=False, async_lvs=False):
+    if async_lvs and run_lvs and not lvs_only:
+        if skip_unchanged or batch_schematics:
+            raise ValueError('async_lvs cannot be combined with skip_unchanged or batch_schematics.')
+        _run_flow_async_lvs(prj, specs, dsn_name, lay_cls, sch_cls=sch_cls, reuse_masters=reuse_masters)
+        return
 
-def run_flow(prj, specs, dsn_name, lay_cls, sch_cls=None, run_lvs=True, lvs_only=False):
     # generate layout, get schematic parameters from layout
-    dsn_sch_params = gen_layout(prj, specs, dsn_name, lay_cls)
+    dsn_sch_params = gen_layout(prj, specs, dsn_name, lay_cls, reuse_masters=reuse_masters)
     # generate design/testbench schematics
     gen_schematics(prj, specs, dsn_name, dsn_sch_params, sch_cls=sch_cls,
-                   check_lvs=run_lvs, lvs_only=lvs_only)
+                   check_lvs=run_lvs, lvs_only=lvs_only, skip_unchanged=skip_unchanged,
+                   batch=batch_schematics)
 
     if lvs_only:
         # return if we're only running LVS
@@ -389,3 +515,68 @@ def run_flow(prj, specs, dsn_name, lay_cls, sch_cls=None, run_lvs=True, lvs_only
     res_dict = load_sim_data(specs, dsn_name)
     # post-process simulation results
     plot_data(res_dict)
+
+
+def _run_flow_async_lvs(prj, specs, dsn_name, lay_cls, sch_cls=None, reuse_masters=False):
+    dsn_specs = specs[dsn_name]
+    impl_lib = dsn_specs['impl_lib']
+    gen_cell = dsn_specs['gen_cell']
+
+    # step name -> (start time, end time), relative to the flow start
+    timing = {}
+    t_start = time.time()
+
+    def timed(step, fun, *args, **kwargs):
+        t0 = time.time() - t_start
+        ans = fun(*args, **kwargs)
+        timing[step] = (t0, time.time() - t_start)
+        return ans
+
+    dsn_sch_params = timed('layout', gen_layout, prj, specs, dsn_name, lay_cls, reuse_masters=reuse_masters)
+    timed('dut_schematic', gen_dut_schematic, prj, specs, dsn_name, dsn_sch_params, sch_cls=sch_cls)
+    # LVS only needs the DUT layout and schematic, so run it in the background while
+    # testbenches are created and configured.  Only the simulations wait for LVS.
+    # prj is not thread-safe, so LVS runs in a separate process with its own BagProject.
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        lvs_future = executor.submit(_run_lvs_job, impl_lib, gen_cell)
+        timed('tb_schematics', gen_tb_schematics, prj, specs, dsn_name)
+        tb_dict = timed('tb_setup', setup_testbenches, prj, specs, dsn_name)
+        lvs_t0, lvs_t1 = timed('lvs_wait', lvs_future.result)
+        timing['lvs'] = (lvs_t0 - t_start, lvs_t1 - t_start)
+    timed('simulation', run_testbenches, specs, dsn_name, tb_dict)
+
+    _print_critical_path(timing)
+
+    res_dict = load_sim_data(specs, dsn_name)
+    plot_data(res_dict)
+
+
+def _run_lvs_job(impl_lib, gen_cell, prj_factory=None):
+    # runs in a separate process, with its own database connection.  Returns start
+    # and end time of LVS, including the connection setup.  prj_factory, if given,
+    # creates the project instead of BagProject.
+    if prj_factory is None:
+        from bag import BagProject
+        prj_factory = BagProject
+
+    t0 = time.time()
+    _run_lvs(prj_factory(), impl_lib, gen_cell)
+    return t0, time.time()
+
+
+def _print_critical_path(timing):
+    print('flow timing:')
+    for step in ('layout', 'dut_schematic', 'lvs', 'tb_schematics', 'tb_setup', 'lvs_wait', 'simulation'):
+        t0, t1 = timing[step]
+        print('  %-14s start=%9.3fs end=%9.3fs elapsed=%9.3fs' % (step, t0, t1, t1 - t0))
+
+    lvs_end = timing['lvs'][1]
+    setup_end = timing['tb_setup'][1]
+    if lvs_end > setup_end:
+        path = ['layout', 'dut_schematic', 'lvs', 'simulation']
+    else:
+        path = ['layout', 'dut_schematic', 'tb_schematics', 'tb_setup', 'simulation']
+    serial = sum(timing[step][1] - timing[step][0] for step in timing if step != 'lvs_wait')
+    print('critical path: %s' % ' -> '.join(path))
+    print('total=%.3fs, serial=%.3fs, saved=%.3fs' % (timing['simulation'][1], serial,
+                                                     serial - timing['simulation'][1]))
@@ -65,6 +65,7 @@ def change_x_to_ibias_mirror(mos_db, vgs_res, vbs, vds, num_ib_samp=200):
     results['vgs'] = vgs_mat
 
     xmat = np.empty((num_ib_samp, 3))
+    xmat[:, 0] = vbs
     xmat[:, 1] = vds
     for fun_name in ('gm', 'gds', 'cdd', 'css'):
         new_mat = np.empty(new_shape)
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""Cached transistor characterization databases.
+
+Creating a MOSDBDiscrete reads all characterization data and fits the
+interpolators, which takes seconds.  :func:`get_mos_db` keeps every database
+created in this process, and pickles fitted databases to snapshot files keyed
+by the constructor arguments and the characterization data file stamps, so
+new processes skip the fitting too.
+
+:func:`batch_query` evaluates small-signal parameters of many bias points,
+intents and corners with one interpolator call per (intent, corner) pair.
+:func:`eval_grid` evaluates a function over a (vds, vgs) grid in fixed size
+tiles, without building the mesh.
+
+A MOSDBDiscrete is stateful: queries depend on its env_list and design
+parameters, which :func:`batch_query` and callers change.  The databases
+returned by :func:`get_mos_db` are shared by every caller in the process and
+are not thread-safe.  Threads that query the same database must serialize
+their accesses, including the env_list and set_dsn_params() calls, or use
+copy.deepcopy() to get a private database.  Separate processes are safe.
+"""
+
+import os
+import pickle
+import hashlib
+
+import numpy as np
+import yaml
+
+from ..cache import get_cache_dir, is_private_dir
+
+# functions evaluated by batch_query() by default
+ss_fun_names = ('ibias', 'gm', 'gds', 'cdd', 'css')
+
+# database key -> MOSDBDiscrete
+_db_cache = {}
+
+
+def _get_data_dirs(spec_list):
+    """Returns the directories holding the characterization data of the given spec files."""
+    dir_list = []
+    for spec in spec_list:
+        if os.path.isdir(spec):
+            dir_list.append(spec)
+            continue
+        dir_list.append(os.path.dirname(spec))
+        with open(spec, 'r') as f:
+            root_dir = (yaml.safe_load(f) or {}).get('root_dir', None)
+        if root_dir:
+            dir_list.append(os.path.abspath(root_dir))
+    return dir_list
+
+
+def _get_data_stamp(spec_list):
+    """Returns the name, modification time and size of all characterization data files."""
+    stamp = []
+    for root_dir in _get_data_dirs(spec_list):
+        for dir_path, dir_names, file_names in os.walk(root_dir):
+            dir_names.sort()
+            for name in sorted(file_names):
+                fname = os.path.join(dir_path, name)
+                st = os.stat(fname)
+                stamp.append((fname, st.st_mtime_ns, st.st_size))
+    return stamp
+
+
+def _read_snapshot(snap_fname):
+    try:
+        with open(snap_fname, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+        return None
+
+
+def _write_snapshot(snap_fname, stamp, mos_db):
+    try:
+        # write to a temporary file first, so concurrent readers never see partial snapshots.
+        tmp_fname = '%s.%d.tmp' % (snap_fname, os.getpid())
+        with open(tmp_fname, 'wb') as f:
+            pickle.dump((stamp, mos_db), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fname, snap_fname)
+    except (OSError, TypeError, AttributeError, pickle.PicklingError):
+        # snapshots are only an optimization
+        pass
+
+
+def get_mos_db(w_list, spec_list, w_res, method='spline', cfit_method='average', cache_dir=None):
+    """Returns the transistor database with the given parameters, creating it if needed.
+
+    The database is shared by all callers in this process, so callers should always set
+    env_list and design parameters before querying it.  It is not thread-safe; see the
+    module documentation.
+
+    Snapshots are only read from and written to a cache directory that is owned by the
+    current user and not writable by others, since they are unpickled.
+
+    Parameters
+    ----------
+    w_list : list[int or float]
+        list of transistor widths.
+    spec_list : list[str]
+        list of characterization specification files.
+    w_res : int or float
+        the width resolution.
+    method : str
+        the interpolation method.
+    cfit_method : str
+        the capacitance fitting method.
+    cache_dir : str or None
+        the snapshot directory.  Defaults to the mos_db cache directory.
+
+    Returns
+    -------
+    mos_db : :class:`ckt_dsn_ec.mos.core.MOSDBDiscrete`
+        the transistor database.
+    """
+    spec_list = tuple(os.path.abspath(spec) for spec in spec_list)
+    key = (tuple(w_list), spec_list, w_res, method, cfit_method)
+    mos_db = _db_cache.get(key, None)
+    if mos_db is not None:
+        return mos_db
+
+    stamp = _get_data_stamp(spec_list)
+    cache_dir = cache_dir or get_cache_dir('mos_db')
+    use_snapshot = is_private_dir(cache_dir)
+    snap_fname = os.path.join(cache_dir, '%s.pkl' % hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+    snapshot = _read_snapshot(snap_fname) if use_snapshot else None
+    if snapshot is not None and snapshot[0] == stamp:
+        mos_db = snapshot[1]
+    else:
+        from ckt_dsn_ec.mos.core import MOSDBDiscrete
+
+        mos_db = MOSDBDiscrete(list(w_list), list(spec_list), w_res, method=method,
+                               cfit_method=cfit_method)
+        if use_snapshot:
+            _write_snapshot(snap_fname, stamp, mos_db)
+
+    _db_cache[key] = mos_db
+    return mos_db
+
+
+def clear_mos_db_cache():
+    """Forget all transistor databases created in this process."""
+    _db_cache.clear()
+
+
+def batch_query(mos_db, vbs, vds, vgs, intent, env, fun_list=ss_fun_names):
+    """Evaluate transistor functions at many bias points at once.
+
+    All arguments except mos_db and fun_list are broadcast against each other, so
+    for example a scalar intent applies to all bias points.  This method changes the
+    env_list and intent of mos_db, so it must not run concurrently with other queries
+    on the same database.
+
+    Parameters
+    ----------
+    mos_db : :class:`ckt_dsn_ec.mos.core.MOSDBDiscrete`
+        the transistor database.
+    vbs : np.ndarray
+        body-source voltages.
+    vds : np.ndarray
+        drain-source voltages.
+    vgs : np.ndarray
+        gate-source voltages.
+    intent : np.ndarray
+        threshold flavor of each bias point.
+    env : np.ndarray
+        process corner of each bias point.
+    fun_list : list[str]
+        names of the functions to evaluate.
+
+    Returns
+    -------
+    results : np.ndarray
+        a structured array with the broadcast shape of the arguments.  Has fields
+        'vbs', 'vds', 'vgs', 'intent', 'env', and one float field per function.
+    """
+    vbs, vds, vgs, intent, env = np.broadcast_arrays(np.asarray(vbs, dtype=float),
+                                                     np.asarray(vds, dtype=float),
+                                                     np.asarray(vgs, dtype=float),
+                                                     np.asarray(intent, dtype=str),
+                                                     np.asarray(env, dtype=str))
+    dtype = [('vbs', float), ('vds', float), ('vgs', float), ('intent', intent.dtype),
+             ('env', env.dtype)]
+    dtype.extend(((name, float) for name in fun_list))
+    results = np.empty(vbs.shape, dtype=dtype)
+    flat = results.reshape(-1)
+    for name, val in (('vbs', vbs), ('vds', vds), ('vgs', vgs), ('intent', intent), ('env', env)):
+        flat[name] = val.reshape(-1)
+    if flat.size == 0:
+        return results
+
+    xmat = np.empty((flat.size, 3))
+    for name in ('vbs', 'vds', 'vgs'):
+        xmat[:, mos_db.get_fun_arg_index(name)] = flat[name]
+
+    # sort bias points by (intent, env), then evaluate each group with one call per function
+    intent_vals, intent_codes = np.unique(flat['intent'], return_inverse=True)
+    env_vals, env_codes = np.unique(flat['env'], return_inverse=True)
+    codes = intent_codes.reshape(-1) * env_vals.size + env_codes.reshape(-1)
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    stops = np.r_[starts[1:], codes.size]
+    for start, stop in zip(starts, stops):
+        code = sorted_codes[start]
+        idx = order[start:stop]
+        mos_db.env_list = [str(env_vals[code % env_vals.size])]
+        mos_db.set_dsn_params(intent=str(intent_vals[code // env_vals.size]))
+        cur_x = xmat[idx]
+        for name in fun_list:
+            flat[name][idx] = np.asarray(mos_db.get_function(name)(cur_x)).reshape(-1)
+
+    return results
+
+
+def eval_grid(mos_db, name, vbs, vds_vec, vgs_vec, tile_size=65536, out=None):
+    """Evaluate a transistor function over a (vds, vgs) grid, in all corners of env_list.
+
+    The grid is evaluated in tiles of at most tile_size points, so besides the output,
+    memory usage does not depend on the grid size.
+
+    Parameters
+    ----------
+    mos_db : :class:`ckt_dsn_ec.mos.core.MOSDBDiscrete`
+        the transistor database.
+    name : str
+        the function name.
+    vbs : float
+        the body-source voltage.
+    vds_vec : np.ndarray
+        the drain-source voltages.
+    vgs_vec : np.ndarray
+        the gate-source voltages.
+    tile_size : int
+        maximum number of points evaluated at once.
+    out : np.ndarray or None
+        a C-contiguous array of shape (len(vds_vec), len(vgs_vec), len(mos_db.env_list)) to
+        store the results in, such as a memory mapped array.  Allocated if not given.
+
+    Returns
+    -------
+    out : np.ndarray
+        function values, with shape (len(vds_vec), len(vgs_vec), len(mos_db.env_list)).
+    """
+    vds_vec = np.asarray(vds_vec, dtype=float).reshape(-1)
+    vgs_vec = np.asarray(vgs_vec, dtype=float).reshape(-1)
+    num_env = len(mos_db.env_list)
+    shape = (vds_vec.size, vgs_vec.size, num_env)
+    if out is None:
+        out = np.empty(shape)
+    elif out.shape != shape or not out.flags.c_contiguous:
+        raise ValueError('out must be a C-contiguous array with shape %s' % (shape,))
+
+    fun = mos_db.get_function(name)
+    vds_idx = mos_db.get_fun_arg_index('vds')
+    vgs_idx = mos_db.get_fun_arg_index('vgs')
+    num_pts = vds_vec.size * vgs_vec.size
+    out_flat = out.reshape(num_pts, num_env)
+    xbuf = np.empty((min(tile_size, num_pts), 3))
+    xbuf[:, mos_db.get_fun_arg_index('vbs')] = vbs
+    for start in range(0, num_pts, tile_size):
+        stop = min(start + tile_size, num_pts)
+        pt_idx = np.arange(start, stop)
+        xmat = xbuf[:stop - start]
+        xmat[:, vds_idx] = vds_vec[pt_idx // vgs_vec.size]
+        xmat[:, vgs_idx] = vgs_vec[pt_idx % vgs_vec.size]
+        out_flat[start:stop] = np.asarray(fun(xmat)).reshape(stop - start, num_env)
+
+    return out
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""Precomputed transistor lookup tables.
+
+:func:`build_mos_table` samples a transistor database on a regular
+(vbs, vds, vgs) grid for every intent and corner, and saves one ``.npy``
+array per function in a table directory, together with a JSON header
+describing the grid.  gm/Id and current density are stored too.
+
+:class:`MOSTable` memory maps these arrays, so any number of processes can
+share one page-cached table, and looks up values with multilinear
+interpolation.  Since the grid is regular, finding the grid cell of a bias
+point takes constant time.
+"""
+
+import os
+import json
+
+import numpy as np
+
+from .mos_db import ss_fun_names
+
+_header_fname = 'header.json'
+
+# functions computed from sampled ones: gm/ibias, and ibias/w
+derived_fun_names = ('gm_id', 'id_w')
+
+
+def _get_axis(mos_db, name, spec):
+    """Returns (start, stop, num) of a grid axis.  An integer spec samples the full input range."""
+    if isinstance(spec, int):
+        arg_idx = mos_db.get_fun_arg_index(name)
+        start, stop = mos_db.get_function('ibias').get_input_range(arg_idx)
+        return float(start), float(stop), spec
+    start, stop, num = spec
+    if num < 1 or (num == 1 and start != stop):
+        raise ValueError('Invalid %s axis: %s' % (name, spec))
+    return float(start), float(stop), int(num)
+
+
+def build_mos_table(mos_db, root_dir, w, intent_list, env_list, vbs=(0.0, 0.0, 1), vds=101, vgs=201,
+                    fun_list=ss_fun_names):
+    """Sample a transistor database on a regular grid and save it as a lookup table.
+
+    Parameters
+    ----------
+    mos_db : :class:`ckt_dsn_ec.mos.core.MOSDBDiscrete`
+        the transistor database.
+    root_dir : str
+        the table directory.
+    w : int or float
+        the transistor width.
+    intent_list : list[str]
+        the threshold flavors to sample.
+    env_list : list[str]
+        the process corners to sample.
+    vbs : int or tuple[float, float, int]
+        the vbs axis as (start, stop, number of points), or the number of points spanning
+        the whole input range.
+    vds : int or tuple[float, float, int]
+        the vds axis.
+    vgs : int or tuple[float, float, int]
+        the vgs axis.
+    fun_list : list[str]
+        names of the functions to sample.  If ibias and gm are both sampled, gm/Id and
+        the current density ibias/w are saved too.
+
+    Returns
+    -------
+    table : MOSTable
+        the new lookup table.
+    """
+    axes = [_get_axis(mos_db, name, spec) for name, spec in (('vbs', vbs), ('vds', vds), ('vgs', vgs))]
+    vbs_vec, vds_vec, vgs_vec = [np.linspace(*axis) for axis in axes]
+    grid_shape = (len(vds_vec), len(vgs_vec))
+    shape = (len(intent_list), len(env_list), len(vbs_vec)) + grid_shape
+
+    os.makedirs(root_dir, exist_ok=True)
+    name_list = list(fun_list)
+    if 'ibias' in fun_list and 'gm' in fun_list:
+        name_list.extend(derived_fun_names)
+    tables = {name: np.lib.format.open_memmap(os.path.join(root_dir, '%s.npy' % name), mode='w+',
+                                              dtype=np.float64, shape=shape)
+              for name in name_list}
+
+    # one (vds, vgs) plane at a time, so memory usage does not depend on the number of vbs points.
+    xmat = np.empty((grid_shape[0] * grid_shape[1], 3))
+    xmat[:, mos_db.get_fun_arg_index('vds')] = np.repeat(vds_vec, grid_shape[1])
+    xmat[:, mos_db.get_fun_arg_index('vgs')] = np.tile(vgs_vec, grid_shape[0])
+    vbs_idx = mos_db.get_fun_arg_index('vbs')
+    mos_db.env_list = list(env_list)
+    for intent_idx, intent in enumerate(intent_list):
+        mos_db.set_dsn_params(w=w, intent=intent)
+        fun_table = {name: mos_db.get_function(name) for name in fun_list}
+        for vbs_i, vbs_val in enumerate(vbs_vec):
+            xmat[:, vbs_idx] = vbs_val
+            for name, fun in fun_table.items():
+                # function output has shape (num_points, num_env)
+                val = np.asarray(fun(xmat)).reshape(-1, len(env_list))
+                tables[name][intent_idx, :, vbs_i] = val.T.reshape((len(env_list),) + grid_shape)
+
+    if len(name_list) > len(fun_list):
+        ibias = tables['ibias']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for intent_idx in range(len(intent_list)):
+                cur_ib = ibias[intent_idx]
+                tables['gm_id'][intent_idx] = np.where(cur_ib != 0, tables['gm'][intent_idx] / cur_ib, np.nan)
+                tables['id_w'][intent_idx] = cur_ib / w
+
+    for arr in tables.values():
+        arr.flush()
+    del tables
+
+    # header is written last, so incomplete tables are never loaded
+    header = dict(w=w, intent_list=list(intent_list), env_list=list(env_list),
+                  axes=dict(vbs=axes[0], vds=axes[1], vgs=axes[2]), fun_list=name_list)
+    with open(os.path.join(root_dir, _header_fname), 'w') as f:
+        json.dump(header, f, indent=2)
+
+    return MOSTable(root_dir)
+
+
+class MOSTable(object):
+    """A memory mapped transistor lookup table.
+
+    Parameters
+    ----------
+    root_dir : str
+        the table directory, as written by :func:`build_mos_table`.
+    """
+
+    def __init__(self, root_dir):
+        with open(os.path.join(root_dir, _header_fname), 'r') as f:
+            header = json.load(f)
+
+        self.w = header['w']
+        self.intent_list = header['intent_list']
+        self.env_list = header['env_list']
+        self.fun_list = header['fun_list']
+        self._axes = [header['axes'][name] for name in ('vbs', 'vds', 'vgs')]
+        self._intent_idx = {val: idx for idx, val in enumerate(self.intent_list)}
+        self._env_idx = {val: idx for idx, val in enumerate(self.env_list)}
+        self._tables = {name: np.load(os.path.join(root_dir, '%s.npy' % name), mmap_mode='r')
+                        for name in self.fun_list}
+
+    def get_axis(self, name):
+        """Returns the grid points of the given axis, one of 'vbs', 'vds', or 'vgs'."""
+        return np.linspace(*self._axes[('vbs', 'vds', 'vgs').index(name)])
+
+    def get_table(self, name):
+        """Returns the sampled values of the given function.
+
+        The array has shape (num_intent, num_env, num_vbs, num_vds, num_vgs).
+        """
+        return self._tables[name]
+
+    @staticmethod
+    def _to_index(val_table, vals, name):
+        vals, codes = np.unique(vals, return_inverse=True)
+        try:
+            idx_list = np.array([val_table[val] for val in vals.tolist()], dtype=np.intp)
+        except KeyError as ex:
+            raise ValueError('%s %s is not in this table.' % (name, ex.args[0]))
+        return idx_list[codes.reshape(-1)]
+
+    def query(self, vbs, vds, vgs, intent, env, fun_list=None):
+        """Look up transistor functions at many bias points at once.
+
+        Values are linearly interpolated in vbs, vds, and vgs.  Bias points outside the
+        table range are clipped to the table boundary.  All arguments except fun_list
+        are broadcast against each other.
+
+        Parameters
+        ----------
+        vbs : np.ndarray
+            body-source voltages.
+        vds : np.ndarray
+            drain-source voltages.
+        vgs : np.ndarray
+            gate-source voltages.
+        intent : np.ndarray
+            threshold flavor of each bias point.
+        env : np.ndarray
+            process corner of each bias point.
+        fun_list : list[str] or None
+            names of the functions to look up.  Defaults to all functions in this table.
+
+        Returns
+        -------
+        results : np.ndarray
+            a structured array with the broadcast shape of the arguments, in the same
+            format as :func:`xbase_demo.demo_dsn.mos_db.batch_query`.
+        """
+        if fun_list is None:
+            fun_list = self.fun_list
+        vbs, vds, vgs, intent, env = np.broadcast_arrays(np.asarray(vbs, dtype=float),
+                                                         np.asarray(vds, dtype=float),
+                                                         np.asarray(vgs, dtype=float),
+                                                         np.asarray(intent, dtype=str),
+                                                         np.asarray(env, dtype=str))
+        dtype = [('vbs', float), ('vds', float), ('vgs', float), ('intent', intent.dtype),
+                 ('env', env.dtype)]
+        dtype.extend(((name, float) for name in fun_list))
+        results = np.empty(vbs.shape, dtype=dtype)
+        flat = results.reshape(-1)
+        for name, val in (('vbs', vbs), ('vds', vds), ('vgs', vgs), ('intent', intent), ('env', env)):
+            flat[name] = val.reshape(-1)
+        if flat.size == 0:
+            return results
+
+        intent_idx = self._to_index(self._intent_idx, flat['intent'], 'intent')
+        env_idx = self._to_index(self._env_idx, flat['env'], 'env')
+
+        # lower grid index and interpolation weight along each axis
+        axis_info = []
+        for (start, stop, num), name in zip(self._axes, ('vbs', 'vds', 'vgs')):
+            if num == 1:
+                idx0 = np.zeros(flat.size, dtype=np.intp)
+                axis_info.append((idx0, idx0, np.zeros(flat.size)))
+            else:
+                pos = np.clip((flat[name] - start) / ((stop - start) / (num - 1)), 0, num - 1)
+                idx0 = np.minimum(pos.astype(np.intp), num - 2)
+                axis_info.append((idx0, idx0 + 1, pos - idx0))
+
+        # flat table index and weight of the 8 grid points surrounding each bias point,
+        # shared by all functions since all tables have the same shape.
+        (b0, b1, wb), (d0, d1, wd), (g0, g1, wg) = axis_info
+        shape = self._tables[self.fun_list[0]].shape
+        corners = []
+        for bi, bw in ((b0, 1 - wb), (b1, wb)):
+            for di, dw in ((d0, 1 - wd), (d1, wd)):
+                for gi, gw in ((g0, 1 - wg), (g1, wg)):
+                    idx = np.ravel_multi_index((intent_idx, env_idx, bi, di, gi), shape)
+                    corners.append((idx, bw * dw * gw))
+
+        for name in fun_list:
+            table = self._tables[name].reshape(-1)
+            val = np.zeros(flat.size)
+            for idx, weight in corners:
+                val += weight * table[idx]
+            flat[name] = val
+
+        return results
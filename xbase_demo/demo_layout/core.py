@@ -9,6 +9,8 @@ from bag.layout.template import TemplateBase
 
 from abs_templates_ec.analog_core import AnalogBase
 
+from .tracks import get_track_index
+
 
 class RoutingDemo(TemplateBase):
     """A template of a single transistor with dummies.
@@ -658,7 +660,9 @@ class AmpChainSoln(TemplateBase):
         cs_params['show_pins'] = False
         sf_params['show_pins'] = False
 
-        # create layout masters for subcells we will add later
+        # create layout masters for subcells we will add later.  The template
+        # database memoizes masters by parameters, so if the database is reused
+        # only the subcell whose parameters changed gets redrawn.
         cs_master = self.new_template(params=cs_params, temp_cls=AmpCS)
         sf_master = self.new_template(params=sf_params, temp_cls=AmpSFSoln)
 
@@ -696,11 +700,12 @@ class AmpChainSoln(TemplateBase):
         vdd1 = sf_inst.get_all_port_pins('VDD')[0]
 
         # get vertical VDD TrackIDs
+        tr_index = get_track_index(self.grid)
         top_w = self.grid.get_track_width(top_layer, 1, unit_mode=True)
         vm_w_vdd = self.grid.get_min_track_width(vm_layer, top_w=top_w, unit_mode=True)
-        vdd0_tid = TrackID(vm_layer, self.grid.coord_to_nearest_track(vm_layer, vdd0.middle),
+        vdd0_tid = TrackID(vm_layer, tr_index.coord_to_nearest_track(vm_layer, vdd0.middle),
                            width=vm_w_vdd)
-        vdd1_tid = TrackID(vm_layer, self.grid.coord_to_nearest_track(vm_layer, vdd1.middle),
+        vdd1_tid = TrackID(vm_layer, tr_index.coord_to_nearest_track(vm_layer, vdd1.middle),
                            width=vm_w_vdd)
 
         # connect VDD of each block to vertical M5
@@ -712,7 +717,7 @@ class AmpChainSoln(TemplateBase):
         vdd = self.connect_to_tracks([vdd0, vdd1], vdd_tid)
 
         # connect vmid using vertical track in the middle of the two templates
-        mid_tid = TrackID(vm_layer, self.grid.coord_to_nearest_track(vm_layer, x0, unit_mode=True))
+        mid_tid = TrackID(vm_layer, tr_index.coord_to_nearest_track(vm_layer, x0, unit_mode=True))
         vmid = self.connect_to_tracks([vmid0, vmid1], mid_tid)
 
         # add pins on wires
@@ -730,3 +735,76 @@ class AmpChainSoln(TemplateBase):
             cs_params=cs_master.sch_params,
             sf_params=sf_master.sch_params,
         )
+
+
+class AmpCSArray(TemplateBase):
+    """An array of common source amplifiers with shared supply and bias rails.
+
+    One AmpCS master is placed as a single arrayed instance, and the VDD, VSS and
+    vbias wires of the first slice are extended across the array, so the cost of
+    routing shared nets does not grow with the number of slices.
+    """
+    def __init__(self, temp_db, lib_name, params, used_names, **kwargs):
+        TemplateBase.__init__(self, temp_db, lib_name, params, used_names, **kwargs)
+        self._sch_params = None
+
+    @property
+    def sch_params(self):
+        return self._sch_params
+
+    @classmethod
+    def get_params_info(cls):
+        return dict(
+            cs_params='common source amplifier parameters.',
+            num_slices='number of amplifier slices.',
+            show_pins='True to draw pin geometries.',
+        )
+
+    def draw_layout(self):
+        """Draw the layout of the amplifier array.
+        """
+
+        cs_params = self.params['cs_params'].copy()
+        num_slices = self.params['num_slices']
+        show_pins = self.params['show_pins']
+
+        if num_slices < 1:
+            raise ValueError('num_slices=%d must be positive.' % num_slices)
+
+        cs_params['show_pins'] = False
+
+        # create the slice master once, and place all slices as one arrayed instance
+        cs_master = self.new_template(params=cs_params, temp_cls=AmpCS)
+        spx = cs_master.bound_box.width_unit
+        cs_inst = self.add_instance(cs_master, 'XCS', nx=num_slices, spx=spx, unit_mode=True)
+
+        # extend the shared horizontal wires of the first slice over all slices
+        ext = (num_slices - 1) * spx
+        rails = {}
+        for name in ('VSS', 'VDD', 'vbias'):
+            rail_list = []
+            for warr in cs_inst.get_port(name).get_pins():
+                tid = warr.track_id
+                rail_list.append(self.add_wires(warr.layer_id, tid.base_index, warr.lower_unit,
+                                                warr.upper_unit + ext, width=tid.width,
+                                                num=tid.num, pitch=tid.pitch, unit_mode=True))
+            rails[name] = rail_list
+
+        # calculate template size
+        hm_layer = rails['VSS'][0].layer_id
+        top_layer = hm_layer + 2
+        self.set_size_from_bound_box(top_layer, cs_inst.bound_box, round_up=True)
+
+        self.add_pin('VSS', rails['VSS'], show=show_pins)
+        self.add_pin('VDD', rails['VDD'], show=show_pins)
+        self.add_pin('vbias', rails['vbias'], show=show_pins)
+        # inputs and outputs are separate nets, re-export them as buses.
+        for col in range(num_slices):
+            self.reexport(cs_inst.get_port('vin', col=col), net_name='vin<%d>' % col, show=show_pins)
+            self.reexport(cs_inst.get_port('vout', col=col), net_name='vout<%d>' % col, show=show_pins)
+
+        # compute schematic parameters.
+        self._sch_params = dict(
+            cs_params=cs_master.sch_params,
+            num_slices=num_slices,
+        )
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Export computed layout templates to a compact binary stream.
+
+:class:`StreamTemplateDB` is a drop-in replacement of
+:class:`bag.layout.template.TemplateDB` whose batch_layout() writes layout
+content to a file instead of the OA database, so layouts can be generated
+on machines without a design database.  Each cell is written as soon as its
+content is computed, so only one cell's content is held in memory at a time.
+See :mod:`xbase_demo.demo_layout.stream` for the file format.
+"""
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+# noinspection PyUnresolvedReferences,PyCompatibility
+from builtins import *
+
+from bag.layout.template import TemplateDB
+
+# noinspection PyUnresolvedReferences
+from .stream import LayoutStreamWriter, iter_layout_stream, diff_layout_streams
+
+# BAG 2.0 TemplateDB has no public hook to export layout content.  StreamTemplateDB
+# overrides TemplateDB._instantiate_master_helper() and
+# TemplateDB.create_masters_in_db(), and relies on batch_layout() calling
+# get_content() on every master and passing the results to create_masters_in_db().
+# This matches the bag.layout.template module of the BAG 2.0 release; check both
+# overrides when upgrading BAG.
+
+
+class StreamTemplateDB(TemplateDB):
+    """A TemplateDB that streams layout content to a file instead of the OA database.
+
+    Parameters
+    ----------
+    fname : str
+        the output stream file name.
+    lib_defs : str
+        path to the template library definition file.
+    routing_grid : :class:`bag.layout.routing.RoutingGrid`
+        the default RoutingGrid object.
+    lib_name : str
+        the cadence library to put all generated templates in.
+    kwargs : dict[str, any]
+        additional arguments for :class:`bag.layout.template.TemplateDB`.
+    """
+
+    def __init__(self, fname, lib_defs, routing_grid, lib_name, **kwargs):
+        kwargs['use_cybagoa'] = False
+        TemplateDB.__init__(self, lib_defs, routing_grid, lib_name, **kwargs)
+        self._stream_fname = fname
+        self._resolution = routing_grid.resolution
+        self._writer = None
+        self._stream_masters = []
+
+    def batch_layout(self, prj, template_list, name_list=None, lib_name='', debug=False, rename_dict=None):
+        """Write the given templates and all their sub-masters to the stream file."""
+        with LayoutStreamWriter(self._stream_fname, self._resolution) as writer:
+            self._writer = writer
+            try:
+                TemplateDB.batch_layout(self, prj, template_list, name_list=name_list, lib_name=lib_name,
+                                        debug=debug, rename_dict=rename_dict)
+            finally:
+                self._writer = None
+                for master in self._stream_masters:
+                    del master.get_content
+                del self._stream_masters[:]
+
+    def _instantiate_master_helper(self, info_dict, master):
+        TemplateDB._instantiate_master_helper(self, info_dict, master)
+        # make each master write its content as soon as it is computed, so the
+        # content list built by TemplateDB only holds cell names.
+        for cur_master in info_dict.values():
+            if 'get_content' not in cur_master.__dict__:
+                cur_master.get_content = self._make_stream_content(cur_master.get_content)
+                self._stream_masters.append(cur_master)
+
+    def _make_stream_content(self, get_content):
+        def stream_content(*args, **kwargs):
+            content = get_content(*args, **kwargs)
+            self._writer.write_cell(*content)
+            return content[0]
+
+        return stream_content
+
+    def create_masters_in_db(self, lib_name, content_list, debug=False, **kwargs):
+        """Cells were already written while their content was computed; nothing left to do."""
+        if debug:
+            print('%d cells written to %s' % (len(content_list), self._stream_fname))
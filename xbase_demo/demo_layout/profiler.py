@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""Opt-in timing instrumentation for layout generators.
+
+This module wraps the hot-path methods of layout template classes
+(draw_base, draw_mos_conn, connect_to_tracks, fill_dummy, ...) with timers
+while a :class:`LayoutProfiler` is active.  Nothing is patched until the
+profiler is entered, and all original methods are restored on exit.
+"""
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+# noinspection PyUnresolvedReferences,PyCompatibility
+from builtins import *
+
+import os
+import json
+import time
+import functools
+from contextlib import contextmanager
+
+# method names instrumented by default.
+default_methods = ('draw_layout', 'new_template', 'add_instance', 'draw_base', 'draw_mos_conn',
+                   'connect_to_tracks', 'connect_wires', 'connect_to_substrate', 'fill_dummy')
+
+# attribute names of layout object lists in BagLayout, used to count created objects.
+_layout_obj_attrs = (('instances', '_inst_list'),
+                     ('rects', '_rect_list'),
+                     ('vias', '_via_list'),
+                     ('pins', '_pin_list'),
+                     )
+
+
+def _count_objects(template):
+    """Returns the number of layout objects created so far in the given template.
+
+    Raises ValueError if the template does not have the private BagLayout object
+    lists of BAG 2.0, since the counts would be meaningless.
+    """
+    layout = getattr(template, '_layout', None)
+    ans = {}
+    for key, attr in _layout_obj_attrs:
+        obj_list = getattr(layout, attr, None)
+        if obj_list is None:
+            raise ValueError('Cannot count layout objects of %s: %s._layout.%s not found.  '
+                             'Use LayoutProfiler(count_objects=False) with this BAG version.' %
+                             (type(template).__name__, type(template).__name__, attr))
+        ans[key] = len(obj_list)
+    return ans
+
+
+class LayoutProfiler(object):
+    """Records wall time, call counts and object counts of layout generation.
+
+    Use as a context manager around layout generation; the given methods of the
+    given template classes are instrumented while the context is active.
+
+    Parameters
+    ----------
+    classes : list[type] or None
+        template classes to instrument.  Defaults to all demo layout generators.
+    methods : list[str] or None
+        method names to instrument.  Defaults to :data:`default_methods`.
+    count_objects : bool
+        True to count the layout objects created by each template.  This reads
+        private attributes of BagLayout, so disable it if they are not available.
+    """
+
+    def __init__(self, classes=None, methods=None, count_objects=True):
+        if classes is None:
+            from .core import RoutingDemo, AmpCS, AmpSF, AmpSFSoln, AmpChain, AmpChainSoln, AmpCSArray
+            classes = [RoutingDemo, AmpCS, AmpSF, AmpSFSoln, AmpChain, AmpChainSoln, AmpCSArray]
+        self._classes = list(classes)
+        self._methods = default_methods if methods is None else tuple(methods)
+        self._count_objects = count_objects
+        self._patched = []
+        self._depth = 0
+        self._stack = []
+        self._child_time = [0.0]
+        # label -> [count, total time, self time, max time]
+        self._call_stats = {}
+        # folded call stack -> self time
+        self._folded = {}
+        # template class name -> dictionary of counts
+        self._temp_stats = {}
+
+    def add_class(self, temp_cls):
+        """Add a template class to instrument.
+
+        If the profiler is active, the class is instrumented right away and restored
+        when the profiler exits.
+        """
+        if temp_cls not in self._classes:
+            self._classes.append(temp_cls)
+            if self._depth > 0:
+                self._patch_class(temp_cls)
+
+    def __enter__(self):
+        if self._depth == 0:
+            self._patch()
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._depth -= 1
+        if self._depth == 0:
+            self._unpatch()
+        return False
+
+    def _patch(self):
+        for temp_cls in self._classes:
+            self._patch_class(temp_cls)
+
+    def _patch_class(self, temp_cls):
+        for name in self._methods:
+            fun = getattr(temp_cls, name, None)
+            if fun is None or getattr(fun, '_layout_profiler', None) is self:
+                continue
+            # remember the class attribute, if any, so we can restore it.
+            orig = temp_cls.__dict__.get(name, None)
+            setattr(temp_cls, name, self._wrap(name, fun))
+            self._patched.append((temp_cls, name, orig))
+
+    def _unpatch(self):
+        for temp_cls, name, orig in reversed(self._patched):
+            if orig is None:
+                delattr(temp_cls, name)
+            else:
+                setattr(temp_cls, name, orig)
+        del self._patched[:]
+
+    def _wrap(self, name, fun):
+        profiler = self
+
+        @functools.wraps(fun)
+        def wrapper(temp, *args, **kwargs):
+            label = '%s.%s' % (type(temp).__name__, name)
+            with profiler.section(label):
+                ans = fun(temp, *args, **kwargs)
+            if name == 'draw_layout':
+                profiler._record_template(temp)
+            return ans
+
+        wrapper._layout_profiler = self
+        return wrapper
+
+    @contextmanager
+    def section(self, label):
+        """Time a block of code as a frame named label in the call stack."""
+        self._stack.append(label)
+        self._child_time.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            child_time = self._child_time.pop()
+            self._child_time[-1] += elapsed
+            self_time = elapsed - child_time
+
+            stats = self._call_stats.get(label, None)
+            if stats is None:
+                self._call_stats[label] = [1, elapsed, self_time, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] += self_time
+                stats[3] = max(stats[3], elapsed)
+
+            key = ';'.join(self._stack)
+            self._folded[key] = self._folded.get(key, 0.0) + self_time
+            self._stack.pop()
+
+    def _record_template(self, temp):
+        cls_name = type(temp).__name__
+        counts = _count_objects(temp) if self._count_objects else {}
+        stats = self._temp_stats.get(cls_name, None)
+        if stats is None:
+            stats = self._temp_stats[cls_name] = dict(count=0, **{key: 0 for key in counts})
+        stats['count'] += 1
+        for key, val in counts.items():
+            stats[key] += val
+
+    def get_summary(self):
+        """Returns a summary of the recorded data.
+
+        Returns
+        -------
+        summary : dict[str, any]
+            dictionary with two entries.  'calls' maps each instrumented call label to
+            its call count and total, self, mean and maximum wall time in seconds.
+            'templates' maps each template class name to the number of masters drawn
+            and, if count_objects is True, the number of instances, rectangles, vias
+            and pins they created.
+        """
+        calls = {}
+        for label, (count, total, self_time, max_time) in self._call_stats.items():
+            calls[label] = dict(count=count, total=total, self=self_time,
+                                mean=total / count, max=max_time)
+        return dict(calls=calls, templates={key: dict(val) for key, val in self._temp_stats.items()})
+
+    def write_json(self, fname):
+        """Write the summary returned by :meth:`get_summary` as a JSON file."""
+        _make_parent_dir(fname)
+        with open(fname, 'w') as f:
+            json.dump(self.get_summary(), f, indent=2, sort_keys=True)
+
+    def write_folded(self, fname):
+        """Write the call stacks in folded format, with self time in microseconds.
+
+        The output can be rendered with flamegraph.pl or loaded in speedscope.
+        """
+        _make_parent_dir(fname)
+        with open(fname, 'w') as f:
+            for key in sorted(self._folded.keys()):
+                f.write('%s %d\n' % (key, int(round(self._folded[key] * 1e6))))
+
+    def print_summary(self, num=20):
+        """Print the num most expensive calls by total time."""
+        calls = self.get_summary()['calls']
+        print('%-48s %8s %12s %12s' % ('call', 'count', 'total (s)', 'self (s)'))
+        for label in sorted(calls.keys(), key=lambda x: -calls[x]['total'])[:num]:
+            info = calls[label]
+            print('%-48s %8d %12.4g %12.4g' % (label, info['count'], info['total'], info['self']))
+
+
+def _make_parent_dir(fname):
+    dir_name = os.path.dirname(os.path.abspath(fname))
+    os.makedirs(dir_name, exist_ok=True)
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""Read and write the compact binary layout stream format.
+
+The file starts with an 8 byte magic string followed by a record stream.
+Every record is a 4 byte tag, a little-endian uint32 payload size and the
+payload.  A cell is a 'CELL' record with a JSON header (cell name, string
+table, per-object parameters, and the paths, blockages, boundaries and
+polygons) followed by one int64 array record per object type ('RECT',
+'VIA ', 'INST', 'PIN ').  All coordinates are in resolution units, and all
+names in the arrays are indices into the cell string table.
+
+This module does not depend on BAG, see :mod:`xbase_demo.demo_layout.export`
+for the TemplateDB that writes these files.
+"""
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+# noinspection PyUnresolvedReferences,PyCompatibility
+from builtins import *
+
+import os
+import json
+import struct
+import hashlib
+from itertools import zip_longest
+
+import numpy as np
+
+_magic = b'XBLAY002'
+_rec_head = struct.Struct('<4sI')
+
+# column names of the integer array stored for each object type.
+rect_columns = ('layer', 'purpose', 'xl', 'yb', 'xr', 'yt', 'nx', 'ny', 'spx', 'spy')
+via_columns = ('via_id', 'x', 'y', 'orient', 'nx', 'ny', 'spx', 'spy')
+inst_columns = ('lib', 'cell', 'name', 'x', 'y', 'orient', 'nx', 'ny', 'spx', 'spy')
+pin_columns = ('net', 'pin', 'label', 'layer', 'purpose', 'xl', 'yb', 'xr', 'yt')
+
+_array_tags = ((b'RECT', 'rects', rect_columns),
+               (b'VIA ', 'vias', via_columns),
+               (b'INST', 'instances', inst_columns),
+               (b'PIN ', 'pins', pin_columns),
+               )
+
+# keys of layout objects with a variable number of points, stored in the cell header.
+shape_keys = ('paths', 'blockages', 'boundaries', 'polygons')
+
+
+class _StringTable(object):
+    """Maps strings to integer indices."""
+
+    def __init__(self):
+        self._lookup = {}
+        self.names = []
+
+    def __getitem__(self, name):
+        idx = self._lookup.get(name, None)
+        if idx is None:
+            idx = self._lookup[name] = len(self.names)
+            self.names.append(name)
+        return idx
+
+
+class LayoutStreamWriter(object):
+    """Writes layout content of each cell to a binary stream.
+
+    Parameters
+    ----------
+    fname : str
+        the output file name.
+    resolution : float
+        the layout resolution.  Coordinates are stored as integer multiples of this value.
+    """
+
+    def __init__(self, fname, resolution):
+        dir_name = os.path.dirname(os.path.abspath(fname))
+        os.makedirs(dir_name, exist_ok=True)
+
+        self._res = resolution
+        self._f = open(fname, 'wb')
+        self._f.write(_magic)
+        self._write_record(b'HEAD', json.dumps(dict(resolution=resolution)).encode('utf-8'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def _write_record(self, tag, payload):
+        self._f.write(_rec_head.pack(tag, len(payload)))
+        self._f.write(payload)
+
+    def _to_unit(self, val):
+        return int(round(val / self._res))
+
+    def _shape_to_unit(self, shape):
+        ans = dict(shape)
+        if 'points' in ans:
+            ans['points'] = [[self._to_unit(x), self._to_unit(y)] for x, y in ans['points']]
+        if 'width' in ans:
+            ans['width'] = self._to_unit(ans['width'])
+        return ans
+
+    def write_cell(self, cell_name, inst_list, rect_list, via_list, pin_list, path_list=None,
+                   blockage_list=None, boundary_list=None, polygon_list=None):
+        """Write the content of one cell, as returned by TemplateBase.get_content()."""
+        to_unit = self._to_unit
+        strs = _StringTable()
+
+        rects = []
+        for rect in rect_list:
+            lay, purp = rect['layer']
+            (x0, y0), (x1, y1) = rect['bbox']
+            rects.append((strs[lay], strs[purp], to_unit(x0), to_unit(y0), to_unit(x1), to_unit(y1),
+                          rect.get('arr_nx', 1), rect.get('arr_ny', 1),
+                          to_unit(rect.get('arr_spx', 0)), to_unit(rect.get('arr_spy', 0))))
+
+        vias, via_params = [], []
+        for via in via_list:
+            x, y = via['loc']
+            # num_cols/num_rows are the cuts of one via, arr_* describe the via array.
+            vias.append((strs[via['id']], to_unit(x), to_unit(y), strs[via.get('orient', 'R0')],
+                         via.get('arr_nx', 1), via.get('arr_ny', 1),
+                         to_unit(via.get('arr_spx', 0)), to_unit(via.get('arr_spy', 0))))
+            via_params.append({key: val for key, val in via.items()
+                               if key in ('enc1', 'enc2', 'cut_width', 'cut_height', 'num_cols',
+                                          'num_rows', 'sp_cols', 'sp_rows')})
+
+        insts, inst_params = [], []
+        for inst in inst_list:
+            x, y = inst['loc']
+            insts.append((strs[inst['lib']], strs[inst['cell']], strs[inst['name']],
+                          to_unit(x), to_unit(y), strs[inst.get('orient', 'R0')],
+                          inst.get('num_cols', 1), inst.get('num_rows', 1),
+                          to_unit(inst.get('sp_cols', 0)), to_unit(inst.get('sp_rows', 0))))
+            inst_params.append(inst.get('params', None) or {})
+
+        pins = []
+        for pin in pin_list:
+            lay, purp = pin['layer']
+            (x0, y0), (x1, y1) = pin['bbox']
+            pins.append((strs[pin['net_name']], strs[pin.get('pin_name', pin['net_name'])],
+                         strs[pin.get('label', pin['net_name'])], strs[lay], strs[purp],
+                         to_unit(x0), to_unit(y0), to_unit(x1), to_unit(y1)))
+
+        # string table is complete now, write header then arrays
+        header = dict(name=cell_name, strings=strs.names, via_params=via_params,
+                      inst_params=inst_params)
+        for key, obj_list in zip(shape_keys, (path_list, blockage_list, boundary_list, polygon_list)):
+            header[key] = [self._shape_to_unit(obj) for obj in obj_list or ()]
+        self._write_record(b'CELL', json.dumps(header, default=repr).encode('utf-8'))
+        for (tag, _, columns), rows in zip(_array_tags, (rects, vias, insts, pins)):
+            arr = np.array(rows, dtype='<i8').reshape(len(rows), len(columns))
+            self._write_record(tag, arr.tobytes())
+        self._write_record(b'END ', b'')
+        self._f.flush()
+
+
+def iter_layout_stream(fname):
+    """Iterate over the cells of a layout stream file.
+
+    Only one cell is held in memory at a time.
+
+    Parameters
+    ----------
+    fname : str
+        the layout stream file name.
+
+    Yields
+    ------
+    cell : dict[str, any]
+        the cell content.  Has entries 'name', 'strings', 'via_params', 'inst_params',
+        one list of dictionaries for each of 'paths', 'blockages', 'boundaries' and
+        'polygons', and one 2D int64 array for each of 'rects', 'vias', 'instances', and 'pins'.
+    """
+    array_info = {tag: (key, len(columns)) for tag, key, columns in _array_tags}
+    with open(fname, 'rb') as f:
+        if f.read(len(_magic)) != _magic:
+            raise ValueError('%s is not a layout stream file.' % fname)
+        cell = None
+        while True:
+            head = f.read(_rec_head.size)
+            if not head:
+                break
+            tag, size = _rec_head.unpack(head)
+            payload = f.read(size)
+            if tag == b'CELL':
+                cell = json.loads(payload.decode('utf-8'))
+            elif tag == b'END ':
+                yield cell
+                cell = None
+            elif tag in array_info:
+                key, ncol = array_info[tag]
+                cell[key] = np.frombuffer(payload, dtype='<i8').reshape(-1, ncol)
+
+
+def diff_layout_streams(fname1, fname2):
+    """Compare two layout stream files cell by cell.
+
+    Parameters
+    ----------
+    fname1 : str
+        the first layout stream file.
+    fname2 : str
+        the second layout stream file.
+
+    Both files are read one cell at a time.  Only a digest of cells that have not
+    been matched with a cell in the other file yet is kept in memory.
+
+    Returns
+    -------
+    diff_cells : list[str]
+        names of cells that are missing from one file or have different content.
+    """
+    # name -> digest of cells not matched yet, for each file.
+    pending1, pending2 = {}, {}
+    diff_cells = []
+    for cell1, cell2 in zip_longest(iter_layout_stream(fname1), iter_layout_stream(fname2)):
+        for cell, pending, other in ((cell1, pending1, pending2), (cell2, pending2, pending1)):
+            if cell is None:
+                continue
+            name = cell['name']
+            digest = _cell_digest(cell)
+            if name in other:
+                if other.pop(name) != digest:
+                    diff_cells.append(name)
+            else:
+                pending[name] = digest
+    diff_cells.extend(sorted(set(pending1) | set(pending2)))
+    return diff_cells
+
+
+def _cell_digest(cell):
+    return hashlib.sha1(repr(_canonical_cell(cell)).encode('utf-8')).digest()
+
+
+def _canonical_cell(cell):
+    """Returns an order-independent representation of a cell, with indices resolved to names."""
+    strings = cell['strings']
+    extra_info = dict(vias=cell['via_params'], instances=cell['inst_params'])
+    ans = []
+    for _, key, columns in _array_tags:
+        str_cols = [idx for idx, col in enumerate(columns)
+                    if col in ('layer', 'purpose', 'via_id', 'orient', 'lib', 'cell', 'name',
+                               'net', 'pin', 'label')]
+        extra_list = extra_info.get(key, None)
+        rows = []
+        for row_idx, row in enumerate(cell[key].tolist()):
+            for idx in str_cols:
+                row[idx] = strings[row[idx]]
+            if extra_list is not None:
+                row.append(json.dumps(extra_list[row_idx], sort_keys=True))
+            rows.append(tuple(row))
+        ans.append(tuple(sorted(rows, key=repr)))
+    for key in shape_keys:
+        ans.append(tuple(sorted(json.dumps(obj, sort_keys=True, default=repr) for obj in cell.get(key, ()))))
+    return tuple(ans)
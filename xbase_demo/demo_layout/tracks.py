@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Cached coordinate/track conversions.
+
+Routing-heavy generators call RoutingGrid conversion methods many times with
+the same arguments.  :func:`get_track_index` returns a :class:`TrackIndex`
+attached to a RoutingGrid, which memoizes these conversions.
+"""
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+# noinspection PyUnresolvedReferences,PyCompatibility
+from builtins import *
+
+import weakref
+
+# RoutingGrid -> TrackIndex
+_index_table = weakref.WeakKeyDictionary()
+
+
+def get_track_index(grid):
+    """Returns the TrackIndex attached to the given RoutingGrid, creating it if needed.
+
+    Parameters
+    ----------
+    grid : :class:`bag.layout.routing.RoutingGrid`
+        the routing grid.
+
+    Returns
+    -------
+    tr_index : TrackIndex
+        the track index of the given grid.
+    """
+    tr_index = _index_table.get(grid, None)
+    if tr_index is None:
+        tr_index = _index_table[grid] = TrackIndex(grid)
+    return tr_index
+
+
+class TrackIndex(object):
+    """Memoized coordinate/track conversions of a RoutingGrid.
+
+    Methods have the same signature as the RoutingGrid methods they replace, and
+    give identical results since cache misses are delegated to the grid.
+    The RoutingGrid must not be modified after the index is created.
+
+    Parameters
+    ----------
+    grid : :class:`bag.layout.routing.RoutingGrid`
+        the routing grid.
+    """
+
+    def __init__(self, grid):
+        self._grid = grid
+        self._cache = {}
+
+    def clear_cache(self):
+        """Forget all memoized conversions."""
+        self._cache.clear()
+
+    def coord_to_nearest_track(self, layer_id, coord, half_track=False, mode=0, unit_mode=False):
+        """Memoized version of RoutingGrid.coord_to_nearest_track()."""
+        key = ('nearest', layer_id, coord, half_track, mode, unit_mode)
+        ans = self._cache.get(key, None)
+        if ans is None:
+            ans = self._cache[key] = self._grid.coord_to_nearest_track(layer_id, coord,
+                                                                       half_track=half_track,
+                                                                       mode=mode,
+                                                                       unit_mode=unit_mode)
+        return ans
+
+    def track_to_coord(self, layer_id, track_idx, unit_mode=False):
+        """Memoized version of RoutingGrid.track_to_coord()."""
+        key = ('coord', layer_id, track_idx, unit_mode)
+        ans = self._cache.get(key, None)
+        if ans is None:
+            ans = self._cache[key] = self._grid.track_to_coord(layer_id, track_idx,
+                                                               unit_mode=unit_mode)
+        return ans
+
+    def get_middle_track(self, tr1, tr2, round_up=False):
+        """Memoized version of RoutingGrid.get_middle_track()."""
+        key = ('middle', tr1, tr2, round_up)
+        ans = self._cache.get(key, None)
+        if ans is None:
+            ans = self._cache[key] = self._grid.get_middle_track(tr1, tr2, round_up=round_up)
+        return ans
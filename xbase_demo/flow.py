@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""Stage graph execution of the design flow.
+
+A :class:`FlowGraph` is a set of named stages with dependencies.  Each
+stage has a fingerprint computed from its input values, the content of its
+input files, and the fingerprints of the stages it depends on.  The output
+of every successful stage is saved with its fingerprint, so running the
+graph again only executes stages whose fingerprint changed or whose saved
+output is missing, together with everything downstream of them.  A failed
+run therefore resumes after the last successful stage.
+
+Stages whose dependencies are all done run concurrently in a thread pool,
+except that stages sharing a lock never run at the same time.
+
+:func:`run_flow_graph` runs the layout, schematic, LVS, and simulation
+steps of :func:`xbase_demo.core.run_flow` as a stage graph.
+"""
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import inspect
+import threading
+import multiprocessing
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from .core import gen_layout, gen_dut_schematic, gen_tb_schematics, _run_lvs_job, simulate, load_sim_data
+from .sim_data import plot_data
+from .sch_manifest import get_netlist_yaml
+
+
+class Stage(object):
+    """A stage of a flow graph.
+
+    Parameters
+    ----------
+    name : str
+        the stage name.
+    fun : callable
+        the stage function.  Called with a dictionary from dependency name to dependency output.
+    deps : list[str]
+        names of the stages this stage depends on.
+    inputs : any
+        JSON serializable input values.  The stage is re-run when they change.
+    files : list[str]
+        input files.  The stage is re-run when their content changes.
+    out_files : list[str]
+        output files.  The stage is re-run when any of them is missing.
+    cache : bool
+        False to run this stage every time.
+    lock : threading.Lock or None
+        if given, the stage holds this lock while it runs, so stages sharing a lock
+        run one at a time.
+    """
+
+    def __init__(self, name, fun, deps=(), inputs=None, files=(), out_files=(), cache=True, lock=None):
+        self.name = name
+        self.fun = fun
+        self.deps = list(deps)
+        self.inputs = inputs
+        self.files = list(files)
+        self.out_files = list(out_files)
+        self.cache = cache
+        self.lock = lock
+
+
+class FlowGraph(object):
+    """A graph of flow stages, with saved stage outputs.
+
+    Parameters
+    ----------
+    state_dir : str
+        directory of the saved stage outputs.
+    max_workers : int
+        maximum number of stages running at once.
+    """
+
+    def __init__(self, state_dir, max_workers=4):
+        self._state_dir = state_dir
+        self._max_workers = max_workers
+        self._stages = {}
+        self._order = []
+        # stage name -> (start time, end time) of the last run, relative to the run start
+        self.timing = {}
+
+    def add_stage(self, name, fun, deps=(), inputs=None, files=(), out_files=(), cache=True, lock=None):
+        """Add a stage to this graph.  Dependencies must be added first.
+
+        See :class:`Stage` for parameter descriptions.
+        """
+        if name in self._stages:
+            raise ValueError('Stage %s already exists.' % name)
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError('Stage %s depends on unknown stage %s.' % (name, dep))
+        self._stages[name] = Stage(name, fun, deps=deps, inputs=inputs, files=files,
+                                   out_files=out_files, cache=cache, lock=lock)
+        # stages can only depend on existing stages, so insertion order is a topological order.
+        self._order.append(name)
+
+    def _get_state_fname(self, name):
+        return os.path.join(self._state_dir, '%s.pkl' % name)
+
+    def _get_fingerprints(self):
+        fingerprints = {}
+        for name in self._order:
+            stage = self._stages[name]
+            h = hashlib.sha1()
+            h.update(json.dumps([name, stage.inputs, [fingerprints[dep] for dep in stage.deps]],
+                                sort_keys=True, default=repr).encode('utf-8'))
+            for fname in stage.files:
+                if fname is not None and os.path.isfile(fname):
+                    with open(fname, 'rb') as f:
+                        h.update(f.read())
+            fingerprints[name] = h.hexdigest()
+        return fingerprints
+
+    def _load_state(self, name):
+        try:
+            with open(self._get_state_fname(name), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+            return None
+
+    def _save_state(self, name, fingerprint, output):
+        os.makedirs(self._state_dir, exist_ok=True)
+        state_fname = self._get_state_fname(name)
+        # write to a temporary file first, so an interrupted run never leaves partial states.
+        tmp_fname = '%s.%d.tmp' % (state_fname, os.getpid())
+        with open(tmp_fname, 'wb') as f:
+            pickle.dump((fingerprint, output), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fname, state_fname)
+
+    def save_output(self, name, output):
+        """Save the output of a stage computed outside this graph.
+
+        The stage is then up to date until its fingerprint changes, so a layout generated
+        on another machine, for example, is not generated again.
+        """
+        if not self._stages[name].cache:
+            raise ValueError('Stage %s is not cached.' % name)
+        self._save_state(name, self._get_fingerprints()[name], output)
+
+    def _run_stage(self, stage, dep_outputs, t_start):
+        with stage.lock or nullcontext():
+            # timing starts when the stage holds its lock
+            self.timing[stage.name] = (time.time() - t_start, None)
+            return stage.fun(dep_outputs)
+
+    def get_stale_stages(self, force=()):
+        """Returns the names of the stages that would run, in topological order.
+
+        Parameters
+        ----------
+        force : list[str]
+            stages to re-run even if their saved output is current.
+
+        Returns
+        -------
+        stale_list : list[str]
+            the stages to run.
+        """
+        return self._get_stale_stages(self._get_fingerprints(), force)
+
+    def _get_stale_stages(self, fingerprints, force):
+        stale = set()
+        for name in self._order:
+            stage = self._stages[name]
+            if (not stage.cache or name in force or any(dep in stale for dep in stage.deps) or
+                    any(not os.path.exists(fname) for fname in stage.out_files)):
+                stale.add(name)
+            else:
+                state = self._load_state(name)
+                if state is None or state[0] != fingerprints[name]:
+                    stale.add(name)
+        return [name for name in self._order if name in stale]
+
+    def run(self, force=()):
+        """Run all stale stages.
+
+        If a stage fails, no new stages are started, stages already running are
+        allowed to finish and save their outputs, and the exception is raised.
+
+        Parameters
+        ----------
+        force : list[str]
+            stages to re-run even if their saved output is current.
+
+        Returns
+        -------
+        outputs : dict[str, any]
+            output of every stage.
+        """
+        fingerprints = self._get_fingerprints()
+        stale_list = self._get_stale_stages(fingerprints, force)
+        outputs = {}
+        for name in self._order:
+            if name not in stale_list:
+                print('stage %s is up to date' % name)
+                outputs[name] = self._load_state(name)[1]
+
+        self.timing = {}
+        t_start = time.time()
+        pending = list(stale_list)
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            while pending or running:
+                if error is None:
+                    for name in list(pending):
+                        stage = self._stages[name]
+                        if all(dep in outputs for dep in stage.deps):
+                            pending.remove(name)
+                            dep_outputs = {dep: outputs[dep] for dep in stage.deps}
+                            print('running stage %s' % name)
+                            running[executor.submit(self._run_stage, stage, dep_outputs, t_start)] = name
+                elif not running:
+                    break
+
+                done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    self.timing[name] = (self.timing[name][0], time.time() - t_start)
+                    try:
+                        output = future.result()
+                    except Exception as ex:
+                        print('stage %s failed' % name)
+                        if error is None:
+                            error = ex
+                        continue
+                    if self._stages[name].cache:
+                        self._save_state(name, fingerprints[name], output)
+                    outputs[name] = output
+
+        if error is not None:
+            raise error
+        return outputs
+
+    def print_timing(self):
+        """Print start and end time of each stage executed by the last run."""
+        for name in self._order:
+            if name in self.timing:
+                t0, t1 = self.timing[name]
+                if t1 is None:
+                    print('%-20s start=%8.3fs' % (name, t0))
+                else:
+                    print('%-20s start=%8.3fs end=%8.3fs elapsed=%8.3fs' % (name, t0, t1, t1 - t0))
+
+
+def _get_source_file(cls):
+    if cls is None:
+        return None
+    try:
+        return inspect.getsourcefile(cls)
+    except TypeError:
+        return None
+
+
+def make_flow_graph(prj, specs, dsn_name, lay_cls, sch_cls=None, run_lvs=True, lvs_only=False,
+                    state_dir=None, max_workers=4, plot=True, simulate_fun=None, prj_factory=None,
+                    load_fun=None):
+    """Create the stage graph of :func:`xbase_demo.core.run_flow`.
+
+    The stages are layout, dut_sch, lvs, tb_sch, simulate, load, and plot.  A BagProject
+    is one database connection that is not thread-safe, so every stage that uses prj
+    holds one lock.  LVS runs in a separate process with its own BagProject instead, so
+    it overlaps with testbench schematic generation, which also only depends on the DUT
+    schematic.
+
+    Parameters
+    ----------
+    prj : :class:`bag.BagProject`
+        the BagProject instance.
+    specs : dict[str, any]
+        the top level specifications.
+    dsn_name : str
+        the design name.
+    lay_cls : class or None
+        the layout generator class.  May be None if the layout stage output is given
+        with :meth:`FlowGraph.save_output`.
+    sch_cls : class or None
+        the schematic generator class.
+    run_lvs : bool
+        True to run LVS.
+    lvs_only : bool
+        True to stop after LVS.
+    state_dir : str or None
+        directory of the saved stage outputs.  Defaults to a directory in the design data_dir.
+    max_workers : int
+        maximum number of stages running at once.
+    plot : bool
+        True to plot simulation results.
+    simulate_fun : callable or None
+        function that runs the simulations, called with prj, specs, and dsn_name.  Defaults to
+        :func:`xbase_demo.core.simulate`.  It must write the results to the HDF5 files
+        read by :func:`xbase_demo.core.load_sim_data`, as
+        :func:`xbase_demo.jobqueue.simulate_queued` does.
+    prj_factory : callable or None
+        picklable function that creates the BagProject of the LVS process.  Defaults to
+        bag.BagProject.
+    load_fun : callable or None
+        function that reads one simulation result file.  Defaults to bag.data.load_sim_file.
+
+    Returns
+    -------
+    graph : FlowGraph
+        the flow graph.
+    """
+    dsn_specs = specs[dsn_name]
+    gen_cell = dsn_specs['gen_cell']
+    data_dir = dsn_specs['data_dir']
+    testbenches = dsn_specs['testbenches']
+    if state_dir is None:
+        state_dir = os.path.join(data_dir, '%s_flow' % gen_cell)
+    if simulate_fun is None:
+        simulate_fun = simulate
+
+    graph = FlowGraph(state_dir, max_workers=max_workers)
+    # held by every call that uses prj
+    prj_lock = threading.Lock()
+
+    def get_cls_name(cls):
+        return None if cls is None else '%s.%s' % (cls.__module__, cls.__name__)
+
+    def run_layout(deps):
+        return gen_layout(prj, specs, dsn_name, lay_cls, prj_lock=prj_lock)
+
+    def run_dut_sch(deps):
+        gen_dut_schematic(prj, specs, dsn_name, deps['layout'], sch_cls=sch_cls)
+
+    def run_lvs_check(deps):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            executor.submit(_run_lvs_job, dsn_specs['impl_lib'], gen_cell, prj_factory=prj_factory).result()
+
+    def run_tb_sch(deps):
+        gen_tb_schematics(prj, specs, dsn_name)
+
+    def run_sim(deps):
+        # simulation results are saved in HDF5 files, so do not keep them in the stage output.
+        simulate_fun(prj, specs, dsn_name)
+
+    def run_load(deps):
+        return load_sim_data(specs, dsn_name, load_fun=load_fun)
+
+    def run_plot(deps):
+        plot_data(deps['load'], plot=plot)
+
+    graph.add_stage('layout', run_layout,
+                    inputs=[dsn_specs['impl_lib'], gen_cell, dsn_specs['layout_params'],
+                            specs['routing_grid'], get_cls_name(lay_cls)],
+                    files=[_get_source_file(lay_cls)])
+    graph.add_stage('dut_sch', run_dut_sch, deps=['layout'],
+                    inputs=[dsn_specs['sch_lib'], dsn_specs['sch_cell'], get_cls_name(sch_cls)],
+                    files=[get_netlist_yaml(dsn_specs['sch_lib'], dsn_specs['sch_cell']),
+                           _get_source_file(sch_cls)],
+                    lock=prj_lock)
+
+    sim_deps = []
+    if run_lvs:
+        graph.add_stage('lvs', run_lvs_check, deps=['layout', 'dut_sch'])
+        sim_deps.append('lvs')
+
+    if lvs_only:
+        return graph
+
+    graph.add_stage('tb_sch', run_tb_sch, deps=['dut_sch'],
+                    inputs={name: [info['tb_lib'], info['tb_cell'], info['sch_params']]
+                            for name, info in testbenches.items()},
+                    files=[get_netlist_yaml(info['tb_lib'], info['tb_cell'])
+                           for info in testbenches.values()],
+                    lock=prj_lock)
+    sim_deps.append('tb_sch')
+    graph.add_stage('simulate', run_sim, deps=sim_deps,
+                    inputs=[specs['view_name'], specs['sim_envs'],
+                            {name: [info['tb_params'], info.get('tb_sweeps', None)]
+                             for name, info in testbenches.items()}],
+                    out_files=[os.path.join(data_dir, '%s_%s.hdf5' % (gen_cell, name))
+                               for name in testbenches],
+                    lock=prj_lock)
+    graph.add_stage('load', run_load, deps=['simulate'], cache=False)
+    graph.add_stage('plot', run_plot, deps=['load'], cache=False)
+    return graph
+
+
+def run_flow_graph(prj, specs, dsn_name, lay_cls, sch_cls=None, run_lvs=True, lvs_only=False,
+                   state_dir=None, max_workers=4, force=(), plot=True, simulate_fun=None, prj_factory=None,
+                   load_fun=None):
+    """Run :func:`xbase_demo.core.run_flow` as a stage graph, skipping up-to-date stages.
+
+    See :func:`make_flow_graph` for parameter descriptions.  force is the list of stages
+    to re-run even if their saved output is current.
+
+    Returns
+    -------
+    outputs : dict[str, any]
+        output of every stage.
+    """
+    graph = make_flow_graph(prj, specs, dsn_name, lay_cls, sch_cls=sch_cls, run_lvs=run_lvs,
+                            lvs_only=lvs_only, state_dir=state_dir, max_workers=max_workers,
+                            plot=plot, simulate_fun=simulate_fun, prj_factory=prj_factory,
+                            load_fun=load_fun)
+    outputs = graph.run(force=force)
+    graph.print_timing()
+    print('flow done')
+    return outputs
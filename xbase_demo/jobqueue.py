@@ -0,0 +1,601 @@
+# -*- coding: utf-8 -*-
+"""A local job queue for farming simulations across worker processes.
+
+:class:`JobQueue` stores jobs in a SQLite database.  Jobs are submitted with
+a JSON serializable configuration, and any number of worker processes, on
+this machine or on other machines sharing the database file, claim jobs,
+run them, and report the result::
+
+    queue = JobQueue('sim_queue.db')
+    job_ids = submit_testbenches(queue, specs, 'amp_cs')
+    wait_for_jobs(queue, job_ids)
+
+and in each worker process::
+
+    run_worker(JobQueue('sim_queue.db'), bag_testbench_handler(BagProject()))
+
+BagProject is not thread-safe, so each worker is a process with its own
+BagProject, and never a thread sharing one.
+
+A claimed job holds a lease, which the worker renews while the job runs.  If
+the worker dies, the lease expires and the job goes back to the queue.  A job
+that runs longer than its timeout, or whose handler raises, is retried until
+it runs out of attempts, and then marked failed.
+
+Testbench jobs write their HDF5 results straight to the design data_dir, so
+it must be on storage shared by all workers.  Testbenches may also be split
+into corner shards, see :mod:`xbase_demo.shard`.
+:func:`xbase_demo.core.load_sim_data` and the process_tb_* functions of
+:mod:`xbase_demo.sim_data` then work unchanged.
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+import traceback
+from collections import namedtuple
+from contextlib import contextmanager
+
+from .specs import thaw
+from .shard import make_shard_jobs, merge_shard_files
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+status_names = (PENDING, RUNNING, DONE, FAILED)
+
+Job = namedtuple('Job', ['id', 'kind', 'config', 'status', 'attempts', 'max_attempts', 'timeout',
+                         'worker', 'started', 'result', 'error'])
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    config TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    timeout REAL,
+    worker TEXT,
+    started REAL,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+'''
+
+_job_columns = 'id, kind, config, status, attempts, max_attempts, timeout, worker, started, result, error'
+
+
+def _to_job(row):
+    job_id, kind, config, status, attempts, max_attempts, timeout, worker, started, result, error = row
+    return Job(job_id, kind, json.loads(config), status, attempts, max_attempts, timeout, worker, started,
+               None if result is None else json.loads(result), error)
+
+
+def get_worker_id():
+    """Returns a worker ID unique to this process."""
+    return '%s:%d:%d' % (socket.gethostname(), os.getpid(), threading.get_ident())
+
+
+class JobQueue(object):
+    """A job queue stored in a SQLite database file.
+
+    Every method opens its own connection, so a queue object can be shared by threads.
+
+    Parameters
+    ----------
+    db_fname : str
+        the database file name.  Created if it does not exist.
+    max_retries : int
+        default number of times a failed job is retried.
+    lease_time : float
+        seconds a claimed job stays reserved without a heartbeat from its worker.
+    wal : bool
+        True to use write-ahead logging, which lets readers run concurrently with a
+        writer.  SQLite does not support write-ahead logging on network file systems,
+        so set this to False if the database is on shared storage.
+    """
+
+    def __init__(self, db_fname, max_retries=2, lease_time=60.0, wal=True):
+        self.db_fname = os.path.abspath(db_fname)
+        self.max_retries = max_retries
+        self.lease_time = lease_time
+        self._journal_mode = 'WAL' if wal else 'DELETE'
+        dir_name = os.path.dirname(self.db_fname)
+        os.makedirs(dir_name, exist_ok=True)
+        con = sqlite3.connect(self.db_fname, timeout=60.0)
+        try:
+            con.execute('PRAGMA journal_mode=%s' % self._journal_mode)
+            con.executescript(_schema)
+        finally:
+            con.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Yields a cursor in a write transaction.  Commits on success, rolls back on error."""
+        con = sqlite3.connect(self.db_fname, timeout=60.0, isolation_level=None)
+        try:
+            cur = con.cursor()
+            # take the write lock up front, so two workers never claim the same job.
+            cur.execute('BEGIN IMMEDIATE')
+            try:
+                yield cur
+            except BaseException:
+                cur.execute('ROLLBACK')
+                raise
+            cur.execute('COMMIT')
+        finally:
+            con.close()
+
+    def submit(self, config, kind='testbench', max_retries=None, timeout=None):
+        """Submit a job.
+
+        Parameters
+        ----------
+        config : dict[str, any]
+            the JSON serializable job configuration.
+        kind : str
+            the job kind.  Workers may only claim jobs of some kinds.
+        max_retries : int or None
+            number of times the job is retried on failure.  Defaults to the queue setting.
+        timeout : float or None
+            maximum run time of one attempt, in seconds.  None for no limit.
+
+        Returns
+        -------
+        job_id : int
+            the job ID.
+        """
+        return self.submit_many([config], kind=kind, max_retries=max_retries, timeout=timeout)[0]
+
+    def submit_many(self, config_list, kind='testbench', max_retries=None, timeout=None):
+        """Submit many jobs in one transaction.  Returns the list of job IDs.
+
+        See :meth:`submit` for parameter descriptions.
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        now = time.time()
+        job_ids = []
+        with self._transaction() as cur:
+            for config in config_list:
+                cur.execute('INSERT INTO jobs (kind, config, status, max_attempts, timeout, created, updated) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (kind, json.dumps(config), PENDING, max_retries + 1, timeout, now, now))
+                job_ids.append(cur.lastrowid)
+        return job_ids
+
+    def _retry_or_fail(self, cur, job_id, attempts, max_attempts, error, now):
+        status = PENDING if attempts < max_attempts else FAILED
+        cur.execute('UPDATE jobs SET status = ?, worker = NULL, lease_expires = NULL, error = ?, '
+                    'updated = ? WHERE id = ?', (status, error, now, job_id))
+
+    def _reap(self, cur, now):
+        """Requeue or fail running jobs whose lease expired or that exceeded their timeout."""
+        cur.execute('SELECT id, attempts, max_attempts, lease_expires, started, timeout FROM jobs '
+                    'WHERE status = ? AND (lease_expires < ? OR (timeout IS NOT NULL AND started + timeout < ?))',
+                    (RUNNING, now, now))
+        rows = cur.fetchall()
+        for job_id, attempts, max_attempts, lease_expires, started, timeout in rows:
+            if lease_expires < now:
+                error = 'worker lost: lease expired'
+            else:
+                error = 'timed out after %.1fs' % timeout
+            self._retry_or_fail(cur, job_id, attempts, max_attempts, error, now)
+        return len(rows)
+
+    def reap_expired(self):
+        """Requeue or fail running jobs whose worker is gone or that timed out.
+
+        This is also done by :meth:`claim` and :meth:`get_progress`.
+
+        Returns
+        -------
+        num_reaped : int
+            number of jobs requeued or failed.
+        """
+        with self._transaction() as cur:
+            return self._reap(cur, time.time())
+
+    def claim(self, worker_id, kinds=None):
+        """Claim the oldest pending job.
+
+        Parameters
+        ----------
+        worker_id : str
+            the worker ID.  Must be given to all later calls about this job.
+        kinds : list[str] or None
+            job kinds this worker runs.  None for all kinds.
+
+        Returns
+        -------
+        job : Job or None
+            the claimed job, or None if no job is pending.
+        """
+        now = time.time()
+        with self._transaction() as cur:
+            self._reap(cur, now)
+            query = 'SELECT %s FROM jobs WHERE status = ?' % _job_columns
+            args = [PENDING]
+            if kinds is not None:
+                kinds = list(kinds)
+                query += ' AND kind IN (%s)' % ', '.join('?' * len(kinds))
+                args.extend(kinds)
+            cur.execute(query + ' ORDER BY id LIMIT 1', args)
+            row = cur.fetchone()
+            if row is None:
+                return None
+            job = _to_job(row)
+            cur.execute('UPDATE jobs SET status = ?, attempts = attempts + 1, worker = ?, started = ?, '
+                        'lease_expires = ?, updated = ? WHERE id = ?',
+                        (RUNNING, worker_id, now, now + self.lease_time, now, job.id))
+        return job._replace(status=RUNNING, attempts=job.attempts + 1, worker=worker_id, started=now)
+
+    def heartbeat(self, job_id, worker_id):
+        """Renew the lease of a running job.
+
+        Returns
+        -------
+        owned : bool
+            False if the job is no longer running on this worker, for example because it
+            timed out and was given to another worker.
+        """
+        now = time.time()
+        with self._transaction() as cur:
+            self._reap(cur, now)
+            cur.execute('UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND status = ? AND worker = ?',
+                        (now + self.lease_time, now, job_id, RUNNING, worker_id))
+            return cur.rowcount == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        """Mark a running job done.
+
+        Parameters
+        ----------
+        job_id : int
+            the job ID.
+        worker_id : str
+            the worker ID.
+        result : any
+            the JSON serializable job result.
+
+        Returns
+        -------
+        owned : bool
+            False if the job is no longer running on this worker, in which case the result
+            is discarded.
+        """
+        now = time.time()
+        with self._transaction() as cur:
+            # a job that exceeded its timeout is requeued, even if it just finished.
+            self._reap(cur, now)
+            cur.execute('UPDATE jobs SET status = ?, result = ?, error = NULL, lease_expires = NULL, updated = ? '
+                        'WHERE id = ? AND status = ? AND worker = ?',
+                        (DONE, json.dumps(result), now, job_id, RUNNING, worker_id))
+            return cur.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Report a failed attempt of a running job.
+
+        The job is requeued if it has attempts left, otherwise it is marked failed.
+
+        Returns
+        -------
+        owned : bool
+            False if the job is no longer running on this worker.
+        """
+        now = time.time()
+        with self._transaction() as cur:
+            self._reap(cur, now)
+            cur.execute('SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = ? AND worker = ?',
+                        (job_id, RUNNING, worker_id))
+            row = cur.fetchone()
+            if row is None:
+                return False
+            self._retry_or_fail(cur, job_id, row[0], row[1], error, now)
+            return True
+
+    def get_jobs(self, job_ids=None):
+        """Returns the given jobs, or all jobs, ordered by ID."""
+        with self._transaction() as cur:
+            if job_ids is None:
+                cur.execute('SELECT %s FROM jobs ORDER BY id' % _job_columns)
+                return [_to_job(row) for row in cur.fetchall()]
+            job_ids = list(job_ids)
+            ans = []
+            # stay below the SQLite limit on the number of query parameters.
+            for idx in range(0, len(job_ids), 500):
+                chunk = job_ids[idx:idx + 500]
+                cur.execute('SELECT %s FROM jobs WHERE id IN (%s)' % (_job_columns, ', '.join('?' * len(chunk))),
+                            chunk)
+                ans.extend(_to_job(row) for row in cur.fetchall())
+            ans.sort(key=lambda job: job.id)
+            return ans
+
+    def get_job(self, job_id):
+        """Returns the given job."""
+        job_list = self.get_jobs([job_id])
+        if not job_list:
+            raise ValueError('Job %d not found.' % job_id)
+        return job_list[0]
+
+    def get_progress(self, job_ids=None):
+        """Returns the number of jobs in each state.
+
+        Parameters
+        ----------
+        job_ids : list[int] or None
+            the jobs to count.  None to count all jobs.
+
+        Returns
+        -------
+        progress : dict[str, int]
+            number of pending, running, done, and failed jobs, and the total under 'total'.
+        """
+        if job_ids is not None:
+            self.reap_expired()
+            progress = dict.fromkeys(status_names, 0)
+            for job in self.get_jobs(job_ids):
+                progress[job.status] += 1
+        else:
+            with self._transaction() as cur:
+                self._reap(cur, time.time())
+                cur.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')
+                progress = dict.fromkeys(status_names, 0)
+                progress.update(cur.fetchall())
+        progress['total'] = sum(progress[name] for name in status_names)
+        return progress
+
+
+def wait_for_jobs(queue, job_ids, poll_interval=1.0, timeout=None, verbose=True):
+    """Wait until the given jobs are done or failed.
+
+    Parameters
+    ----------
+    queue : JobQueue
+        the job queue.
+    job_ids : list[int]
+        the jobs to wait for.
+    poll_interval : float
+        seconds between progress checks.
+    timeout : float or None
+        maximum seconds to wait.  None to wait forever.
+    verbose : bool
+        True to print progress when it changes.
+
+    Returns
+    -------
+    job_list : list[Job]
+        the finished jobs, ordered by ID.
+    """
+    t_start = time.time()
+    last_progress = None
+    while True:
+        progress = queue.get_progress(job_ids)
+        if verbose and progress != last_progress:
+            print('jobs: %d/%d done, %d running, %d pending, %d failed' %
+                  (progress[DONE], progress['total'], progress[RUNNING], progress[PENDING], progress[FAILED]))
+            last_progress = progress
+        if progress[DONE] + progress[FAILED] == progress['total']:
+            return queue.get_jobs(job_ids)
+        if timeout is not None and time.time() - t_start > timeout:
+            raise ValueError('Timed out waiting for jobs: %d of %d not finished.' %
+                             (progress[PENDING] + progress[RUNNING], progress['total']))
+        time.sleep(poll_interval)
+
+
+class _Heartbeat(object):
+    """Renews the lease of a job in a background thread."""
+
+    def __init__(self, queue, job_id, worker_id):
+        self._queue = queue
+        self._job_id = job_id
+        self._worker_id = worker_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self._queue.lease_time / 3):
+            if not self._queue.heartbeat(self._job_id, self._worker_id):
+                print('job %d: lost lease' % self._job_id)
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(queue, handler, worker_id=None, kinds=None, poll_interval=1.0, max_jobs=None,
+               exit_when_idle=False):
+    """Claim and run jobs until stopped.
+
+    A job whose handler raises is reported failed, and retried if it has attempts left.
+    The handler is not interrupted when a job times out; its result is discarded instead.
+
+    Parameters
+    ----------
+    queue : JobQueue
+        the job queue.
+    handler : callable
+        called with the job configuration.  Returns the JSON serializable job result.
+    worker_id : str or None
+        the worker ID.  Defaults to host name, process ID, and thread ID.
+    kinds : list[str] or None
+        job kinds to run.  None for all kinds.
+    poll_interval : float
+        seconds to wait when no job is pending.
+    max_jobs : int or None
+        stop after running this many jobs.
+    exit_when_idle : bool
+        True to stop when no job is pending.
+
+    Returns
+    -------
+    num_jobs : int
+        number of jobs run.
+    """
+    if worker_id is None:
+        worker_id = get_worker_id()
+
+    num_jobs = 0
+    while max_jobs is None or num_jobs < max_jobs:
+        job = queue.claim(worker_id, kinds=kinds)
+        if job is None:
+            if exit_when_idle:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        print('%s: running job %d (attempt %d/%d)' % (worker_id, job.id, job.attempts, job.max_attempts))
+        num_jobs += 1
+        with _Heartbeat(queue, job.id, worker_id):
+            try:
+                result = handler(job.config)
+            except Exception as ex:
+                print('%s: job %d failed: %s' % (worker_id, job.id, ex))
+                queue.fail(job.id, worker_id, '%s: %s\n%s' % (type(ex).__name__, ex, traceback.format_exc()))
+                continue
+        if not queue.complete(job.id, worker_id, result):
+            print('%s: job %d finished after it timed out, result discarded' % (worker_id, job.id))
+
+    return num_jobs
+
+
+def make_testbench_jobs(specs, dsn_name):
+    """Returns the testbench job configurations of a design.
+
+    Each configuration has all parameters of :func:`xbase_demo.core.setup_testbench`, and
+    data_fname, the HDF5 file the results are written to.
+
+    Parameters
+    ----------
+    specs : dict[str, any]
+        the top level specifications.
+    dsn_name : str
+        the design name.
+
+    Returns
+    -------
+    config_list : list[dict[str, any]]
+        one job configuration per testbench.
+    """
+    dsn_specs = specs[dsn_name]
+    data_dir = os.path.abspath(dsn_specs['data_dir'])
+    impl_lib = dsn_specs['impl_lib']
+    gen_cell = dsn_specs['gen_cell']
+
+    config_list = []
+    for name, info in dsn_specs['testbenches'].items():
+        tb_gen_cell = '%s_%s' % (gen_cell, name)
+        config_list.append(dict(impl_lib=impl_lib, gen_cell=gen_cell, tb_name=name, tb_gen_cell=tb_gen_cell,
+                                tb_params=thaw(info['tb_params']), tb_sweeps=thaw(info.get('tb_sweeps', None)),
+                                view_name=specs['view_name'], sim_envs=thaw(specs['sim_envs']),
+                                data_fname=os.path.join(data_dir, '%s.hdf5' % tb_gen_cell)))
+    return config_list
+
+
+def submit_testbenches(queue, specs, dsn_name, max_retries=None, timeout=None, corners_per_shard=None,
+                       sweep_shards=()):
+    """Submit the testbenches of a design as jobs.  Returns the list of job IDs.
+
+    The testbench schematics must already be generated.  If corners_per_shard or
+    sweep_shards is given, each testbench is split into shard jobs by
+    :func:`xbase_demo.shard.make_shard_jobs`, and each shard job simulates its own
+    testbench cell, so the schematics must be generated by
+    :func:`xbase_demo.core.gen_tb_schematics` with the same sharding options.
+    """
+    config_list = make_testbench_jobs(specs, dsn_name)
+    if corners_per_shard is not None or sweep_shards:
+        config_list = [shard_config for config in config_list
+                       for shard_config in make_shard_jobs(config, corners_per_shard=corners_per_shard,
+                                                           sweep_shards=sweep_shards)]
+    for config in config_list:
+        os.makedirs(os.path.dirname(config['data_fname']), exist_ok=True)
+    return queue.submit_many(config_list, kind='testbench', max_retries=max_retries, timeout=timeout)
+
+
+def simulate_queued(queue, specs, dsn_name, max_retries=None, timeout=None, poll_interval=1.0,
+                    wait_timeout=None, corners_per_shard=None, sweep_shards=(), load_fun=None, save_fun=None):
+    """Run the simulations of :func:`xbase_demo.core.simulate` on queue workers.
+
+    Parameters
+    ----------
+    queue : JobQueue
+        the job queue.
+    specs : dict[str, any]
+        the top level specifications.
+    dsn_name : str
+        the design name.
+    max_retries : int or None
+        number of times a failed simulation is retried.  Defaults to the queue setting.
+    timeout : float or None
+        maximum run time of one simulation, in seconds.
+    poll_interval : float
+        seconds between progress checks.
+    wait_timeout : float or None
+        maximum seconds to wait for all simulations.
+    corners_per_shard : int or None
+        if given, split each testbench into jobs of this many corners.
+    sweep_shards : list[str]
+        testbench sweep parameters to split into jobs, one value per job.
+    load_fun : callable or None
+        function that loads a shard result file.  Defaults to bag.data.load_sim_file.
+    save_fun : callable or None
+        function that saves merged results.  Defaults to bag.data.save_sim_results.
+
+    Returns
+    -------
+    data_files : dict[str, str]
+        HDF5 result file of each testbench.
+    """
+    job_ids = submit_testbenches(queue, specs, dsn_name, max_retries=max_retries, timeout=timeout,
+                                 corners_per_shard=corners_per_shard, sweep_shards=sweep_shards)
+    job_list = wait_for_jobs(queue, job_ids, poll_interval=poll_interval, timeout=wait_timeout)
+    failed = [job for job in job_list if job.status == FAILED]
+    if failed:
+        raise ValueError('%d simulations failed:\n%s' %
+                         (len(failed), '\n'.join('%s: %s' % (job.config['tb_gen_cell'], job.error)
+                                                 for job in failed)))
+
+    data_files = {}
+    shard_dict = {}
+    for job in job_list:
+        if 'shard_values' in job.config:
+            shard_dict.setdefault(job.config['tb_name'], []).append(job.config)
+        else:
+            data_files[job.config['tb_name']] = job.result['data_fname']
+    for name, shard_configs in shard_dict.items():
+        data_fname = shard_configs[0]['merge_fname']
+        print('merging %d shards into %s' % (len(shard_configs), data_fname))
+        merge_shard_files(shard_configs, data_fname, load_fun=load_fun, save_fun=save_fun)
+        data_files[name] = data_fname
+
+    print('all simulation done')
+    return data_files
+
+
+def bag_testbench_handler(prj):
+    """Returns a job handler that runs testbench jobs with the given BagProject.
+
+    The handler must only be run by one worker at a time, since BagProject is not thread-safe.
+    """
+    # bag is only needed by workers that run real simulations
+    from .core import run_testbench_job
+
+    def handler(config):
+        return run_testbench_job(prj, config)
+
+    return handler
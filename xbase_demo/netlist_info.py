@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Cached loading of BagModules netlist_info YAML files.
+
+Each netlist_info file is parsed once per process and kept as a pickled blob;
+every request returns a fresh copy unpickled from that blob, which is much
+cheaper than parsing YAML.  The parsed content is also persisted as JSON
+snapshot files keyed by the YAML file content hash, so new processes skip
+YAML parsing too.  Snapshots are plain data, a snapshot is only used if its
+hash matches the YAML file, and snapshots are only read from a cache
+directory that is owned by the current user and not writable by others.
+
+:func:`install_netlist_cache` makes BAG design modules load their
+netlist_info files through this cache.  The schematic generation functions in
+:mod:`xbase_demo.core` install it automatically.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+
+import yaml
+
+from .cache import get_cache_dir, is_private_dir
+
+try:
+    _yaml_loader = yaml.CSafeLoader
+except AttributeError:
+    _yaml_loader = yaml.SafeLoader
+
+# absolute file name -> ((mtime, size), pickled netlist info)
+_mem_cache = {}
+# original read_yaml function replaced by install_netlist_cache()
+_orig_read_yaml = None
+
+
+def _get_snapshot_fname(digest, cache_dir):
+    return os.path.join(cache_dir, '%s.json' % digest)
+
+
+def _read_snapshot(snap_fname, digest):
+    """Returns the netlist information in the given snapshot, or None if it is missing or invalid."""
+    try:
+        with open(snap_fname, 'r') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(snapshot, dict) or snapshot.get('digest', None) != digest or
+            not isinstance(snapshot.get('info', None), dict)):
+        return None
+    return snapshot['info']
+
+
+def _write_snapshot(snap_fname, digest, info):
+    try:
+        content = json.dumps(dict(digest=digest, info=info))
+    except (TypeError, ValueError):
+        return
+    if json.loads(content)['info'] != info:
+        # not representable in JSON, e.g. non-string keys
+        return
+    try:
+        # write to a temporary file first, so concurrent readers never see partial snapshots.
+        tmp_fname = '%s.%d.tmp' % (snap_fname, os.getpid())
+        with open(tmp_fname, 'w') as f:
+            f.write(content)
+        os.replace(tmp_fname, snap_fname)
+    except OSError:
+        # snapshots are only an optimization
+        pass
+
+
+def _load_blob(fname, cache_dir):
+    with open(fname, 'rb') as f:
+        data = f.read()
+    # snapshots are keyed by content, so hashing the file validates them.
+    digest = hashlib.sha1(data).hexdigest()
+    use_snapshot = is_private_dir(cache_dir)
+    snap_fname = _get_snapshot_fname(digest, cache_dir)
+    info = _read_snapshot(snap_fname, digest) if use_snapshot else None
+    if info is None:
+        info = yaml.load(data, Loader=_yaml_loader)
+        if use_snapshot:
+            _write_snapshot(snap_fname, digest, info)
+    return pickle.dumps(info, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_netlist_info(yaml_file, cache_dir=None):
+    """Returns the parsed content of a netlist_info YAML file.
+
+    Parameters
+    ----------
+    yaml_file : str
+        the netlist_info YAML file name.
+    cache_dir : str or None
+        the snapshot directory.  Defaults to the netlist_info cache directory.
+
+    Returns
+    -------
+    info : dict[str, any]
+        the netlist information.  Each call returns a new copy, so callers may modify it.
+    """
+    fname = os.path.abspath(yaml_file)
+    st = os.stat(fname)
+    stamp = (st.st_mtime_ns, st.st_size)
+    entry = _mem_cache.get(fname, None)
+    if entry is None or entry[0] != stamp:
+        blob = _load_blob(fname, cache_dir or get_cache_dir('netlist_info'))
+        entry = _mem_cache[fname] = (stamp, blob)
+    return pickle.loads(entry[1])
+
+
+def clear_netlist_cache():
+    """Forget all netlist_info files loaded in this process."""
+    _mem_cache.clear()
+
+
+def _cached_read_yaml(fname):
+    if os.path.basename(os.path.dirname(os.path.abspath(fname))) == 'netlist_info':
+        return load_netlist_info(fname)
+    return _orig_read_yaml(fname)
+
+
+def install_netlist_cache():
+    """Make BAG design modules load netlist_info files through the cache.
+
+    This replaces the read_yaml function used by bag.design.module, for files in
+    netlist_info directories only.  All other files are read by the original function.
+    Does nothing if BAG is not installed, since there are no design modules to patch.
+    """
+    global _orig_read_yaml
+
+    try:
+        import bag.design.module as bag_module
+    except ImportError:
+        return
+
+    if _orig_read_yaml is None:
+        _orig_read_yaml = bag_module.read_yaml
+        bag_module.read_yaml = _cached_read_yaml
+
+
+def uninstall_netlist_cache():
+    """Undo :func:`install_netlist_cache`."""
+    global _orig_read_yaml
+
+    if _orig_read_yaml is not None:
+        import bag.design.module as bag_module
+
+
+        bag_module.read_yaml = _orig_read_yaml
+        _orig_read_yaml = None
@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+"""Offline stand-ins for parts of BagProject.
+
+These classes mimic the BagProject interfaces used by the flow functions in
+xbase_demo.core, so flows can be exercised without Virtuoso, a PDK or a
+simulator.  :class:`FakeTestbench` produces synthetic DC, AC and transient
+results, which :func:`save_sim_hdf5` writes in the HDF5 layout of
+bag.data.save_sim_results.
+"""
+
+import os
+import re
+import json
+import time
+import zlib
+import asyncio
+import threading
+
+import numpy as np
+
+
+class LocalDesignModule(object):
+    """Stand-in for a schematic design module.  Records its design parameters.
+
+    Parameters
+    ----------
+    master_db : LocalSchematicDB
+        the database this module belongs to.
+    lib_name : str
+        the schematic generator library name.
+    cell_name : str
+        the schematic generator cell name.
+    """
+
+    def __init__(self, master_db, lib_name, cell_name):
+        self.master_db = master_db
+        self.lib_name = lib_name
+        self.cell_name = cell_name
+        self.params = None
+
+    def design(self, **kwargs):
+        self.params = kwargs
+
+    def implement_design(self, lib_name, top_cell_name='', **kwargs):
+        self.master_db.instantiate_masters([self], name_list=[top_cell_name or self.cell_name],
+                                           lib_name=lib_name)
+
+
+class LocalSchematicDB(object):
+    """Stand-in for the schematic database of BagProject.
+
+    Implemented cells are written as JSON files at root_dir/<lib_name>/<cell_name>.json,
+    containing the generator library/cell and design parameters.
+
+    Parameters
+    ----------
+    root_dir : str
+        the root directory of the local database.
+    lvs_passed : bool
+        the result returned by run_lvs().
+    """
+
+    def __init__(self, root_dir, lvs_passed=True):
+        self.root_dir = root_dir
+        self.lvs_passed = lvs_passed
+        # number of database operations performed
+        self.num_commits = 0
+
+    def clear_schematic_database(self):
+        pass
+
+    def create_design_module(self, lib_name, cell_name):
+        return LocalDesignModule(self, lib_name, cell_name)
+
+    def new_schematic_instance(self, lib_name='', cell_name='', params=None, sch_cls=None):
+        dsn = LocalDesignModule(self, lib_name, cell_name)
+        dsn.design(**(params or {}))
+        return dsn
+
+    def instantiate_masters(self, master_list, name_list=None, lib_name='', debug=False):
+        if name_list is None:
+            name_list = [dsn.cell_name for dsn in master_list]
+        lib_dir = os.path.join(self.root_dir, lib_name)
+        os.makedirs(lib_dir, exist_ok=True)
+        for dsn, name in zip(master_list, name_list):
+            content = dict(lib_name=dsn.lib_name, cell_name=dsn.cell_name, params=dsn.params)
+            with open(os.path.join(lib_dir, '%s.json' % name), 'w') as f:
+                json.dump(content, f, indent=2, sort_keys=True, default=repr)
+        self.num_commits += 1
+
+    def get_cell(self, lib_name, cell_name):
+        """Returns the content of an implemented cell."""
+        with open(os.path.join(self.root_dir, lib_name, '%s.json' % cell_name), 'r') as f:
+            return json.load(f)
+
+    def run_lvs(self, lib_name, cell_name):
+        log_fname = os.path.join(self.root_dir, lib_name, '%s.lvs.log' % cell_name)
+        os.makedirs(os.path.dirname(log_fname), exist_ok=True)
+        with open(log_fname, 'w') as f:
+            f.write('LVS %s\n' % ('passed' if self.lvs_passed else 'failed'))
+        return self.lvs_passed, log_fname
+
+
+def save_sim_hdf5(results, fname):
+    """Save simulation results in the HDF5 layout of bag.data.save_sim_results.
+
+    The file is written to a temporary file first, then renamed.
+    """
+    import h5py
+
+    dir_name = os.path.dirname(os.path.abspath(fname))
+    os.makedirs(dir_name, exist_ok=True)
+    tmp_fname = '%s.%d.%d.tmp' % (fname, os.getpid(), threading.get_ident())
+    with h5py.File(tmp_fname, 'w') as f:
+        for name, swp_vars in results['sweep_params'].items():
+            data = np.asarray(results[name])
+            if data.dtype.kind == 'U':
+                data = np.char.encode(data, 'utf-8')
+            dset = f.create_dataset(name, data=data)
+            dset.attrs['sweep_params'] = [swp.encode('utf-8') for swp in swp_vars]
+    os.replace(tmp_fname, fname)
+
+
+def load_sim_hdf5(fname):
+    """Load simulation results saved by :func:`save_sim_hdf5` or bag.data.save_sim_results."""
+    import h5py
+
+    results = {}
+    sweep_params = {}
+    with h5py.File(fname, 'r') as f:
+        for name in f:
+            dset = f[name]
+            data = dset[()]
+            if dset.dtype.kind == 'S':
+                data = np.char.decode(data, 'utf-8')
+            results[name] = data
+            sweep_params[name] = [swp.decode('utf-8') if isinstance(swp, bytes) else swp
+                                  for swp in dset.attrs['sweep_params']]
+    results['sweep_params'] = sweep_params
+    return results
+
+
+def _corner_scale(corner):
+    """Returns a deterministic scale factor between 0.8 and 1.2 for the given corner name."""
+    return 0.8 + 0.4 * (zlib.crc32(corner.encode('utf-8')) % 1000) / 999
+
+
+def make_fake_results(cell_name, sim_envs, sweeps=None, vdd=1.0, num_points=101):
+    """Returns synthetic simulation results in the format of bag.data.load_sim_results.
+
+    The outputs depend on the testbench cell name, following the demo testbenches: cells
+    ending in dc sweep vindc and output the vin and vout node voltages.  Otherwise, cells
+    containing ac output vout_ac versus freq, cells containing tran output vout_tran versus
+    time, and other cells output vout_tran.  Corner is the first sweep, followed by the
+    given outer sweeps.
+
+    Parameters
+    ----------
+    cell_name : str
+        the testbench cell name.
+    sim_envs : list[str]
+        the simulation corners.
+    sweeps : dict[str, list[float]] or None
+        the outer sweep values.
+    vdd : float
+        the supply voltage.
+    num_points : int
+        number of points of the inner sweep.
+
+    Returns
+    -------
+    results : dict[str, any]
+        the simulation results.
+    """
+    sweeps = sweeps or {}
+    outer_names = sorted(sweeps.keys())
+    outer_vals = [np.asarray(sweeps[name]) for name in outer_names]
+
+    # output scale depends on corner and outer sweep values, but not on the other
+    # corners and values simulated, so split simulations give the same results.
+    scale = np.array([_corner_scale(env) for env in sim_envs])
+    for vals in outer_vals:
+        scale = scale[..., np.newaxis] * (1.0 + 0.1 * np.asarray(vals, dtype=float))
+    scale = scale[..., np.newaxis]
+
+    results = dict(corner=np.array(sim_envs))
+    results.update(zip(outer_names, outer_vals))
+    sweep_params = {name: [name] for name in ['corner'] + outer_names}
+
+    outputs = []
+    if cell_name.endswith('dc'):
+        outputs.append('dc')
+    else:
+        if 'ac' in cell_name:
+            outputs.append('ac')
+        if 'tran' in cell_name or not outputs:
+            outputs.append('tran')
+
+    out_shape = (1,) * (len(outer_names) + 1) + (-1,)
+    for kind in outputs:
+        if kind == 'dc':
+            inner, out_name = 'vindc', 'vout'
+            x = np.linspace(0.0, vdd, num_points)
+            out_val = vdd / 2 * (1 - np.tanh(10 * scale * (x.reshape(out_shape) - vdd / 2)))
+            results['vin'] = np.broadcast_to(x.reshape(out_shape), out_val.shape).copy()
+            sweep_params['vin'] = ['corner'] + outer_names + [inner]
+        elif kind == 'ac':
+            inner, out_name = 'freq', 'vout_ac'
+            x = np.logspace(3, 11, num_points)
+            out_val = -10 * scale / (1 + 1j * x.reshape(out_shape) / (1e8 * scale))
+        else:
+            inner, out_name = 'time', 'vout_tran'
+            x = np.linspace(0.0, 1e-9, num_points)
+            out_val = vdd * (1 - np.exp(-x.reshape(out_shape) / (1e-10 * scale)))
+        results[inner] = x
+        results[out_name] = out_val
+        sweep_params[inner] = [inner]
+        sweep_params[out_name] = ['corner'] + outer_names + [inner]
+
+    results['sweep_params'] = sweep_params
+    return results
+
+
+class FakeTestbench(object):
+    """Stand-in for a BAG testbench.  Simulations produce the synthetic waveforms of
+    :func:`make_fake_results`.
+
+    As with ADEXL state, the settings of a testbench cell are stored in the project.
+    configure_testbench() loads them, update_testbench() writes them back, and a
+    simulation runs the settings stored when it starts, whichever testbench object
+    wrote them.
+
+    Parameters
+    ----------
+    prj : FakeBagProject
+        the project this testbench belongs to.
+    lib_name : str
+        the testbench library name.
+    cell_name : str
+        the testbench cell name.
+    """
+
+    def __init__(self, prj, lib_name, cell_name):
+        self.prj = prj
+        self.lib_name = lib_name
+        self.cell_name = cell_name
+        state = prj.get_tb_state(lib_name, cell_name)
+        self.params = dict(state['params'])
+        self.sweeps = dict(state['sweeps'])
+        self.view = state['view']
+        self.sim_envs = list(state['sim_envs'])
+        self.results = None
+        self.save_dir = None
+
+    def set_parameter(self, name, val):
+        self.params[name] = val
+
+    def set_sweep_parameter(self, name, values=None, start=None, stop=None, step=None):
+        if values is None:
+            values = np.arange(start, stop + step / 2, step)
+        self.sweeps[name] = np.asarray(values)
+
+    def set_simulation_view(self, lib_name, cell_name, view_name):
+        self.view = (lib_name, cell_name, view_name)
+
+    def set_simulation_environments(self, env_list):
+        self.sim_envs = list(env_list)
+
+    def update_testbench(self):
+        self.prj.set_tb_state(self.lib_name, self.cell_name,
+                              dict(params=self.params, sweeps=self.sweeps, view=self.view, sim_envs=self.sim_envs))
+
+    def run_simulation(self):
+        state = self.prj.get_tb_state(self.lib_name, self.cell_name)
+        self.prj.start_simulation(self)
+        self._set_results(state)
+
+    async def async_run_simulation(self):
+        state = self.prj.get_tb_state(self.lib_name, self.cell_name)
+        await self.prj.async_start_simulation(self)
+        self._set_results(state)
+
+    def _set_results(self, state):
+        # shard cells are copies of their testbench, see xbase_demo.shard
+        tb_cell = re.sub(r'_shard\d+$', '', self.cell_name)
+        vdd = float(state['params'].get('vdd', 1.0))
+        self.results = make_fake_results(tb_cell, state['sim_envs'], sweeps=state['sweeps'], vdd=vdd,
+                                         num_points=self.prj.num_points)
+        self.save_dir = os.path.join(self.prj.root_dir, 'sim', self.lib_name, self.cell_name)
+
+
+class FakeBagProject(LocalSchematicDB):
+    """Stand-in for BagProject, with a local schematic database and a fake simulator.
+
+    Parameters
+    ----------
+    root_dir : str
+        the root directory of the local database.
+    lvs_passed : bool
+        the result returned by run_lvs().
+    sim_time : float
+        seconds each simulation takes.
+    num_points : int
+        number of points of the inner sweep of each simulation.
+    num_failures : int
+        number of simulations that fail before simulations succeed.
+    """
+
+    def __init__(self, root_dir, lvs_passed=True, sim_time=0.0, num_points=101, num_failures=0):
+        LocalSchematicDB.__init__(self, root_dir, lvs_passed=lvs_passed)
+        self.sim_time = sim_time
+        self.num_points = num_points
+        self.num_failures = num_failures
+        # number of simulations started
+        self.num_sims = 0
+        self._lock = threading.Lock()
+        # (library, cell) -> testbench settings
+        self._tb_states = {}
+
+    def configure_testbench(self, tb_lib, tb_cell):
+        return FakeTestbench(self, tb_lib, tb_cell)
+
+    def get_tb_state(self, lib_name, cell_name):
+        """Returns a copy of the stored settings of a testbench cell."""
+        with self._lock:
+            state = self._tb_states.get((lib_name, cell_name), None)
+        if state is None:
+            return dict(params={}, sweeps={}, view=None, sim_envs=['tt'])
+        return dict(params=dict(state['params']), sweeps=dict(state['sweeps']), view=state['view'],
+                    sim_envs=list(state['sim_envs']))
+
+    def set_tb_state(self, lib_name, cell_name, state):
+        """Store the settings of a testbench cell."""
+        state = dict(params=dict(state['params']), sweeps=dict(state['sweeps']), view=state['view'],
+                     sim_envs=list(state['sim_envs']))
+        with self._lock:
+            self._tb_states[(lib_name, cell_name)] = state
+
+    def _count_simulation(self):
+        with self._lock:
+            self.num_sims += 1
+            return self.num_sims <= self.num_failures
+
+    def start_simulation(self, tb):
+        fail = self._count_simulation()
+        if self.sim_time > 0:
+            time.sleep(self.sim_time)
+        if fail:
+            raise ValueError('simulation of %s failed' % tb.cell_name)
+
+    async def async_start_simulation(self, tb):
+        fail = self._count_simulation()
+        if self.sim_time > 0:
+            await asyncio.sleep(self.sim_time)
+        if fail:
+            raise ValueError('simulation of %s failed' % tb.cell_name)
+
+
+def fake_testbench_handler(prj):
+    """Returns a job handler for :func:`xbase_demo.jobqueue.run_worker` using the fake simulator.
+
+    The handler runs testbench jobs like :func:`xbase_demo.core.run_testbench_job`, and
+    saves results with :func:`save_sim_hdf5`.
+    """
+    def handler(config):
+        tb = prj.configure_testbench(config['impl_lib'], config['tb_gen_cell'])
+        for key, val in config['tb_params'].items():
+            tb.set_parameter(key, val)
+        for key, val_list in (config.get('tb_sweeps', None) or {}).items():
+            tb.set_sweep_parameter(key, values=list(val_list))
+        tb.set_simulation_view(config['impl_lib'], config['gen_cell'], config['view_name'])
+        tb.set_simulation_environments(list(config['sim_envs']))
+        tb.update_testbench()
+        tb.run_simulation()
+        save_sim_hdf5(tb.results, config['data_fname'])
+        return dict(data_fname=config['data_fname'])
+
+    return handler
+
+
+class _SyntheticFunction(object):
+    """A transistor function of :class:`SyntheticMOSDB`.
+
+    Evaluates all corners of env_list, with the corner as the last axis of the result,
+    or one corner without a corner axis if env is given.
+    """
+
+    def __init__(self, mos_db, name, intent, env_list=None, env=None):
+        self._mos_db = mos_db
+        self._name = name
+        self._intent = intent
+        self._env_list = [env] if env is not None else env_list
+        self._squeeze = env is not None
+
+    def __call__(self, xmat):
+        xmat = np.asarray(xmat, dtype=float)
+        ans = np.stack([self._mos_db.evaluate(self._name, self._intent, env, xmat) for env in self._env_list],
+                       axis=-1)
+        return ans[..., 0] if self._squeeze else ans
+
+    def get_input_range(self, idx):
+        return self._mos_db.input_ranges[idx]
+
+
+class SyntheticMOSDB(object):
+    """Stand-in for ckt_dsn_ec.mos.core.MOSDBDiscrete with a smooth analytical device model.
+
+    Implements the queries used by :mod:`xbase_demo.demo_dsn`.  Functions take
+    (vbs, vds, vgs) arguments, and pmos voltages are negative, as in the real database.
+
+    Parameters
+    ----------
+    mos_type : str
+        nch or pch.
+    env_list : list[str]
+        the process corners.
+    intent_list : list[str]
+        the threshold flavors.
+    vdd : float
+        the supply voltage, which bounds the vds and vgs input ranges.
+    """
+
+    _arg_names = ('vbs', 'vds', 'vgs')
+
+    def __init__(self, mos_type='nch', env_list=('tt',), intent_list=('standard', 'lvt'), vdd=1.0):
+        self.sign = 1.0 if mos_type == 'nch' else -1.0
+        self.env_list = list(env_list)
+        self._intent_list = list(intent_list)
+        self._intent = self._intent_list[0]
+        self._w = 4
+        vrange = (0.0, vdd) if self.sign > 0 else (-vdd, 0.0)
+        self.input_ranges = [(-0.2, 0.2), vrange, vrange]
+
+    def get_dsn_param_values(self, name):
+        if name == 'intent':
+            return list(self._intent_list)
+        if name == 'w':
+            return [self._w]
+        raise ValueError('Unknown design parameter: %s' % name)
+
+    def set_dsn_params(self, **kwargs):
+        if 'intent' in kwargs:
+            if kwargs['intent'] not in self._intent_list:
+                raise ValueError('Unknown intent: %s' % kwargs['intent'])
+            self._intent = kwargs['intent']
+        if 'w' in kwargs:
+            self._w = kwargs['w']
+
+    def get_fun_arg_index(self, name):
+        return self._arg_names.index(name)
+
+    def get_fun_arg(self, vbs=0.0, vds=0.0, vgs=0.0):
+        return np.array([vbs, vds, vgs], dtype=float)
+
+    def get_function(self, name):
+        return _SyntheticFunction(self, name, self._intent, env_list=list(self.env_list))
+
+    def get_function_list(self, name):
+        return [_SyntheticFunction(self, name, self._intent, env=env) for env in self.env_list]
+
+    def evaluate(self, name, intent, env, xmat):
+        """Evaluate a transistor function in one corner.  xmat has (vbs, vds, vgs) in its last axis."""
+        vbs, vds, vgs = xmat[..., 0], xmat[..., 1], xmat[..., 2]
+        corner = _corner_scale(env)
+        intent_idx = self._intent_list.index(intent)
+        vth = (0.35 - 0.1 * intent_idx) * (2.0 - corner) - 0.1 * self.sign * vbs
+        k = 1e-3 * corner * self._w / 4
+        n_vt = 0.04
+        vov = self.sign * vgs - vth
+        # smooth square law with subthreshold conduction, channel length modulation,
+        # a smooth triode region, and junction leakage so the current is never zero
+        soft = n_vt * np.logaddexp(0.0, vov / n_vt)
+        sig = 0.5 * (1 + np.tanh(vov / (2 * n_vt)))
+        vds_mag = np.maximum(self.sign * vds, 0.0)
+        clm = 1 + 0.2 * vds_mag
+        sat = np.tanh(vds_mag / 0.1)
+        if name == 'ibias':
+            return k * soft ** 2 * clm * sat + 1e-12 * (1 + vds_mag)
+        if name == 'gm':
+            return 2 * k * soft * sig * clm * sat
+        if name == 'gds':
+            return k * soft ** 2 * (0.2 * sat + clm * (1 - sat ** 2) / 0.1) + 1e-12
+        if name == 'cdd':
+            return 1e-15 * self._w * (1 + 0.5 * sig)
+        if name == 'css':
+            return 1e-15 * self._w * (1 + sig)
+        raise ValueError('Unknown function: %s' % name)
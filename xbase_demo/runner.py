@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Run the design flow of many designs concurrently.
+
+:func:`run_designs` runs every design of a specification file in a pool of
+worker processes.  A BagProject is a single database and simulator
+connection that is not thread-safe, so each worker process creates its own
+BagProject and designs in different workers never share a connection.
+Designs implementing the same cell, such as amp_sf and amp_sf_soln, run one
+after the other in the same worker.
+
+Two semaphores shared by all workers limit the resources of the machine:
+max_layouts bounds the number of layouts computed at once, which use one CPU
+each, and max_sims bounds the number of designs simulating at once, each of
+which holds a simulator license.
+
+Status and step timing of all designs are collected in one report.
+"""
+
+import os
+import json
+import time
+import importlib
+import traceback
+import multiprocessing
+from contextlib import nullcontext
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+# BagProject and resource semaphores of this worker process, set by _init_worker()
+_worker_prj = None
+_worker_prj_factory = None
+_layout_sem = None
+_sim_sem = None
+
+
+def get_design_names(specs):
+    """Returns the names of all design entries in the given specifications, in file order.
+
+    Sweep entries are not designs and are skipped.
+    """
+    return [name for name, val in specs.items()
+            if isinstance(val, Mapping) and 'layout_class' in val and 'sweep' not in val]
+
+
+def get_layout_class(dsn_specs):
+    """Returns the layout generator class of the given design specification."""
+    lay_module = importlib.import_module(dsn_specs['layout_package'])
+    return getattr(lay_module, dsn_specs['layout_class'])
+
+
+def _init_worker(prj_factory, layout_sem, sim_sem):
+    global _worker_prj_factory, _layout_sem, _sim_sem
+    _worker_prj_factory = prj_factory
+    _layout_sem = layout_sem
+    _sim_sem = sim_sem
+
+
+def _get_worker_prj():
+    # each worker process creates its BagProject on its first design
+    global _worker_prj
+    if _worker_prj is None:
+        if _worker_prj_factory is None:
+            from bag import BagProject
+            _worker_prj = BagProject()
+        else:
+            _worker_prj = _worker_prj_factory()
+    return _worker_prj
+
+
+def _run_design_group(specs, dsn_names, run_lvs):
+    # runs in a worker process.  The designs implement the same cell, so run them in order.
+    return [run_design(_get_worker_prj(), specs, name, run_lvs=run_lvs, layout_sem=_layout_sem,
+                       sim_sem=_sim_sem) for name in dsn_names]
+
+
+def run_design(prj, specs, dsn_name, run_lvs=True, layout_sem=None, sim_sem=None):
+    """Run the flow of one design.
+
+    Parameters
+    ----------
+    prj : :class:`bag.BagProject`
+        the BagProject instance.  Only used by this design.
+    specs : dict[str, any]
+        the top level specifications.
+    dsn_name : str
+        the design name.
+    run_lvs : bool
+        True to run LVS.
+    layout_sem : multiprocessing.Semaphore or None
+        if given, held while the layout is generated.
+    sim_sem : multiprocessing.Semaphore or None
+        if given, held while the testbenches simulate.
+
+    Returns
+    -------
+    report : dict[str, any]
+        the design report.  Has entries 'name', 'status', 'error', 'timing', a dictionary
+        from step name to (start time, end time), and 'data_files'.
+    """
+    # bag is only needed in the worker processes
+    from .core import (gen_layout, gen_dut_schematic, gen_tb_schematics, _run_lvs, setup_testbenches,
+                       run_testbenches)
+
+    dsn_specs = specs[dsn_name]
+    impl_lib = dsn_specs['impl_lib']
+    gen_cell = dsn_specs['gen_cell']
+
+    report = dict(name=dsn_name, impl_lib=impl_lib, gen_cell=gen_cell, status='ok', error=None,
+                  timing={}, data_files=[])
+    timing = report['timing']
+
+    def timed(step, sem, fun, *args, **kwargs):
+        # timing starts when the step holds its resource
+        with sem or nullcontext():
+            t0 = time.time()
+            ans = fun(*args, **kwargs)
+            timing[step] = (t0, time.time())
+        return ans
+
+    try:
+        lay_cls = get_layout_class(dsn_specs)
+        sch_params = timed('layout', layout_sem, gen_layout, prj, specs, dsn_name, lay_cls)
+        timed('dut_schematic', None, gen_dut_schematic, prj, specs, dsn_name, sch_params)
+        timed('tb_schematics', None, gen_tb_schematics, prj, specs, dsn_name)
+        if run_lvs:
+            timed('lvs', None, _run_lvs, prj, impl_lib, gen_cell)
+        tb_dict = timed('tb_setup', None, setup_testbenches, prj, specs, dsn_name)
+        timed('simulation', sim_sem, run_testbenches, specs, dsn_name, tb_dict)
+        report['data_files'] = [os.path.join(dsn_specs['data_dir'], '%s_%s.hdf5' % (gen_cell, name))
+                                for name in tb_dict]
+    except Exception as ex:
+        report['status'] = 'failed'
+        report['error'] = '%s: %s' % (type(ex).__name__, ex)
+        report['traceback'] = traceback.format_exc()
+        print('%s failed: %s' % (dsn_name, report['error']))
+
+    return report
+
+
+def run_designs(specs, dsn_names=None, max_workers=4, max_layouts=None, max_sims=None, run_lvs=True,
+                report_fname=None, prj_factory=None):
+    """Run the flow of many designs concurrently, each worker process with its own BagProject.
+
+    A failed design does not stop the others.
+
+    Parameters
+    ----------
+    specs : dict[str, any]
+        the top level specifications.
+    dsn_names : list[str] or None
+        the designs to run.  Defaults to all designs in specs.
+    max_workers : int
+        number of worker processes.
+    max_layouts : int or None
+        maximum number of layouts generated at once.  None for no limit.
+    max_sims : int or None
+        maximum number of designs simulating at once, e.g. the number of simulator
+        licenses.  None for no limit.
+    run_lvs : bool
+        True to run LVS.
+    report_fname : str or None
+        if given, the report is also written to this JSON file.
+    prj_factory : callable or None
+        picklable function that creates the BagProject of a worker process.  Defaults
+        to bag.BagProject.
+
+    Returns
+    -------
+    report : dict[str, any]
+        the aggregated report.  Has entries 'designs', the list of design reports in the
+        given order, 'num_failed', and 'elapsed'.
+    """
+    if dsn_names is None:
+        dsn_names = get_design_names(specs)
+    else:
+        for name in dsn_names:
+            if 'sweep' in specs[name]:
+                raise ValueError('%s is a sweep entry.  Expand it with '
+                                 'xbase_demo.sweep.expand_all_sweeps() or run it with '
+                                 'xbase_demo.sweep.run_sweep().' % name)
+
+    # designs implementing the same cell run in one job, one after the other
+    groups = OrderedDict()
+    for name in dsn_names:
+        groups.setdefault((specs[name]['impl_lib'], specs[name]['gen_cell']), []).append(name)
+
+    ctx = multiprocessing.get_context('spawn')
+    layout_sem = None if max_layouts is None else ctx.Semaphore(max_layouts)
+    sim_sem = None if max_sims is None else ctx.Semaphore(max_sims)
+    t_start = time.time()
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(prj_factory, layout_sem, sim_sem)) as executor:
+        futures = [executor.submit(_run_design_group, specs, names, run_lvs) for names in groups.values()]
+        report_dict = {dsn_report['name']: dsn_report for future in futures for dsn_report in future.result()}
+    elapsed = time.time() - t_start
+    dsn_reports = [report_dict[name] for name in dsn_names]
+
+    # report step times relative to the start of the run
+    for dsn_report in dsn_reports:
+        dsn_report['timing'] = {step: (t0 - t_start, t1 - t_start)
+                                for step, (t0, t1) in dsn_report['timing'].items()}
+
+    report = dict(designs=dsn_reports, elapsed=elapsed,
+                  num_failed=sum(1 for val in dsn_reports if val['status'] != 'ok'))
+    print_report(report)
+    if report_fname is not None:
+        dir_name = os.path.dirname(os.path.abspath(report_fname))
+        os.makedirs(dir_name, exist_ok=True)
+        with open(report_fname, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    return report
+
+
+def print_report(report):
+    """Print a summary of the report returned by :func:`run_designs`."""
+    print('%-16s %-8s %s' % ('design', 'status', 'steps'))
+    for dsn_report in report['designs']:
+        steps = ', '.join('%s=%.1fs' % (step, t1 - t0) for step, (t0, t1) in dsn_report['timing'].items())
+        print('%-16s %-8s %s' % (dsn_report['name'], dsn_report['status'], steps))
+        if dsn_report['error'] is not None:
+            print('    %s' % dsn_report['error'])
+    print('%d designs, %d failed, elapsed=%.1fs' % (len(report['designs']), report['num_failed'],
+                                                   report['elapsed']))
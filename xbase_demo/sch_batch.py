@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Batched schematic implementation.
+
+:class:`SchematicBatch` collects designed schematic modules and implements
+all of them in one database operation, recording per-cell timing.
+"""
+
+import time
+from contextlib import contextmanager
+
+
+class SchematicBatch(object):
+    """Collects designed schematic modules and implements them together.
+
+    If all collected modules belong to the same master database and that database
+    supports instantiate_masters(), every cell is created in one database operation.
+    Otherwise each module's implement_design() is called in turn.
+
+    Design modules of the BAG version used by this repository have no master
+    database, so with a real BagProject cells are always implemented one at a time.
+    Batch mode then only defers implementation until every module is designed.  One
+    database operation is available with :class:`xbase_demo.offline.LocalSchematicDB`.
+
+    Parameters
+    ----------
+    impl_lib : str
+        the implementation library name.
+    """
+
+    def __init__(self, impl_lib):
+        self._impl_lib = impl_lib
+        self._entries = []
+        # cell name -> dictionary of step name to time in seconds
+        self.timing = {}
+        # total time of each batched commit
+        self.commit_times = []
+
+    @contextmanager
+    def timer(self, cell_name, step):
+        """Time a step of generating the given cell."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            cell_timing = self.timing.setdefault(cell_name, {})
+            cell_timing[step] = cell_timing.get(step, 0.0) + time.perf_counter() - t0
+
+    def add(self, dsn, cell_name):
+        """Add a designed module to be implemented as the given cell."""
+        self._entries.append((dsn, cell_name))
+
+    def commit(self):
+        """Implement all collected modules."""
+        if not self._entries:
+            return
+
+        dsn_list = [dsn for dsn, _ in self._entries]
+        name_list = [name for _, name in self._entries]
+        self._entries = []
+
+        master_db = getattr(dsn_list[0], 'master_db', None)
+        if (len(dsn_list) > 1 and hasattr(master_db, 'instantiate_masters') and
+                all(getattr(dsn, 'master_db', None) is master_db for dsn in dsn_list)):
+            print('creating %s schematics' % ', '.join(name_list))
+            t0 = time.perf_counter()
+            master_db.instantiate_masters(dsn_list, name_list=name_list, lib_name=self._impl_lib)
+            self.commit_times.append(time.perf_counter() - t0)
+        else:
+            for dsn, name in zip(dsn_list, name_list):
+                print('creating %s schematics' % name)
+                with self.timer(name, 'implement'):
+                    dsn.implement_design(self._impl_lib, top_cell_name=name)
+
+    def print_timing(self):
+        """Print per-cell design/implementation time."""
+        print('%-32s %12s %12s' % ('cell', 'design (s)', 'implement (s)'))
+        for name in sorted(self.timing.keys()):
+            info = self.timing[name]
+            impl_time = info.get('implement', None)
+            impl_str = 'batched' if impl_time is None else '%.4g' % impl_time
+            print('%-32s %12.4g %12s' % (name, info.get('design', 0.0), impl_str))
+        for idx, commit_time in enumerate(self.commit_times):
+            print('batched commit %d: %.4g s' % (idx, commit_time))
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Change detection for generated schematics.
+
+Each generated cell is keyed by a hash of its schematic generator, design
+parameters and the netlist_info YAML files of the cell and all its sub-cells.
+The keys of the last run are kept in a JSON manifest, so unchanged cells can
+be skipped.
+"""
+
+import os
+import json
+import hashlib
+
+from BagModules.lazy_library import get_netlist_info_path
+from .netlist_info import load_netlist_info
+
+
+def get_netlist_yaml(lib_name, cell_name):
+    """Returns the netlist_info YAML file of the given design module, or None if not found."""
+    try:
+        return get_netlist_info_path(lib_name, cell_name)
+    except ModuleNotFoundError:
+        # not a BagModules library, e.g. primitives
+        return None
+
+
+def get_netlist_yaml_list(lib_name, cell_name):
+    """Returns the netlist_info YAML files of the given design module and all its sub-cells.
+
+    Sub-cells without a netlist_info file, such as primitives, are skipped.
+    """
+    ans = []
+    visited = set()
+    stack = [(lib_name, cell_name)]
+    while stack:
+        key = stack.pop()
+        if key in visited:
+            continue
+        visited.add(key)
+        fname = get_netlist_yaml(*key)
+        if fname is None or not os.path.isfile(fname):
+            continue
+        ans.append(fname)
+        instances = load_netlist_info(fname).get('instances', None) or {}
+        stack.extend((inst['lib_name'], inst['cell_name']) for inst in instances.values())
+    return sorted(ans)
+
+
+def compute_cell_key(lib_name, cell_name, params, extra_files=()):
+    """Compute the change detection key of a generated schematic.
+
+    Parameters
+    ----------
+    lib_name : str
+        the schematic generator library name.
+    cell_name : str
+        the schematic generator cell name.
+    params : dict[str, any]
+        the design parameters.
+    extra_files : list[str]
+        additional files the schematic depends on, such as stimulus files.
+
+    Returns
+    -------
+    key : str
+        the hash of all inputs of the schematic.
+    """
+    h = hashlib.sha1()
+    h.update(json.dumps([lib_name, cell_name, params], sort_keys=True, default=repr).encode('utf-8'))
+    fname_list = get_netlist_yaml_list(lib_name, cell_name)
+    fname_list.extend(extra_files)
+    for fname in fname_list:
+        if os.path.isfile(fname):
+            with open(fname, 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+class SchematicManifest(object):
+    """Records the key of every generated schematic, and which cells were regenerated.
+
+    Parameters
+    ----------
+    fname : str
+        the manifest file name.  Loaded if it exists.
+    """
+
+    def __init__(self, fname):
+        self._fname = fname
+        self._keys = {}
+        if os.path.isfile(fname):
+            with open(fname, 'r') as f:
+                self._keys = json.load(f).get('cells', {})
+        self.regenerated = []
+        self.skipped = []
+
+    def is_current(self, impl_lib, cell_name, key):
+        """Returns True if the given cell was generated with the given key, and records it as skipped."""
+        if self._keys.get('%s/%s' % (impl_lib, cell_name), None) == key:
+            self.skipped.append(cell_name)
+            return True
+        return False
+
+    def update(self, impl_lib, cell_name, key):
+        """Record that the given cell was regenerated with the given key."""
+        self._keys['%s/%s' % (impl_lib, cell_name)] = key
+        self.regenerated.append(cell_name)
+
+    def save(self):
+        """Write the manifest to file."""
+        dir_name = os.path.dirname(os.path.abspath(self._fname))
+        os.makedirs(dir_name, exist_ok=True)
+        with open(self._fname, 'w') as f:
+            json.dump(dict(cells=self._keys, regenerated=self.regenerated, skipped=self.skipped),
+                      f, indent=2, sort_keys=True)
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""Split testbench simulations into shards and merge their results.
+
+A testbench simulated over many corners is one long simulation job.
+:func:`make_shard_jobs` splits a testbench job into independent shards, each
+simulating a subset of the corners and, optionally, a subset of the values
+of outer sweep parameters.  Shards run in parallel, as concurrent simulations
+of one BagProject with :func:`xbase_demo.core.simulate` or on job queue
+workers with :func:`xbase_demo.jobqueue.simulate_queued`.
+
+The testbench settings of a cell are stored in the database, and a simulation
+runs whatever settings its cell has when it starts.  So every shard simulates
+its own testbench cell, named by :func:`get_shard_cell`, which
+:func:`xbase_demo.core.gen_tb_schematics` generates when given the same
+sharding options.
+
+:func:`merge_sweep_results` puts the shard results back together along the
+sharded sweep axes.  The merged results have the same sweep order and array
+shapes as an unsharded simulation, so :func:`xbase_demo.core.load_sim_data`
+and the process_tb_* functions work unchanged.
+"""
+
+import os
+from itertools import product
+
+import numpy as np
+
+
+def _split(values, chunk_size):
+    values = list(values)
+    return [values[idx:idx + chunk_size] for idx in range(0, len(values), chunk_size)]
+
+
+def split_shards(sim_envs, tb_sweeps=None, corners_per_shard=1, sweep_shards=()):
+    """Split corners and outer sweep values into shards.
+
+    Parameters
+    ----------
+    sim_envs : list[str]
+        the simulation corners.
+    tb_sweeps : dict[str, list[any]] or None
+        the simulator sweeps of the testbench.
+    corners_per_shard : int or None
+        number of corners in each shard.  None to keep all corners in one shard.
+    sweep_shards : list[str]
+        sweep parameters to split, one value per shard.
+
+    Returns
+    -------
+    shard_list : list[dict[str, list[any]]]
+        one dictionary per shard, from sharded sweep name to its values in the shard.
+        Corners are under 'corner'.  Sweep parameters that are not sharded are omitted.
+    """
+    tb_sweeps = tb_sweeps or {}
+    for name in sweep_shards:
+        if name not in tb_sweeps:
+            raise ValueError('Cannot shard %s: not a testbench sweep parameter.' % name)
+
+    names = ['corner']
+    chunk_lists = [_split(sim_envs, corners_per_shard or len(sim_envs))]
+    for name in sweep_shards:
+        names.append(name)
+        chunk_lists.append(_split(tb_sweeps[name], 1))
+    return [dict(zip(names, chunks)) for chunks in product(*chunk_lists)]
+
+
+def get_shard_fname(data_fname, shard_idx):
+    """Returns the result file name of a shard."""
+    dir_name, base_name = os.path.split(data_fname)
+    root, ext = os.path.splitext(base_name)
+    return os.path.join(dir_name, 'shards', '%s_shard%d%s' % (root, shard_idx, ext))
+
+
+def get_shard_cell(tb_gen_cell, shard_idx):
+    """Returns the testbench cell name of a shard."""
+    return '%s_shard%d' % (tb_gen_cell, shard_idx)
+
+
+def get_shard_cells(tb_gen_cell, sim_envs, tb_sweeps=None, corners_per_shard=1, sweep_shards=()):
+    """Returns the testbench cell names of all shards of a testbench.
+
+    The arguments are the same as :func:`make_shard_jobs`, which simulates shard i in
+    the i-th cell of the returned list.
+    """
+    tb_sweeps = tb_sweeps or {}
+    sweep_shards = [name for name in sweep_shards if name in tb_sweeps]
+    shard_list = split_shards(sim_envs, tb_sweeps, corners_per_shard=corners_per_shard, sweep_shards=sweep_shards)
+    return [get_shard_cell(tb_gen_cell, shard_idx) for shard_idx in range(len(shard_list))]
+
+
+def make_shard_jobs(config, corners_per_shard=1, sweep_shards=()):
+    """Split a testbench job configuration into shard job configurations.
+
+    Parameters
+    ----------
+    config : dict[str, any]
+        the testbench job configuration, as returned by
+        :func:`xbase_demo.jobqueue.make_testbench_jobs`.
+    corners_per_shard : int or None
+        number of corners in each shard.  None to keep all corners in one shard.
+    sweep_shards : list[str]
+        sweep parameters to split, one value per shard.  Parameters this testbench does
+        not sweep are ignored.
+
+    Returns
+    -------
+    shard_configs : list[dict[str, any]]
+        the shard job configurations.  Each simulates a subset of the corners and
+        sweep values in its own testbench cell, and writes results to a shard file.  The
+        sharded values are under 'shard_values', and the result file of the whole
+        testbench under 'merge_fname'.
+    """
+    tb_sweeps = config.get('tb_sweeps', None) or {}
+    sweep_shards = [name for name in sweep_shards if name in tb_sweeps]
+    shard_configs = []
+    for shard_idx, shard_values in enumerate(split_shards(config['sim_envs'], tb_sweeps,
+                                                          corners_per_shard=corners_per_shard,
+                                                          sweep_shards=sweep_shards)):
+        cur_sweeps = dict(tb_sweeps)
+        cur_sweeps.update((name, val) for name, val in shard_values.items() if name != 'corner')
+        cur_config = dict(config, tb_gen_cell=get_shard_cell(config['tb_gen_cell'], shard_idx),
+                          sim_envs=shard_values['corner'], tb_sweeps=cur_sweeps or None,
+                          data_fname=get_shard_fname(config['data_fname'], shard_idx),
+                          merge_fname=config['data_fname'], shard_values=shard_values)
+        shard_configs.append(cur_config)
+    return shard_configs
+
+
+def _add_missing_axes(results, shard_values):
+    """Add sharded sweep axes the simulator dropped because the shard had one value.
+
+    Dropped axes are added in front, so corner is the first axis, as in BAG results.
+    """
+    missing = [name for name in shard_values if name not in results]
+    if not missing:
+        return results
+    ans = dict(results)
+    sweep_params = {}
+    for var, swp_names in results['sweep_params'].items():
+        if list(swp_names) == [var]:
+            sweep_params[var] = swp_names
+        else:
+            ans[var] = np.asarray(results[var]).reshape((1,) * len(missing) + np.shape(results[var]))
+            sweep_params[var] = missing + list(swp_names)
+    for name in missing:
+        ans[name] = np.asarray(shard_values[name])
+        sweep_params[name] = [name]
+    ans['sweep_params'] = sweep_params
+    return ans
+
+
+def merge_sweep_results(results_list, shard_values_list):
+    """Merge shard results along the sharded sweep axes.
+
+    Parameters
+    ----------
+    results_list : list[dict[str, any]]
+        the simulation results of each shard, in the format of bag.data.load_sim_results.
+    shard_values_list : list[dict[str, list[any]]]
+        the sharded sweep values of each shard, as returned by :func:`split_shards`.
+
+    Returns
+    -------
+    results : dict[str, any]
+        the merged results.  Sweep values are in shard order.
+    """
+    if not results_list:
+        raise ValueError('No shard results to merge.')
+
+    # full values of each sharded sweep, and the position of each shard value in them.
+    full_values = {}
+    for shard_values in shard_values_list:
+        for name, values in shard_values.items():
+            cur_list = full_values.setdefault(name, [])
+            cur_list.extend(val for val in values if val not in cur_list)
+    # a sweep with one value in total is not an axis if the simulator dropped it.
+    for name, values in list(full_values.items()):
+        if len(values) == 1 and not any(name in results for results in results_list):
+            del full_values[name]
+    shard_values_list = [{name: values for name, values in shard_values.items() if name in full_values}
+                         for shard_values in shard_values_list]
+    results_list = [_add_missing_axes(results, shard_values)
+                    for results, shard_values in zip(results_list, shard_values_list)]
+    shard_indices = [{name: np.array([full_values[name].index(val) for val in values], dtype=int)
+                      for name, values in shard_values.items()}
+                     for shard_values in shard_values_list]
+
+    first = results_list[0]
+    sweep_params = first['sweep_params']
+    merged = dict(sweep_params={var: list(swp_names) for var, swp_names in sweep_params.items()})
+    for var, swp_names in sweep_params.items():
+        if var in full_values:
+            # sweep values as reported by the simulator, in merged order
+            values = np.concatenate([np.asarray(results[var]) for results in results_list])
+            positions = np.concatenate([indices[var] for indices in shard_indices])
+            merged[var] = values[np.unique(positions, return_index=True)[1]]
+            continue
+        if not any(name in full_values for name in swp_names):
+            merged[var] = first[var]
+            continue
+
+        first_arr = np.asarray(first[var])
+        shape = tuple(len(full_values[name]) if name in full_values else first_arr.shape[axis]
+                      for axis, name in enumerate(swp_names))
+        dtype = np.result_type(*(np.asarray(results[var]) for results in results_list))
+        arr = np.empty(shape, dtype=dtype)
+        filled = np.zeros(shape, dtype=bool)
+        for results, indices in zip(results_list, shard_indices):
+            if results['sweep_params'][var] != swp_names:
+                raise ValueError('Cannot merge %s: shards have different sweep orders.' % var)
+            idx = np.ix_(*(indices[name] if name in indices else np.arange(dim)
+                           for name, dim in zip(swp_names, shape)))
+            arr[idx] = results[var]
+            filled[idx] = True
+        if not filled.all():
+            raise ValueError('Cannot merge %s: shards do not cover all sweep values.' % var)
+        merged[var] = arr
+
+    return merged
+
+
+def merge_shard_files(shard_configs, data_fname, load_fun=None, save_fun=None, remove=True):
+    """Merge shard result files into one result file.
+
+    Parameters
+    ----------
+    shard_configs : list[dict[str, any]]
+        the shard job configurations, as returned by :func:`make_shard_jobs`.
+    data_fname : str
+        the merged result file name.
+    load_fun : callable or None
+        function that loads a result file.  Defaults to bag.data.load_sim_file.
+    save_fun : callable or None
+        function that saves results to a file.  Defaults to bag.data.save_sim_results.
+    remove : bool
+        True to remove the shard files after merging.
+
+    Returns
+    -------
+    results : dict[str, any]
+        the merged results.
+    """
+    if load_fun is None or save_fun is None:
+        from bag.data import load_sim_file, save_sim_results
+        load_fun = load_fun or load_sim_file
+        save_fun = save_fun or save_sim_results
+
+    results = merge_sweep_results([load_fun(config['data_fname']) for config in shard_configs],
+                                  [config['shard_values'] for config in shard_configs])
+    # write to a temporary file first, so readers never see a partial file.
+    tmp_fname = '%s.%d.tmp' % (data_fname, os.getpid())
+    save_fun(results, tmp_fname)
+    os.replace(tmp_fname, data_fname)
+    if remove:
+        for config in shard_configs:
+            os.remove(config['data_fname'])
+        try:
+            os.rmdir(os.path.dirname(shard_configs[0]['data_fname']))
+        except OSError:
+            # other shard files remain
+            pass
+    return results
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""Post-processing and plotting of testbench simulation results.
+
+These functions take results in the format of bag.data.load_sim_results, as
+returned by :func:`xbase_demo.core.simulate` and
+:func:`xbase_demo.core.load_sim_data`, and do not need BAG itself.
+"""
+
+from itertools import product
+
+import numpy as np
+
+
+def split_data_by_sweep(results, var_list):
+    sweep_names = results['sweep_params'][var_list[0]][:-1]
+    combo_list = []
+    for name in sweep_names:
+        combo_list.append(range(results[name].size))
+
+    if combo_list:
+        idx_list_iter = product(*combo_list)
+    else:
+        idx_list_iter = [[]]
+
+    ans_list = []
+    for idx_list in idx_list_iter:
+        cur_label_list = []
+        for name, idx in zip(sweep_names, idx_list):
+            swp_val = results[name][idx]
+            if isinstance(swp_val, str):
+                cur_label_list.append('%s=%s' % (name, swp_val))
+            else:
+                cur_label_list.append('%s=%.4g' % (name, swp_val))
+
+        if cur_label_list:
+            label = ', '.join(cur_label_list)
+        else:
+            label = ''
+
+        cur_idx_list = list(idx_list)
+        cur_idx_list.append(slice(None))
+
+        cur_results = {var: results[var][tuple(cur_idx_list)] for var in var_list}
+        ans_list.append((label, cur_results))
+
+    return ans_list
+
+
+def process_tb_dc(tb_results, plot=True):
+    # scipy and matplotlib are slow to import, so only import them when needed
+    import scipy.interpolate as interp
+
+    result_list = split_data_by_sweep(tb_results, ['vin', 'vout'])
+
+    plot_data_list = []
+    for label, res_dict in result_list:
+        cur_vin = res_dict['vin']
+        cur_vout = res_dict['vout']
+
+        cur_vin, vin_arg = np.unique(cur_vin, return_index=True)
+        cur_vout = cur_vout[vin_arg]
+        vout_fun = interp.InterpolatedUnivariateSpline(cur_vin, cur_vout)
+        vout_diff_fun = vout_fun.derivative(1)
+
+        print('%s, gain=%.4g' % (label, vout_diff_fun(0)))
+        plot_data_list.append((label, cur_vin, cur_vout, vout_diff_fun(cur_vin)))
+
+    if plot:
+        import matplotlib.pyplot as plt
+
+        f, (ax1, ax2) = plt.subplots(2, sharex='all')
+        ax1.set_title('Vout vs Vin')
+        ax1.set_ylabel('Vout (V)')
+        ax2.set_title('Gain vs Vin')
+        ax2.set_ylabel('Gain (V/V)')
+        ax2.set_xlabel('Vin (V)')
+
+        for label, vin, vout, vdiff in plot_data_list:
+            if label:
+                ax1.plot(cur_vin, cur_vout, label=label)
+                ax2.plot(cur_vin, vout_diff_fun(cur_vin), label=label)
+            else:
+                ax1.plot(cur_vin, cur_vout)
+                ax2.plot(cur_vin, vout_diff_fun(cur_vin))
+
+        if len(result_list) > 1:
+            ax1.legend()
+            ax2.legend()
+
+
+def process_tb_ac(tb_results, plot=True):
+    import scipy.interpolate as interp
+    import scipy.optimize as sciopt
+
+    result_list = split_data_by_sweep(tb_results, ['vout_ac'])
+
+    freq = tb_results['freq']
+    log_freq = np.log10(freq)
+    plot_data_list = []
+    for label, res_dict in result_list:
+        cur_vout = res_dict['vout_ac']
+        cur_mag = 20 * np.log10(np.abs(cur_vout))  # type: np.ndarray
+        cur_ang = np.angle(cur_vout, deg=True)
+
+        # interpolate log-log plot
+        mag_fun = interp.InterpolatedUnivariateSpline(log_freq, cur_mag)
+        ang_fun = interp.InterpolatedUnivariateSpline(log_freq, cur_ang)
+        # find 3db and unity gain frequency
+        dc_gain = cur_mag[0]
+        lf0 = log_freq[0]
+        lf1 = log_freq[-1]
+        try:
+            lf_3db = sciopt.brentq(lambda x: mag_fun(x) - (dc_gain - 3), lf0, lf1)  # type: float
+            freq_3db = 10.0 ** lf_3db
+        except ValueError:
+            freq_3db = -1
+        try:
+            # noinspection PyTypeChecker
+            lf_unity = sciopt.brentq(mag_fun, lf0, lf1)  # type: float
+            freq_unity = 10.0 ** lf_unity
+        except ValueError:
+            lf_unity = 0
+            freq_unity = -1
+
+        # find phase margin
+        if freq_unity > 0:
+            # noinspection PyTypeChecker
+            pm = 180 + ang_fun(lf_unity) - ang_fun(lf0)
+        else:
+            pm = 360
+
+        print('%s, f_3db=%.4g, f_unity=%.4g, phase_margin=%.4g' % (label, freq_3db, freq_unity, pm))
+        plot_data_list.append((label, cur_mag, cur_ang))
+
+    if plot:
+        import matplotlib.pyplot as plt
+
+        f, (ax1, ax2) = plt.subplots(2, sharex='all')
+        ax1.set_title('Magnitude vs Frequency')
+        ax1.set_ylabel('Magnitude (dB)')
+        ax2.set_title('Phase vs Frequency')
+        ax2.set_ylabel('Phase (Degrees)')
+        ax2.set_xlabel('Frequency (Hz)')
+
+        for label, cur_mag, cur_ang in plot_data_list:
+            if label:
+                ax1.semilogx(freq, cur_mag, label=label)
+                ax2.semilogx(freq, cur_ang, label=label)
+            else:
+                ax1.semilogx(freq, cur_mag)
+                ax2.semilogx(freq, cur_ang)
+
+        if len(result_list) > 1:
+            ax1.legend()
+            ax2.legend()
+
+
+def _crossing_time(tvec, yvec, level):
+    """Returns the first time yvec reaches level, linearly interpolated, or -1 if it never does."""
+    above = yvec >= level
+    idx = int(np.argmax(above))
+    if not above[idx]:
+        return -1
+    if idx == 0:
+        return tvec[0]
+    t0, t1 = tvec[idx - 1], tvec[idx]
+    y0, y1 = yvec[idx - 1], yvec[idx]
+    return t0 + (t1 - t0) * (level - y0) / (y1 - y0)
+
+
+def get_step_response(tvec, vout, settle_tol=0.02):
+    """Measure the step response of a transient waveform.
+
+    The step goes from the first to the last value of vout.
+
+    Parameters
+    ----------
+    tvec : np.ndarray
+        the time vector.
+    vout : np.ndarray
+        the output waveform.
+    settle_tol : float
+        the settling error tolerance, relative to the step size.
+
+    Returns
+    -------
+    t_rise : float
+        the 10% to 90% transition time, or -1 if there is no step.
+    t_settle : float
+        time after which vout stays within the tolerance of its final value, or -1 if
+        there is no step.
+    overshoot : float
+        the overshoot, relative to the step size.
+    """
+    swing = vout[-1] - vout[0]
+    if swing == 0:
+        return -1, -1, 0.0
+
+    # normalized step from 0 to 1, so falling steps are measured the same way
+    ynorm = (vout - vout[0]) / swing
+    t_rise = _crossing_time(tvec, ynorm, 0.9) - _crossing_time(tvec, ynorm, 0.1)
+    outside = np.flatnonzero(np.abs(ynorm - 1) > settle_tol)
+    t_settle = tvec[outside[-1] + 1] - tvec[0] if outside.size else 0.0
+    overshoot = max(float(np.max(ynorm)) - 1, 0.0)
+    return t_rise, t_settle, overshoot
+
+
+def process_tb_tran(tb_results, plot=True):
+    result_list = split_data_by_sweep(tb_results, ['vout_tran'])
+
+    tvec = tb_results['time']
+    plot_data_list = []
+    for label, res_dict in result_list:
+        cur_vout = res_dict['vout_tran']
+
+        t_rise, t_settle, overshoot = get_step_response(tvec, cur_vout)
+        print('%s, t_rise=%.4g, t_settle=%.4g, overshoot=%.4g%%' % (label, t_rise, t_settle, overshoot * 100))
+        plot_data_list.append((label, cur_vout))
+
+    if plot:
+        import matplotlib.pyplot as plt
+
+        plt.figure()
+        plt.title('Vout vs Time')
+        plt.ylabel('Vout (V)')
+        plt.xlabel('Time (s)')
+
+        for label, cur_vout in plot_data_list:
+            if label:
+                plt.plot(tvec, cur_vout, label=label)
+            else:
+                plt.plot(tvec, cur_vout)
+
+        if len(result_list) > 1:
+            plt.legend()
+
+
+def plot_data(results_dict, plot=True):
+    process_tb_dc(results_dict['tb_dc'], plot=plot)
+    process_tb_ac(results_dict['tb_ac_tran'], plot=plot)
+    process_tb_tran(results_dict['tb_ac_tran'], plot=plot)
+
+    if plot:
+        import matplotlib.pyplot as plt
+
+        plt.show()
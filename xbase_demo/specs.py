@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""Compiled, immutable flow specifications.
+
+:func:`load_specs` reads a demo.yaml style specification file once and
+compiles it into :class:`TopSpecs`, :class:`DesignSpecs` and
+:class:`TestbenchSpecs` objects.  All entries are validated up front, and
+every problem found is reported in one error.  Data directories and
+stimulus file names are resolved to absolute paths once.
+
+Spec objects are read-only mappings, so the flow functions in
+:mod:`xbase_demo.core` accept them in place of the raw YAML dictionaries.
+Nested dictionaries become :class:`FrozenDict` and lists become tuples.
+Identical values, such as testbench parameters repeated by several designs,
+are stored once and shared.  Use :func:`thaw` to get a mutable copy before
+passing a value to code that expects plain dictionaries.
+
+Spec objects can be pickled, for example to send them to worker processes,
+and copied with the copy module.
+"""
+
+import os
+import copy
+from collections.abc import Mapping
+
+import yaml
+
+try:
+    _yaml_loader = yaml.CSafeLoader
+except AttributeError:
+    _yaml_loader = yaml.SafeLoader
+
+
+class FrozenDict(Mapping):
+    """An immutable, hashable dictionary.
+
+    Parameters
+    ----------
+    data : dict[str, any]
+        the dictionary content.  Values should already be immutable.
+    """
+
+    __slots__ = ('_data', '_hash')
+
+    def __init__(self, data=None):
+        object.__setattr__(self, '_data', dict(data or {}))
+        object.__setattr__(self, '_hash', None)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('FrozenDict is immutable.')
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self, '_hash', hash(frozenset(self._data.items())))
+        return self._hash
+
+    def __repr__(self):
+        return 'FrozenDict(%r)' % self._data
+
+    def __reduce__(self):
+        return FrozenDict, (self._data,)
+
+    def __copy__(self):
+        # immutable, so a shallow copy is this object
+        return self
+
+    def __deepcopy__(self, memo):
+        return FrozenDict(copy.deepcopy(self._data, memo))
+
+
+def freeze(obj, table=None):
+    """Returns an immutable copy of the given value.
+
+    Dictionaries become FrozenDict, and lists become tuples.  If table is given, it maps
+    frozen values to their first instance, so equal values share one object.
+    """
+    if isinstance(obj, Mapping):
+        ans = FrozenDict({key: freeze(val, table) for key, val in obj.items()})
+    elif isinstance(obj, (list, tuple)):
+        ans = tuple(freeze(val, table) for val in obj)
+    else:
+        return obj
+
+    if table is not None:
+        try:
+            return table.setdefault(ans, ans)
+        except TypeError:
+            # contains unhashable values
+            pass
+    return ans
+
+
+def thaw(obj):
+    """Returns a mutable deep copy of the given value, with mappings as dict and sequences as list."""
+    if isinstance(obj, _SpecBase):
+        return obj.thaw()
+    if isinstance(obj, Mapping):
+        return {key: thaw(val) for key, val in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [thaw(val) for val in obj]
+    return obj
+
+
+class _SpecBase(Mapping):
+    """Base class of spec objects.  Fields are also accessible as mapping keys."""
+
+    __slots__ = ('extra',)
+    _fields = ()
+
+    def __setattr__(self, key, value):
+        raise AttributeError('%s is immutable.' % type(self).__name__)
+
+    def _set(self, **kwargs):
+        for key, val in kwargs.items():
+            object.__setattr__(self, key, val)
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            return getattr(self, key)
+        return self.extra[key]
+
+    def __iter__(self):
+        for key in self._fields:
+            yield key
+        for key in self.extra:
+            yield key
+
+    def __len__(self):
+        return len(self._fields) + len(self.extra)
+
+    def thaw(self):
+        """Returns this specification as plain dictionaries and lists."""
+        return {key: thaw(val) for key, val in self.items()}
+
+    def _get_state(self):
+        return {name: getattr(self, name) for cls in type(self).__mro__
+                for name in getattr(cls, '__slots__', ()) if hasattr(self, name)}
+
+    def __reduce__(self):
+        return _restore_spec, (type(self), self._get_state())
+
+    def __copy__(self):
+        # immutable, so a shallow copy is this object
+        return self
+
+    def __deepcopy__(self, memo):
+        return _restore_spec(type(self), copy.deepcopy(self._get_state(), memo))
+
+
+def _restore_spec(cls, state):
+    """Creates a spec object of the given class with the given field values.  Used by pickle."""
+    ans = cls.__new__(cls)
+    ans._set(**state)
+    return ans
+
+
+class TestbenchSpecs(_SpecBase):
+    """Specification of one testbench of a design."""
+
+    __slots__ = ('name', 'tb_lib', 'tb_cell', 'sch_params', 'tb_params')
+    _fields = ('tb_lib', 'tb_cell', 'sch_params', 'tb_params')
+
+
+class DesignSpecs(_SpecBase):
+    """Specification of one design."""
+
+    __slots__ = ('name', 'data_dir', 'impl_lib', 'sch_lib', 'sch_cell', 'gen_cell', 'layout_package',
+                 'layout_class', 'layout_params', 'testbenches')
+    _fields = ('data_dir', 'impl_lib', 'sch_lib', 'sch_cell', 'gen_cell', 'layout_package',
+               'layout_class', 'layout_params', 'testbenches')
+
+
+class TopSpecs(_SpecBase):
+    """Top level specification.  Designs are accessible by name as mapping keys."""
+
+    __slots__ = ('sim_envs', 'view_name', 'routing_grid', 'designs')
+    _fields = ('sim_envs', 'view_name', 'routing_grid')
+
+    def __getitem__(self, key):
+        dsn = self.designs.get(key, None)
+        if dsn is not None:
+            return dsn
+        return _SpecBase.__getitem__(self, key)
+
+    def __iter__(self):
+        for key in _SpecBase.__iter__(self):
+            yield key
+        for key in self.designs:
+            yield key
+
+    def __len__(self):
+        return _SpecBase.__len__(self) + len(self.designs)
+
+
+class _Compiler(object):
+    """Validates and freezes raw specifications, collecting all errors."""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.errors = []
+        self.table = {}
+
+    def get(self, specs, key, path, types, default=None, required=True):
+        if key not in specs:
+            if required:
+                self.errors.append('%s: missing entry %s' % (path, key))
+            return default
+        val = specs[key]
+        if not isinstance(val, types):
+            self.errors.append('%s.%s: expected %s, got %r' % (path, key, _type_names(types), val))
+            return default
+        return val
+
+    def freeze(self, val):
+        return freeze(val, self.table)
+
+    def resolve(self, fname):
+        return os.path.normpath(os.path.join(self.root_dir, fname))
+
+    def compile_testbench(self, name, specs, path):
+        sch_params = self.get(specs, 'sch_params', path, Mapping, default={})
+        tran_fname = sch_params.get('tran_fname', None)
+        if tran_fname is not None:
+            if isinstance(tran_fname, str):
+                sch_params = dict(sch_params, tran_fname=self.resolve(tran_fname))
+            else:
+                self.errors.append('%s.sch_params.tran_fname: expected str, got %r' % (path, tran_fname))
+
+        tb = TestbenchSpecs.__new__(TestbenchSpecs)
+        tb._set(name=name,
+                tb_lib=self.get(specs, 'tb_lib', path, str),
+                tb_cell=self.get(specs, 'tb_cell', path, str),
+                sch_params=self.freeze(sch_params),
+                tb_params=self.freeze(self.get(specs, 'tb_params', path, Mapping, default={})),
+                extra=self.freeze({key: val for key, val in specs.items()
+                                   if key not in TestbenchSpecs._fields}))
+        return tb
+
+    def compile_design(self, name, specs):
+        kwargs = {key: self.get(specs, key, name, str)
+                  for key in ('impl_lib', 'sch_lib', 'sch_cell', 'gen_cell', 'layout_package',
+                              'layout_class')}
+        data_dir = self.get(specs, 'data_dir', name, str)
+        kwargs['data_dir'] = None if data_dir is None else self.resolve(data_dir)
+        kwargs['layout_params'] = self.freeze(self.get(specs, 'layout_params', name, Mapping, default={}))
+
+        testbenches = self.get(specs, 'testbenches', name, Mapping, default={})
+        tb_path = '%s.testbenches' % name
+        tb_dict = {}
+        for tb_name, tb_specs in testbenches.items():
+            cur_path = '%s.%s' % (tb_path, tb_name)
+            if isinstance(tb_specs, Mapping):
+                tb_dict[tb_name] = self.compile_testbench(tb_name, tb_specs, cur_path)
+            else:
+                self.errors.append('%s: expected mapping, got %r' % (cur_path, tb_specs))
+        kwargs['testbenches'] = FrozenDict(tb_dict)
+
+        dsn = DesignSpecs.__new__(DesignSpecs)
+        dsn._set(name=name, extra=self.freeze({key: val for key, val in specs.items()
+                                                if key not in DesignSpecs._fields}),
+                 **kwargs)
+        return dsn
+
+    def compile_top(self, specs, raw_specs):
+        sim_envs = self.get(specs, 'sim_envs', 'top', (list, tuple), default=())
+        if not all(isinstance(env, str) for env in sim_envs):
+            self.errors.append('top.sim_envs: expected list of str, got %r' % (sim_envs,))
+        routing_grid = self.get(specs, 'routing_grid', 'top', Mapping, default={})
+        if routing_grid:
+            lens = set()
+            for key in ('layers', 'spaces', 'widths'):
+                val = self.get(routing_grid, key, 'routing_grid', (list, tuple), default=())
+                lens.add(len(val))
+            if len(lens) > 1:
+                self.errors.append('routing_grid: layers, spaces and widths have different lengths')
+            if self.get(routing_grid, 'bot_dir', 'routing_grid', str) not in ('x', 'y', None):
+                self.errors.append('routing_grid.bot_dir: must be x or y')
+
+        designs = {}
+        extra = {}
+        for key, val in specs.items():
+            if key in TopSpecs._fields:
+                continue
+            if isinstance(val, Mapping) and 'sweep' in val:
+                # a sweep entry is a set of designs, not a design.  Keep it as written,
+                # for xbase_demo.sweep.expand_all_sweeps().
+                extra[key] = raw_specs[key]
+            elif isinstance(val, Mapping):
+                designs[key] = self.compile_design(key, val)
+            else:
+                extra[key] = val
+
+        top = TopSpecs.__new__(TopSpecs)
+        top._set(sim_envs=self.freeze(sim_envs), view_name=self.get(specs, 'view_name', 'top', str),
+                 routing_grid=self.freeze(routing_grid), designs=FrozenDict(designs),
+                 extra=self.freeze(extra))
+        return top
+
+
+def _type_names(types):
+    if isinstance(types, tuple):
+        return ' or '.join(t.__name__ for t in types)
+    return types.__name__
+
+
+def merge_specs(base, override):
+    """Returns a copy of base with override merged in recursively.
+
+    Mappings are merged key by key; any other override value replaces the base value.
+    """
+    ans = thaw(base)
+    for key, val in override.items():
+        if isinstance(val, Mapping) and isinstance(ans.get(key, None), dict):
+            ans[key] = merge_specs(ans[key], val)
+        else:
+            ans[key] = thaw(val)
+    return ans
+
+
+def resolve_bases(specs):
+    """Returns a copy of specs where designs with a base entry inherit from the named design.
+
+    A design entry with base: <name> is the named design entry with the remaining
+    entries merged in by :func:`merge_specs`.  Bases may be chained.
+    """
+    ans = dict(specs)
+    resolved = {}
+
+    def resolve(name, visiting):
+        if name in resolved:
+            return resolved[name]
+        if name in visiting:
+            raise ValueError('Circular base reference: %s' % ' -> '.join(visiting + [name]))
+        entry = specs.get(name, None)
+        if not isinstance(entry, Mapping):
+            raise ValueError('Base design %s not found.' % name)
+        base_name = entry.get('base', None)
+        if base_name is None:
+            val = entry
+        else:
+            override = {key: item for key, item in entry.items() if key != 'base'}
+            val = merge_specs(resolve(base_name, visiting + [name]), override)
+        resolved[name] = val
+        return val
+
+    for key, entry in specs.items():
+        if isinstance(entry, Mapping) and 'base' in entry:
+            ans[key] = resolve(key, [])
+    return ans
+
+
+def compile_specs(specs, root_dir=None):
+    """Validate and compile raw specifications.
+
+    Every top level mapping other than routing_grid is compiled as a design.  Designs
+    may inherit from other designs, see :func:`resolve_bases`.  Entries with a sweep
+    entry are not designs; they are kept unchanged as extra top level entries, and
+    :func:`xbase_demo.sweep.expand_all_sweeps` turns them into designs.
+
+    Parameters
+    ----------
+    specs : dict[str, any]
+        the raw specifications.
+    root_dir : str or None
+        directory relative paths are resolved against.  Defaults to the current directory.
+
+    Returns
+    -------
+    top_specs : TopSpecs
+        the compiled specifications.
+    """
+    compiler = _Compiler(os.path.abspath(root_dir or os.getcwd()))
+    top = compiler.compile_top(resolve_bases(specs), specs)
+    if compiler.errors:
+        raise ValueError('Invalid specifications:\n  %s' % '\n  '.join(compiler.errors))
+    return top
+
+
+def load_specs(fname, root_dir=None):
+    """Load and compile a specification file.
+
+    Parameters
+    ----------
+    fname : str
+        the specification file name.
+    root_dir : str or None
+        directory relative paths are resolved against.  Defaults to the current directory,
+        the same as the flow functions use for raw specifications.
+
+    Returns
+    -------
+    top_specs : TopSpecs
+        the compiled specifications.
+    """
+    with open(fname, 'r') as f:
+        specs = yaml.load(f, Loader=_yaml_loader)
+    return compile_specs(specs, root_dir=root_dir)
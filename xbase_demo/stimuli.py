@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""Vectorized PWL stimulus generation.
+
+Waveforms are built as NumPy time/value arrays and written to PWL files with
+bulk string formatting, so stimuli with millions of points can be generated
+quickly.
+"""
+
+import os
+import hashlib
+
+import numpy as np
+
+# PRBS order -> tap of the generator polynomial x^order + x^tap + 1
+prbs_taps = {7: 6, 9: 5, 11: 9, 15: 14, 20: 17, 23: 18, 31: 28}
+
+
+def pulse(v0, v1, td, tr, tpulse, tf=None, period=None, num=1):
+    """Returns a pulse train waveform.
+
+    Parameters
+    ----------
+    v0 : float
+        the initial value.
+    v1 : float
+        the pulse value.
+    td : float
+        the delay before the first pulse.
+    tr : float
+        the rise time.
+    tpulse : float
+        the pulse width, not including rise/fall time.
+    tf : float or None
+        the fall time.  Defaults to the rise time.
+    period : float or None
+        the pulse period.  Required if num > 1.
+    num : int
+        number of pulses.
+
+    Returns
+    -------
+    tvec : np.ndarray
+        the time vector.
+    yvec : np.ndarray
+        the value vector.
+    """
+    if tf is None:
+        tf = tr
+    if num > 1:
+        if period is None or period < tr + tpulse + tf:
+            raise ValueError('period must be at least tr + tpulse + tf for pulse trains.')
+    else:
+        period = 0
+
+    edges = np.array([0, tr, tr + tpulse, tr + tpulse + tf])
+    tvec = (td + period * np.arange(num).reshape(num, 1) + edges).ravel()
+    yvec = np.tile(np.array([v0, v1, v1, v0], dtype=float), num)
+    if td > 0:
+        tvec = np.concatenate(([0.0], tvec))
+        yvec = np.concatenate(([v0], yvec))
+    return tvec, yvec
+
+
+def prbs_bits(order, num_bits, seed=None):
+    """Returns a pseudo-random binary sequence.
+
+    Parameters
+    ----------
+    order : int
+        the PRBS order.  Must be a key of :data:`prbs_taps`.
+    num_bits : int
+        number of bits to generate.
+    seed : int or None
+        the nonzero initial LFSR state.  Defaults to all ones.
+
+    Returns
+    -------
+    bits : np.ndarray
+        the bits, as a uint8 array.
+    """
+    if order not in prbs_taps:
+        raise ValueError('Unsupported PRBS order %d.  Supported orders: %s' % (order, sorted(prbs_taps)))
+    tap = prbs_taps[order]
+    if seed is None:
+        seed = (1 << order) - 1
+    seed &= (1 << order) - 1
+    if seed == 0:
+        raise ValueError('PRBS seed must be nonzero.')
+
+    bits = np.empty(num_bits + order, dtype=np.uint8)
+    bits[:order] = [(seed >> idx) & 1 for idx in range(order)]
+    # b[k] = b[k - order] ^ b[k - tap], so up to tap bits can be computed at once.
+    for start in range(order, num_bits + order, tap):
+        stop = min(start + tap, num_bits + order)
+        np.bitwise_xor(bits[start - order:stop - order], bits[start - tap:stop - tap],
+                       out=bits[start:stop])
+    return bits[order:]
+
+
+def bits_to_pwl(bits, tbit, tr, v0, v1, td=0.0):
+    """Converts a bit sequence to a PWL waveform.
+
+    Only bit transitions generate points, so long runs of identical bits are cheap.
+
+    Parameters
+    ----------
+    bits : np.ndarray
+        the bit sequence.
+    tbit : float
+        the bit period.
+    tr : float
+        the transition time.
+    v0 : float
+        the value of 0 bits.
+    v1 : float
+        the value of 1 bits.
+    td : float
+        the delay before the first bit.
+
+    Returns
+    -------
+    tvec : np.ndarray
+        the time vector.
+    yvec : np.ndarray
+        the value vector.
+    """
+    bits = np.asarray(bits, dtype=bool)
+    num_bits = bits.size
+    if num_bits == 0:
+        raise ValueError('empty bit sequence.')
+    if tr > tbit:
+        raise ValueError('transition time must not exceed bit period.')
+
+    vals = np.where(bits, v1, v0)
+    trans_idx = np.flatnonzero(bits[1:] != bits[:-1]) + 1
+    num_trans = trans_idx.size
+
+    tvec = np.empty(2 * num_trans + 2)
+    yvec = np.empty(2 * num_trans + 2)
+    tvec[0] = 0.0
+    yvec[0] = vals[0]
+    t_trans = td + trans_idx * tbit
+    tvec[1:-1:2] = t_trans
+    tvec[2:-1:2] = t_trans + tr
+    yvec[1:-1:2] = vals[trans_idx - 1]
+    yvec[2:-1:2] = vals[trans_idx]
+    tvec[-1] = td + num_bits * tbit
+    yvec[-1] = vals[-1]
+    if tvec[1] == 0:
+        # first transition at time 0, drop duplicate point
+        tvec = tvec[1:]
+        yvec = yvec[1:]
+    return tvec, yvec
+
+
+def sampled(tvec, yvec):
+    """Returns a sampled waveform as float arrays, checking that time is non-decreasing."""
+    tvec = np.asarray(tvec, dtype=float).ravel()
+    yvec = np.asarray(yvec, dtype=float).ravel()
+    if tvec.shape != yvec.shape:
+        raise ValueError('time and value vectors have different lengths.')
+    if np.any(tvec[1:] < tvec[:-1]):
+        raise ValueError('time vector must be non-decreasing.')
+    return tvec, yvec
+
+
+def format_pwl(tvec, yvec, precision=10, chunk_size=65536):
+    """Iterate over PWL file text in chunks.
+
+    Parameters
+    ----------
+    tvec : np.ndarray
+        the time vector.
+    yvec : np.ndarray
+        the value vector.
+    precision : int
+        number of significant digits.
+    chunk_size : int
+        number of points formatted at once.
+
+    Yields
+    ------
+    text : str
+        PWL file text of up to chunk_size points.
+    """
+    tvec, yvec = sampled(tvec, yvec)
+    data = np.empty((tvec.size, 2))
+    data[:, 0] = tvec
+    data[:, 1] = yvec
+    row_fmt = '%%.%dg %%.%dg\n' % (precision, precision)
+    for start in range(0, data.shape[0], chunk_size):
+        block = data[start:start + chunk_size]
+        yield (row_fmt * block.shape[0]) % tuple(block.ravel().tolist())
+
+
+def write_pwl(fname, tvec, yvec, precision=10, chunk_size=65536):
+    """Write a PWL waveform file.
+
+    Parameters
+    ----------
+    fname : str
+        the output file name.  Parent directories are created if needed.
+    tvec : np.ndarray
+        the time vector.
+    yvec : np.ndarray
+        the value vector.
+    precision : int
+        number of significant digits.  10 digits resolve 1 ps edges up to 10 ms.
+    chunk_size : int
+        number of points formatted at once.
+    """
+    dir_name = os.path.dirname(os.path.abspath(fname))
+    os.makedirs(dir_name, exist_ok=True)
+
+    with open(fname, 'w') as f:
+        for text in format_pwl(tvec, yvec, precision=precision, chunk_size=chunk_size):
+            f.write(text)
+
+
+class StimulusStore(object):
+    """A directory of PWL files named by the hash of their waveform data.
+
+    Each waveform is written once; storing an identical waveform again just returns
+    the existing file, so stimuli can be shared between testbenches and designs.
+
+    Parameters
+    ----------
+    root_dir : str
+        the store directory.
+    precision : int
+        default number of significant digits written to PWL files.
+    """
+
+    def __init__(self, root_dir, precision=10):
+        self.root_dir = os.path.abspath(root_dir)
+        self.precision = precision
+
+    def get_fname(self, tvec, yvec, precision=None):
+        """Returns the file name of the given waveform in this store.
+
+        The precision is part of the key, so one waveform written with different
+        precisions is stored in different files.  Defaults to the store precision.
+        """
+        if precision is None:
+            precision = self.precision
+        tvec, yvec = sampled(tvec, yvec)
+        h = hashlib.sha1()
+        h.update(('pwl:%d:%d:' % (precision, tvec.size)).encode('utf-8'))
+        h.update(tvec.tobytes())
+        h.update(yvec.tobytes())
+        return os.path.join(self.root_dir, '%s.pwl' % h.hexdigest())
+
+    def put(self, tvec, yvec, precision=None):
+        """Store the given waveform if it is not in the store yet, and return its file name.
+
+        precision defaults to the store precision.
+        """
+        if precision is None:
+            precision = self.precision
+        fname = self.get_fname(tvec, yvec, precision=precision)
+        if not os.path.isfile(fname):
+            # write to a temporary file first, so other processes never see partial files
+            tmp_fname = '%s.%d.tmp' % (fname, os.getpid())
+            write_pwl(tmp_fname, tvec, yvec, precision=precision)
+            os.replace(tmp_fname, fname)
+        return fname
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""Parameter sweeps of design specifications.
+
+A design entry with a sweep entry describes a set of design points::
+
+    amp_cs_sweep:
+      base: amp_cs
+      sweep:
+        method: product          # or lhs
+        num_samples: 16          # lhs only
+        seed: 0                  # lhs only
+        params:
+          layout_params.fg_dict.amp: [8, 12, 16]
+          testbenches.tb_dc.tb_params.vbias: {start: 0.15, stop: 0.25, num: 5}
+
+Each parameter is a dotted path into the design entry.  Values are a list,
+or {start, stop, num} for evenly spaced values.  Latin hypercube samples
+draw from lists, or uniformly from {min, max} ranges.
+
+:func:`expand_sweep` turns a sweep entry into ordinary design entries while
+removing duplicate work.  Design points with the same layout and schematic
+parameters share one generated cell, so each layout is built once.  Each
+generated cell has its own implementation library, since the layouts of
+different points name their sub-cells independently.  Design
+points that only differ in testbench parameters share one testbench, and
+if those parameters form a full grid they become simulator sweeps via the
+tb_sweeps testbench entry instead of separate simulations.  The expanded
+designs run on :func:`xbase_demo.runner.run_designs`.
+"""
+
+import json
+from itertools import product
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import numpy as np
+
+from .specs import thaw, resolve_bases
+from .runner import run_designs
+
+
+def _get_values(path, spec):
+    if isinstance(spec, Mapping):
+        try:
+            return np.linspace(spec['start'], spec['stop'], spec['num']).tolist()
+        except KeyError:
+            raise ValueError('sweep parameter %s: expected list or {start, stop, num}' % path)
+    if isinstance(spec, (list, tuple)) and spec:
+        return list(spec)
+    raise ValueError('sweep parameter %s: expected non-empty list or {start, stop, num}' % path)
+
+
+def _lhs_points(params, num_samples, seed):
+    rng = np.random.RandomState(seed)
+    columns = []
+    for path, spec in params.items():
+        # one sample in each of num_samples equal strata, in random order
+        u = (rng.permutation(num_samples) + rng.random_sample(num_samples)) / num_samples
+        if isinstance(spec, Mapping) and 'min' in spec and 'max' in spec:
+            columns.append((spec['min'] + u * (spec['max'] - spec['min'])).tolist())
+        else:
+            values = _get_values(path, spec)
+            columns.append([values[idx] for idx in (u * len(values)).astype(int)])
+    return [dict(zip(params.keys(), vals)) for vals in zip(*columns)]
+
+
+def get_sweep_points(sweep_specs):
+    """Returns the design points of a sweep entry.
+
+    Parameters
+    ----------
+    sweep_specs : dict[str, any]
+        the sweep entry.
+
+    Returns
+    -------
+    point_list : list[dict[str, any]]
+        the design points, as dictionaries from parameter path to value.
+    """
+    method = sweep_specs.get('method', 'product')
+    params = sweep_specs['params']
+    if method == 'product':
+        value_lists = [_get_values(path, spec) for path, spec in params.items()]
+        return [dict(zip(params.keys(), vals)) for vals in product(*value_lists)]
+    if method == 'lhs':
+        return _lhs_points(params, sweep_specs['num_samples'], sweep_specs.get('seed', None))
+    raise ValueError('Unknown sweep method: %s' % method)
+
+
+def _set_path(table, path, val):
+    keys = path.split('.')
+    for key in keys[:-1]:
+        table = table.setdefault(key, {})
+    table[keys[-1]] = val
+
+
+def _split_point(point):
+    """Split a design point into design, testbench schematic, and testbench parameter values."""
+    dsn_vals = {}
+    tb_sch_vals = {}
+    tb_param_vals = {}
+    for path, val in point.items():
+        keys = path.split('.')
+        if keys[0] == 'testbenches' and len(keys) > 2:
+            tb_name = keys[1]
+            if keys[2] == 'tb_params' and len(keys) == 4:
+                tb_param_vals.setdefault(tb_name, {})[keys[3]] = val
+            else:
+                tb_sch_vals.setdefault(tb_name, {})['.'.join(keys[2:])] = val
+        else:
+            dsn_vals[path] = val
+    return dsn_vals, tb_sch_vals, tb_param_vals
+
+
+def _key(vals):
+    return json.dumps(vals, sort_keys=True)
+
+
+def _get_grid(variants):
+    """Returns {name: values} if the given parameter assignments form a full grid, else None."""
+    names = sorted(variants[0].keys())
+    if not names or any(sorted(var.keys()) != names for var in variants):
+        return None
+    axes = {name: sorted(set(var[name] for var in variants)) for name in names}
+    num_grid = int(np.prod([len(vals) for vals in axes.values()]))
+    if num_grid != len(set(_key(var) for var in variants)):
+        return None
+    return axes
+
+
+def expand_sweep(specs, dsn_name):
+    """Expand a sweep design entry into deduplicated design entries.
+
+    Parameters
+    ----------
+    specs : dict[str, any]
+        the top level specifications.
+    dsn_name : str
+        name of the design entry with a sweep entry.
+
+    Returns
+    -------
+    dsn_dict : dict[str, dict[str, any]]
+        the expanded design entries.  One entry per distinct layout and schematic, named
+        <dsn_name>_<index>, with generated cell <gen_cell>_<index> in the implementation
+        library <impl_lib>_<index>.
+    point_list : list[dict[str, any]]
+        the design points.  Each has entries 'params', the swept values, 'design', the
+        expanded design entry name, and 'testbenches', a dictionary from original to
+        expanded testbench name.
+    """
+    base = thaw(resolve_bases(specs)[dsn_name])
+    sweep_specs = base.pop('sweep')
+    impl_lib = base['impl_lib']
+    gen_cell = base['gen_cell']
+
+    # group design points by layout and schematic parameters
+    dsn_groups = OrderedDict()
+    for point in get_sweep_points(sweep_specs):
+        dsn_vals, tb_sch_vals, tb_param_vals = _split_point(point)
+        dsn_groups.setdefault(_key(dsn_vals), (dsn_vals, []))[1].append((point, tb_sch_vals, tb_param_vals))
+
+    dsn_dict = OrderedDict()
+    point_list = []
+    for dsn_idx, (dsn_vals, members) in enumerate(dsn_groups.values()):
+        cur_name = '%s_%d' % (dsn_name, dsn_idx)
+        cur_specs = thaw(base)
+        for path, val in dsn_vals.items():
+            _set_path(cur_specs, path, val)
+        # every point is built in its own TemplateDB, which names sub-masters on its own,
+        # so each point needs its own library for sub-cells of different points not to clash.
+        cur_specs['impl_lib'] = '%s_%d' % (impl_lib, dsn_idx)
+        cur_specs['gen_cell'] = '%s_%d' % (gen_cell, dsn_idx)
+
+        testbenches = OrderedDict()
+        # (original testbench name, point index) -> expanded testbench name
+        tb_map = {}
+        for tb_name, tb_specs in base['testbenches'].items():
+            # group by testbench schematic parameters, then by testbench parameters
+            sch_groups = OrderedDict()
+            for pt_idx, (_, tb_sch_vals, tb_param_vals) in enumerate(members):
+                sch_vals = tb_sch_vals.get(tb_name, {})
+                group = sch_groups.setdefault(_key(sch_vals), (sch_vals, []))
+                group[1].append((pt_idx, tb_param_vals.get(tb_name, {})))
+
+            # list of (schematic values, parameter values, point indices, simulator sweeps)
+            tb_variants = []
+            for sch_vals, tb_members in sch_groups.values():
+                param_list = [param_vals for _, param_vals in tb_members]
+                grid = _get_grid(param_list) if len(tb_members) > 1 else None
+                if grid is not None:
+                    # one testbench, with the parameter grid as simulator sweeps
+                    tb_variants.append((sch_vals, {}, [pt_idx for pt_idx, _ in tb_members], grid))
+                else:
+                    param_groups = OrderedDict()
+                    for pt_idx, param_vals in tb_members:
+                        param_groups.setdefault(_key(param_vals), (param_vals, []))[1].append(pt_idx)
+                    tb_variants.extend((sch_vals, param_vals, pt_indices, None)
+                                       for param_vals, pt_indices in param_groups.values())
+
+            for var_idx, (sch_vals, param_vals, pt_indices, tb_sweeps) in enumerate(tb_variants):
+                cur_tb_name = tb_name if len(tb_variants) == 1 else '%s_%d' % (tb_name, var_idx)
+                cur_tb = thaw(tb_specs)
+                for path, val in sch_vals.items():
+                    _set_path(cur_tb, path, val)
+                cur_tb['tb_params'].update(param_vals)
+                if tb_sweeps is not None:
+                    for name in tb_sweeps:
+                        cur_tb['tb_params'].pop(name, None)
+                    cur_tb['tb_sweeps'] = tb_sweeps
+                testbenches[cur_tb_name] = cur_tb
+                for pt_idx in pt_indices:
+                    tb_map[(tb_name, pt_idx)] = cur_tb_name
+
+        cur_specs['testbenches'] = testbenches
+        dsn_dict[cur_name] = cur_specs
+        for pt_idx, (point, _, _) in enumerate(members):
+            point_list.append(dict(params=point, design=cur_name,
+                                   testbenches={tb_name: tb_map[(tb_name, pt_idx)]
+                                                for tb_name in base['testbenches']}))
+
+    return dsn_dict, point_list
+
+
+def expand_all_sweeps(specs):
+    """Returns a copy of specs with every sweep entry replaced by its expanded design entries.
+
+    Parameters
+    ----------
+    specs : dict[str, any]
+        the top level specifications.
+
+    Returns
+    -------
+    new_specs : dict[str, any]
+        the expanded specifications.
+    sweep_points : dict[str, list[dict[str, any]]]
+        the design points of each sweep entry, as returned by :func:`expand_sweep`.
+    """
+    specs = resolve_bases(thaw(specs))
+    new_specs = OrderedDict()
+    sweep_points = {}
+    for key, val in specs.items():
+        if isinstance(val, Mapping) and 'sweep' in val:
+            dsn_dict, point_list = expand_sweep(specs, key)
+            new_specs.update(dsn_dict)
+            sweep_points[key] = point_list
+        else:
+            new_specs[key] = val
+    return new_specs, sweep_points
+
+
+def run_sweep(specs, dsn_name, **kwargs):
+    """Run all design points of a sweep entry concurrently.
+
+    Parameters
+    ----------
+    specs : dict[str, any]
+        the top level specifications.
+    dsn_name : str
+        name of the design entry with a sweep entry.
+    **kwargs :
+        additional arguments for :func:`xbase_demo.runner.run_designs`.
+
+    Returns
+    -------
+    report : dict[str, any]
+        the report of :func:`xbase_demo.runner.run_designs`, with the design points
+        added under 'points'.
+    """
+    specs = resolve_bases(thaw(specs))
+    dsn_dict, point_list = expand_sweep(specs, dsn_name)
+    new_specs = OrderedDict((key, val) for key, val in specs.items() if key != dsn_name)
+    new_specs.update(dsn_dict)
+    print('%s: %d design points, %d layouts, %d testbenches' %
+          (dsn_name, len(point_list), len(dsn_dict),
+           sum(len(val['testbenches']) for val in dsn_dict.values())))
+    report = run_designs(new_specs, dsn_names=list(dsn_dict.keys()), **kwargs)
+    report['points'] = point_list
+    return report